@@ -1,4 +1,4 @@
 @echo on
 call conda activate kpi_app
-@python "C:\Projects\kpi_app\src\preprocess.py"
+@python "C:\Projects\kpi_app\src\preprocess.py" --incremental
 @pause
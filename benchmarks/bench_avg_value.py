@@ -0,0 +1,70 @@
+"""Compare the calculation of the `value_avg` column: the old groupby
+apply (a python function per product-date) and the vectorized look-up
+of the active accounts in `preprocess.add_avg_value_column`.
+
+    python benchmarks/bench_avg_value.py --n-products 50 500
+"""
+
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from bench_max_date import prepare_product_rows
+from bench_utils import print_table, silence_app_logging, time_it
+import preprocess  # noqa: E402 (path is set up in bench_utils)
+
+
+def add_avg_with_apply(df):
+    """The implementation before the vectorized version, for comparison."""
+    df_grouped = df.groupby(["calculation_date", "product_name"], sort=False)
+    return df_grouped.apply(_calc_avg_value)
+
+
+def _calc_avg_value(df_chunk):
+    try:
+        n_active = float(
+            df_chunk[df_chunk["kpi_name"] == "Anzahl aktive Konten Total"][
+                "value"
+            ].values[0]
+        )
+        df_chunk["value_avg"] = (
+            pd.to_numeric(df_chunk["value"], errors="raise", downcast="float") + 0.001
+        ) / n_active
+    except IndexError:
+        df_chunk["value_avg"] = np.nan
+    return df_chunk
+
+
+def main(n_products_list: list, repeat: int):
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    rows = []
+    for n_products in n_products_list:
+        df = prepare_product_rows(n_products)
+        df = preprocess.expand_dataframe_fully(df, preprocess.create_max_date_dict(df))
+        df = preprocess.concatenate_all_levels(df, *preprocess.create_level_rows(df))
+        results = {}
+        for name, func in [
+            ("groupby apply", add_avg_with_apply),
+            ("vectorized", preprocess.add_avg_value_column),
+        ]:
+            seconds, results[name] = time_it(func, df, repeat=repeat)
+            rows.append([n_products, len(df), name, seconds])
+        # (The old version calculated with float32)
+        np.testing.assert_allclose(
+            results["vectorized"]["value_avg"],
+            results["groupby apply"]["value_avg"],
+            rtol=1e-6,
+        )
+    print_table(["products", "rows", "value_avg", "time (s)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, nargs="+", default=[50, 500])
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,83 @@
+"""Compare the compute backends (see `backends.py`) on the queries of an
+app rerun: the reference pandas chain, the KPI cube and DuckDB (with
+different numbers of threads). The mock dataset is written to parquet
+in a temporary directory, the time to set up the backend is reported
+separately from the time per query.
+
+    python benchmarks/bench_backends.py --n-products 400
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from bench_utils import print_table, silence_app_logging, time_it
+import backends  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import query  # noqa: E402
+
+ACTUAL_DATE = "2020-12-31"
+
+
+def rerun(backend: backends.PandasBackend, result_dim: str):
+    # (Without the stage and view caches of the backend)
+    backend.stage_cache.clear()
+    return backend._run_query(
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim(result_dim)
+        .diff(12)
+        .filter_mandant("Bonus Card")
+        .filter_kpi_group("Umsatz")
+    )
+
+
+def main(n_products: int, repeat: int, threads: list):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "preprocessed_results.parquet")
+        df.to_parquet(path, index=False)
+        # (The materialized columns are dropped for the `computed` runs)
+        path_computed = str(Path(tmp_dir) / "computed" / "preprocessed_results.parquet")
+        Path(path_computed).parent.mkdir()
+        df.loc[:, :"value_avg"].to_parquet(path_computed, index=False)
+
+        setups = [("pandas", backends.PandasBackend, {})]
+        setups.append(("cube", backends.CubeBackend, {}))
+        for n_threads in threads:
+            setups.append(
+                (
+                    f"duckdb ({n_threads} threads)",
+                    backends.DuckDBBackend,
+                    {"threads": n_threads},
+                )
+            )
+
+        rows = []
+        for values, data_path in [("computed", path_computed), ("materialized", path)]:
+            for name, backend_cls, kwargs in setups:
+                start = time.perf_counter()
+                backend = backend_cls(data_path, **kwargs)
+                rerun(backend, "Monat")  # warm-up, loads the cached data
+                setup = time.perf_counter() - start
+                for result_dim in ["Monat", "12 Monate rollierend"]:
+                    seconds, _ = time_it(rerun, backend, result_dim, repeat=repeat)
+                    rows.append([values, name, result_dim, setup, seconds * 1000])
+    print_table(["values", "backend", "result dim", "setup (s)", "time (ms)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--repeat", type=int, default=10)
+arg_parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat, args.threads)
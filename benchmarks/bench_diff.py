@@ -0,0 +1,68 @@
+"""Compare the %-difference calculation: the legacy pandas version (frame
+copy, datetime index, groupby pct_change and a per-element cap), called
+once per lag, with the vectorized engine that shifts a (series x month)
+array and computes all lags in one call.
+
+    python benchmarks/bench_diff.py --n-products 50 500 5000
+"""
+
+import argparse
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import print_table, silence_app_logging, time_it
+import data_dicts  # noqa: E402 (path is set up in bench_utils)
+import helpers  # noqa: E402
+
+LAGS = {"diff_mom": 1, "diff_value": 12, "diff_2y": 24}
+
+
+def diff_legacy(df: pd.DataFrame, n_months_diff: int) -> pd.DataFrame:
+    df_diff = df.copy()
+    df_diff["temp_index"] = pd.to_datetime(
+        df_diff["calculation_date"], format="%Y-%m-%d"
+    )
+    df_diff.set_index("temp_index", inplace=True)
+    df_diff["diff_value"] = df_diff.groupby(
+        ["kpi_name", "period_id", "level", "product_name", "mandant", "cardprofile"],
+        observed=True,
+    )["value"].pct_change(n_months_diff, fill_method=None)
+    df_diff.reset_index(drop=True, inplace=True)
+    df_diff["diff_value"] = df_diff["diff_value"].apply(
+        lambda x: np.nan if not abs(x) < 100 else x
+    )
+    return df_diff
+
+
+def diff_legacy_all_lags(df: pd.DataFrame) -> List[pd.DataFrame]:
+    return [diff_legacy(df, lag) for lag in LAGS.values()]
+
+
+def main(n_products_list, repeat: int):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    rows = []
+    for n_products in n_products_list:
+        df = create_preprocessed_data(n_products=n_products)
+        df = df.astype(data_dicts.DATASET_SCHEMA).loc[:, :"value"]
+        for name, func, args in [
+            ("pandas, 12 months (legacy)", diff_legacy, (df, 12)),
+            ("vectorized, 12 months", helpers.calculate_diff_column, (df, 12)),
+            ("pandas, 1/12/24 months (legacy)", diff_legacy_all_lags, (df,)),
+            ("vectorized, 1/12/24 months", helpers.calculate_diff_column, (df, LAGS)),
+        ]:
+            seconds, _ = time_it(func, *args, repeat=repeat)
+            rows.append([n_products, f"{len(df):,.0f}", name, seconds * 1000])
+    print_table(["products", "rows", "engine", "time (ms)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, nargs="+", default=[50, 500, 5000])
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,103 @@
+"""Compare the full expansion of the product level data: the old cross
+join with two merges and the grid of integer positions in
+`preprocess.expand_dataframe_fully`. Each run is done in a fresh process
+and reports the wall-clock time and the peak resident memory (sampled)
+above the memory before the expansion, for the given number of products
+and 10 times as many.
+
+    python benchmarks/bench_expand.py --n-products 200
+"""
+
+import argparse
+import multiprocessing
+import time
+import warnings
+
+import pandas as pd
+import psutil
+
+from bench_utils import PeakRSS, print_table, silence_app_logging
+
+KEY_COLS = [
+    "calculation_date",
+    "kpi_id",
+    "kpi_name",
+    "period_id",
+    "product_name",
+    "cardprofile",
+    "mandant",
+    "sector",
+    "level",
+]
+
+
+def expand_with_merges(df: pd.DataFrame) -> pd.DataFrame:
+    """The implementation before the grid positions, for comparison."""
+    months = pd.DataFrame(
+        {"calculation_date": sorted(df["calculation_date"].unique()), "merge_col": 0}
+    )
+    rest = df.drop(["calculation_date", "value"], axis=1).drop_duplicates()
+    rest["merge_col"] = 0
+    temp_tbl = months.merge(rest, how="outer", on="merge_col")
+    temp_tbl = temp_tbl.drop(columns={"merge_col"})
+    temp_tbl = temp_tbl.sort_values(["kpi_id", "calculation_date"])
+    return temp_tbl.merge(df, how="left", on=KEY_COLS).reset_index(drop=True)
+
+
+def _expand_worker(queue, n_products: int, engine: str):
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    from bench_max_date import prepare_product_rows
+    import preprocess
+
+    df = prepare_product_rows(n_products)
+    func = (
+        expand_with_merges if engine == "merges" else preprocess.expand_dataframe_fully
+    )
+    rss_before = psutil.Process().memory_info().rss
+    start = time.perf_counter()
+    with PeakRSS() as peak_rss:
+        df_expanded = func(df)
+    elapsed = time.perf_counter() - start
+    queue.put((len(df_expanded), elapsed, (peak_rss.peak - rss_before) / 2**20))
+
+
+def run_expand(n_products: int, engine: str):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_expand_worker, args=(queue, n_products, engine))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main(n_products: int):
+    from bench_max_date import prepare_product_rows
+    import preprocess
+
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    df = prepare_product_rows(n_products)
+    expected = expand_with_merges(df).sort_values(KEY_COLS, ignore_index=True)
+    result = preprocess.expand_dataframe_fully(df).sort_values(
+        KEY_COLS, ignore_index=True
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+    rows = []
+    for n in [n_products, 10 * n_products]:
+        for engine in ["merges", "grid positions"]:
+            n_rows, elapsed, peak_mb = run_expand(n, engine)
+            rows.append([n, n_rows, engine, elapsed, peak_mb])
+    print_table(
+        ["products", "rows out", "expansion", "time (s)", "peak RSS (MB)"], rows
+    )
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=200)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products)
@@ -0,0 +1,73 @@
+"""Compare the extraction in `preprocess.create_df`: `fetchall` into a
+frame of row objects vs. streaming the rows in chunks of different sizes
+(converted to typed column arrays per chunk). The source is a local SQLite
+database filled with a mock raw extract. Each run is done in a fresh process
+and reports the wall-clock time, the throughput and the peak resident
+memory (sampled) above the memory before the extraction.
+
+    python benchmarks/bench_extract.py --n-products 400
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import psutil
+
+from bench_utils import PeakRSS, print_table, silence_app_logging
+
+
+def _extract_worker(queue, db_path, query, chunk_size):
+    from sqlalchemy import create_engine
+
+    silence_app_logging()
+    import preprocess
+
+    connection = create_engine(f"sqlite:///{db_path}").connect()
+    rss_before = psutil.Process().memory_info().rss
+    start = time.perf_counter()
+    with PeakRSS() as peak_rss:
+        df = preprocess.create_df(query, connection, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, len(df), (peak_rss.peak - rss_before) / 2**20))
+
+
+def run_extract(db_path: str, query: str, chunk_size):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_extract_worker, args=(queue, db_path, query, chunk_size))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main(n_products: int, chunk_sizes: list):
+    from tests.data.mock_dataset import create_raw_extract, create_sqlite_source
+
+    raw_extract = create_raw_extract(n_products=n_products)
+    print(f"Rows in mock extract: {len(raw_extract):,.0f}\n")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "kf_core.db")
+        query = create_sqlite_source(db_path, raw_extract)
+        del raw_extract
+        for chunk_size in [None] + chunk_sizes:
+            name = "fetchall" if chunk_size is None else f"chunks of {chunk_size:,}"
+            elapsed, n_rows, peak_mb = run_extract(db_path, query, chunk_size)
+            rows.append([name, elapsed, n_rows / elapsed / 1000, peak_mb])
+    print_table(["extraction", "time (s)", "k rows / s", "peak RSS (MB)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument(
+    "--chunk-sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000, 200_000]
+)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.chunk_sizes)
@@ -0,0 +1,67 @@
+"""Compare the sidebar / main page filters of the app with boolean masks
+(`isin` over the columns) and with the pre-built dimension index (see
+`src/dim_index.py`), on the actual period of datasets with 1x, 10x and
+100x the products of the `PRODUCT_LOOK_UP`.
+
+    python benchmarks/bench_filters.py --scales 1 10 100
+"""
+
+import argparse
+from typing import Optional
+
+import pandas as pd
+
+from bench_utils import print_table, silence_app_logging, time_it
+import data_dicts  # noqa: E402 (path is set up in bench_utils)
+import helpers  # noqa: E402
+from dim_index import DimensionIndex  # noqa: E402
+
+
+def run_filters(df: pd.DataFrame, dim_index: Optional[DimensionIndex] = None):
+    """The filter steps of an app rerun with some typical selections."""
+    df = helpers.filter_for_sidebar_selections_mandant(df, "B2C", dim_index)
+    df = helpers.filter_for_sidebar_selections_kpi(df, "[alle] ohne NCA", dim_index)
+    entities = list(df["product_name"].unique()[:3])
+    return helpers.filter_for_entity_and_kpi(
+        df, entities, ["Umsatz Total", "Nr. TRX Total"], dim_index
+    )
+
+
+def main(scales, repeat: int):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    rows = []
+    for scale in scales:
+        df = create_preprocessed_data(
+            n_products=scale * len(data_dicts.PRODUCT_LOOK_UP), n_months=13
+        )
+        df = df.astype(data_dicts.DATASET_SCHEMA).loc[:, :"value_avg"]
+        df = df.loc[df["calculation_date"] == df["calculation_date"].max()]
+        build_seconds, dim_index = time_it(
+            DimensionIndex.from_frame, df, repeat=repeat
+        )
+        mask_seconds, expected = time_it(run_filters, df, repeat=repeat)
+        index_seconds, result = time_it(run_filters, df, dim_index, repeat=repeat)
+        pd.testing.assert_frame_equal(result, expected)
+        rows.append(
+            [
+                f"{scale}x",
+                f"{len(df):,.0f}",
+                mask_seconds * 1000,
+                index_seconds * 1000,
+                build_seconds * 1000,
+            ]
+        )
+    print_table(
+        ["scale", "rows", "masks (ms)", "index (ms)", "index build (ms)"], rows
+    )
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+arg_parser.add_argument("--repeat", type=int, default=10)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.scales, args.repeat)
@@ -0,0 +1,73 @@
+"""Compare a full run of the preprocessing with the incremental update
+that only extracts the new month (plus the restatement window) and only
+calculates these months, spliced into the previous data (see
+`preprocess.update_dataset`). The DB is replaced by a mock extract of 38
+months (the previous data holds the first 37), the extraction itself is
+not timed, only the number of rows that would be extracted is reported.
+The incremental runs have to be faster than the full run.
+
+    python benchmarks/bench_incremental.py --n-products 500
+"""
+
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import print_table, silence_app_logging, time_it
+import data_dicts  # noqa: E402 (path is set up in bench_utils)
+import preprocess  # noqa: E402
+
+
+def run_incremental(df_db, df_rows_previous, df_previous, restatement_months):
+    first_new_date = preprocess.return_first_new_date(df_previous, restatement_months)
+    df_rows_new = df_db.loc[df_db["calculation_date"] >= first_new_date]
+    df_rows = preprocess.update_extracted_rows(df_rows_previous, df_rows_new)
+    return preprocess.build_dataset(df_rows, df_previous, first_new_date)
+
+
+def main(n_products: int, repeat: int):
+    from tests.data.mock_dataset import create_raw_extract, product_look_up
+
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    data_dicts.PRODUCT_LOOK_UP.update(product_look_up(n_products))
+    df_db = preprocess.clean_extracted_rows(
+        create_raw_extract(n_products=n_products, n_months=38, end_date="2021-01-31")
+    )
+    months = np.sort(df_db["calculation_date"].unique())
+    df_rows_previous = df_db.loc[df_db["calculation_date"] <= months[-2]]
+    df_previous = preprocess.build_dataset(df_rows_previous)
+
+    df_rows_full = df_db.loc[df_db["calculation_date"] > months[0]]
+    seconds, expected = time_it(preprocess.build_dataset, df_rows_full, repeat=repeat)
+    rows = [["full run", len(df_rows_full), seconds]]
+    for restatement_months in [0, 1, 3]:
+        seconds, df = time_it(
+            run_incremental,
+            df_db,
+            df_rows_previous,
+            df_previous,
+            restatement_months,
+            repeat=repeat,
+        )
+        pd.testing.assert_frame_equal(
+            df.reset_index(drop=True), expected.reset_index(drop=True), check_exact=True
+        )
+        first_new_date = preprocess.return_first_new_date(
+            df_previous, restatement_months
+        )
+        n_rows = (df_db["calculation_date"] >= first_new_date).sum()
+        rows.append([f"incremental ({restatement_months} restated)", n_rows, seconds])
+    print_table(["run", "rows extracted", "time w/o extraction (s)"], rows)
+    assert all(row[2] < rows[0][2] for row in rows[1:]), "Not faster than a full run."
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=500)
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,92 @@
+"""Compare the aggregation of the mandant, sector and overall levels: the
+old functions that each group the full product level data (with a sum
+check against all products) and `preprocess.create_level_rows`, that sums
+up every level from the one before in one pass.
+
+    python benchmarks/bench_levels.py --n-products 100 1000
+"""
+
+import argparse
+import warnings
+
+import pandas as pd
+
+from bench_max_date import prepare_product_rows
+from bench_utils import print_table, silence_app_logging, time_it
+import preprocess  # noqa: E402 (path is set up in bench_utils)
+
+
+def _create_level_from_products(df, group_by, entity, level):
+    """The implementation before the rollup engine, for comparison."""
+    df_g = df.groupby(preprocess.LEVEL_KEYS + group_by)["value"].sum().reset_index()
+    for col, value in entity.items():
+        df_g[col] = value(df_g) if callable(value) else value
+    df_g["level"] = level
+    df_g = df_g.reindex(df.columns, axis=1)
+    if df_g["value"].sum() != df["value"].sum():
+        raise AssertionError("Ups, something went wrong, please check.")
+    return df_g
+
+
+def create_levels_from_products(df):
+    def total(col):
+        return lambda df_g: df_g[col] + " - Total"
+
+    return [
+        _create_level_from_products(
+            df,
+            ["mandant", "sector"],
+            {"product_name": total("mandant"), "cardprofile": "all"},
+            2,
+        ),
+        _create_level_from_products(
+            df,
+            ["sector"],
+            {
+                "mandant": lambda df_g: df_g["sector"],
+                "product_name": total("sector"),
+                "cardprofile": "all",
+            },
+            1,
+        ),
+        _create_level_from_products(
+            df,
+            [],
+            {
+                "mandant": "BCAG",
+                "sector": "BCAG",
+                "product_name": "BCAG - Total",
+                "cardprofile": "all",
+            },
+            0,
+        ),
+    ]
+
+
+def main(n_products_list: list, repeat: int):
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    rows = []
+    for n_products in n_products_list:
+        df = prepare_product_rows(n_products)
+        df = preprocess.expand_dataframe_fully(df, preprocess.create_max_date_dict(df))
+        # (Integer values, so that the old exact sum check does not fail)
+        df["value"] = df["value"].round()
+        for name, func in [
+            ("from products", create_levels_from_products),
+            ("level by level", preprocess.create_level_rows),
+        ]:
+            seconds, df_levels = time_it(func, df, repeat=repeat)
+            rows.append([n_products, len(df), name, seconds])
+        for df_g, expected in zip(df_levels, create_levels_from_products(df)):
+            pd.testing.assert_frame_equal(df_g, expected)
+    print_table(["products", "product rows", "aggregation", "time (s)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, nargs="+", default=[100, 1000])
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,69 @@
+"""Compare the expansion and aggregation of the levels in python
+(`clean_extracted_rows`, `expand_dataframe_fully` and `create_level_rows`)
+with the GROUPING SETS query (get_level_results_for_kpi_sheet.sql) run on
+a local DuckDB database plus `clean_extracted_level_rows`. The result rows
+of the query are the rows that would be transferred from the DB.
+
+    python benchmarks/bench_levels_in_db.py --n-products 100 1000
+"""
+
+import argparse
+import os
+import warnings
+
+import pandas as pd
+
+from bench_utils import ROOT, print_table, silence_app_logging, time_it
+
+import data_dicts
+import preprocess  # noqa: E402 (path is set up in bench_utils)
+
+LEVEL_QUERY_PATH = os.path.join(
+    ROOT, "sql_statements", "get_level_results_for_kpi_sheet.sql"
+)
+
+
+def levels_in_python(raw_extract: pd.DataFrame) -> pd.DataFrame:
+    df = preprocess.clean_extracted_rows(raw_extract)
+    df = preprocess.expand_dataframe_fully(df, preprocess.create_max_date_dict(df))
+    return preprocess.concatenate_all_levels(df, *preprocess.create_level_rows(df))
+
+
+def main(n_products_list: list, repeat: int):
+    from tests.data.mock_dataset import (
+        create_duckdb_level_source,
+        create_raw_extract,
+        product_look_up,
+    )
+
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    rows = []
+    for n_products in n_products_list:
+        data_dicts.PRODUCT_LOOK_UP.update(product_look_up(n_products))
+        raw_extract = create_raw_extract(n_products=n_products)
+        connection, query = create_duckdb_level_source(raw_extract, LEVEL_QUERY_PATH)
+        t_python, expected = time_it(levels_in_python, raw_extract, repeat=repeat)
+        t_query, df_levels = time_it(
+            lambda: connection.execute(query).df(), repeat=repeat
+        )
+        t_clean, df = time_it(
+            preprocess.clean_extracted_level_rows, df_levels, repeat=repeat
+        )
+        assert len(df) == len(expected)
+        rows.append([n_products, "python", len(raw_extract), 0.0, t_python])
+        rows.append([n_products, "grouping sets", len(df), t_query, t_clean])
+        connection.close()
+    print_table(
+        ["products", "levels", "rows from DB", "DB time (s)", "python time (s)"],
+        rows,
+    )
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, nargs="+", default=[100, 1000])
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,70 @@
+"""Compare load time and resident memory of the preprocessed dataset
+stored as CSV (legacy and typed fallback) and as parquet file.
+
+    python benchmarks/bench_load_formats.py --n-products 400
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from bench_utils import measure_in_subprocess, print_table
+import helpers  # noqa: E402 (path is set up in bench_utils)
+
+
+def load_csv_legacy(path: str) -> pd.DataFrame:
+    """The loader as it was before the parquet format was introduced."""
+    return pd.read_csv(
+        path, sep=",", engine="python", parse_dates=["calculation_date"]
+    )
+
+
+def load_csv_typed(path: str) -> pd.DataFrame:
+    return helpers._load_preprocessed_csv(Path(path))
+
+
+def load_parquet(path: str) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+
+def main(n_products: int, repeat: int):
+    import data_dicts
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = str(Path(tmp_dir, "preprocessed_results.csv"))
+        parquet_path = str(Path(tmp_dir, "preprocessed_results.parquet"))
+        df.to_csv(csv_path, index=False)
+        df.to_parquet(parquet_path, index=False)
+
+        rows = []
+        for name, loader, path in [
+            ("csv (legacy)", load_csv_legacy, csv_path),
+            ("csv (typed fallback)", load_csv_typed, csv_path),
+            ("parquet", load_parquet, parquet_path),
+        ]:
+            results = [measure_in_subprocess(loader, path) for _ in range(repeat)]
+            rows.append(
+                [
+                    name,
+                    f"{Path(path).stat().st_size / 2 ** 20:.1f}",
+                    min(r[0] for r in results),
+                    min(r[1] for r in results),
+                ]
+            )
+    print_table(["format", "file size (MB)", "load time (s)", "RSS growth (MB)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,86 @@
+"""Compare the ways to cut the expanded data to the max date of each
+entity: the old loop (one boolean scan and `drop` per product), the
+single pass in `reduce_dataframe_to_max_date_per_entity` after the full
+expansion and the cut-off folded into `expand_dataframe_fully` (the rows
+are never generated). Times include the expansion, for several numbers
+of products.
+
+    python benchmarks/bench_max_date.py --n-products 50 500 5000
+"""
+
+import argparse
+import warnings
+
+from bench_utils import print_table, silence_app_logging, time_it
+import data_dicts  # noqa: E402 (path is set up in bench_utils)
+import preprocess  # noqa: E402
+
+
+def reduce_with_loop(df, dict_max_date_per_entity):
+    """The implementation before the single pass, for comparison."""
+    for entity, date_ in dict_max_date_per_entity.items():
+        df.drop(
+            df.loc[
+                (df["product_name"] == entity) & (df["calculation_date"] > date_)
+            ].index,
+            inplace=True,
+        )
+    return df
+
+
+def expand_and_loop(df, max_dates):
+    return reduce_with_loop(preprocess.expand_dataframe_fully(df), max_dates)
+
+
+def expand_and_reduce(df, max_dates):
+    df = preprocess.expand_dataframe_fully(df)
+    return preprocess.reduce_dataframe_to_max_date_per_entity(df, max_dates)
+
+
+def expand_with_max_dates(df, max_dates):
+    return preprocess.expand_dataframe_fully(df, max_dates)
+
+
+def prepare_product_rows(n_products: int):
+    from tests.data.mock_dataset import create_raw_extract, product_look_up
+
+    data_dicts.PRODUCT_LOOK_UP.update(product_look_up(n_products))
+    return preprocess.clean_extracted_rows(create_raw_extract(n_products=n_products))
+
+
+def main(n_products_list: list, max_products_loop: int, repeat: int):
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    rows = []
+    for n_products in n_products_list:
+        df = prepare_product_rows(n_products)
+        max_dates = preprocess.create_max_date_dict(df)
+        expected = expand_with_max_dates(df, max_dates)
+        funcs = [
+            ("loop + drop", expand_and_loop),
+            ("single pass", expand_and_reduce),
+            ("folded into expansion", expand_with_max_dates),
+        ]
+        for name, func in funcs:
+            if func is expand_and_loop and n_products > max_products_loop:
+                rows.append([n_products, len(df), name, "skipped"])
+                continue
+            seconds, result = time_it(func, df, max_dates, repeat=repeat)
+            assert result.reset_index(drop=True).equals(expected)
+            rows.append([n_products, len(df), name, seconds])
+    print_table(["products", "rows in", "cut-off", "time (s)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, nargs="+", default=[50, 500, 5000])
+arg_parser.add_argument(
+    "--max-products-loop",
+    type=int,
+    default=500,
+    help="skip the (slow) loop for more products",
+)
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.max_products_loop, args.repeat)
@@ -0,0 +1,96 @@
+"""Compare the extraction with one query for all months (`create_df`) and
+the extraction in partitions of months queried in parallel
+(`create_df_partitioned`). The source is a local SQLite database filled
+with a mock raw extract that simulates the server: every query waits
+`--latency` seconds (the round-trip) and the fetches `--row-latency`
+seconds per row (the scan and transfer, which the partitions share).
+
+    python benchmarks/bench_partitioned_extract.py --latency 0.2
+"""
+
+import argparse
+import os
+import tempfile
+
+from bench_utils import print_table, silence_app_logging, time_it
+
+import preprocess  # noqa: E402 (path is set up in bench_utils)
+
+
+def main(
+    n_products: int,
+    latency: float,
+    row_latency: float,
+    months_per_partition: int,
+    workers: list,
+):
+    from tests.data.mock_dataset import (
+        create_raw_extract,
+        create_sqlite_engine,
+        create_sqlite_partition_queries,
+        create_sqlite_source,
+    )
+
+    silence_app_logging()
+    raw_extract = create_raw_extract(n_products=n_products)
+    print(
+        f"Rows in mock extract: {len(raw_extract):,.0f}, "
+        f"latency per query: {latency} s, per row: {row_latency * 1e6:.0f} us\n"
+    )
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "kf_core.db")
+        query = create_sqlite_source(db_path, raw_extract)
+        periods_query, partition_query = create_sqlite_partition_queries(raw_extract)
+        engine = create_sqlite_engine(db_path, latency, row_latency)
+
+        def _single_query():
+            with engine.connect() as connection:
+                return preprocess.create_df(
+                    query, connection, chunk_size=preprocess.EXTRACT_CHUNK_SIZE
+                )
+
+        t_single, expected = time_it(_single_query, repeat=3)
+        rows.append(["one query", t_single, 1.0])
+        for max_workers in workers:
+            t_part, df = time_it(
+                preprocess.create_df_partitioned,
+                engine,
+                periods_query,
+                partition_query,
+                params={"min_period_value": 0},
+                months_per_partition=months_per_partition,
+                max_workers=max_workers,
+                repeat=3,
+            )
+            assert df.equals(expected)
+            rows.append(
+                [
+                    f"partitions of {months_per_partition}, {max_workers} workers",
+                    t_part,
+                    t_single / t_part,
+                ]
+            )
+        engine.dispose()
+    print_table(["extraction", "time (s)", "speed-up"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=200)
+arg_parser.add_argument("--latency", type=float, default=0.2)
+arg_parser.add_argument("--row-latency", type=float, default=20e-6)
+arg_parser.add_argument(
+    "--months-per-partition", type=int, default=preprocess.EXTRACT_PARTITION_MONTHS
+)
+arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(
+        args.n_products,
+        args.latency,
+        args.row_latency,
+        args.months_per_partition,
+        args.workers,
+    )
@@ -0,0 +1,90 @@
+"""Time the stages of the preprocessing pipeline (`preprocess.main`
+without the DB connection) for the three ways to ingest the values:
+`Decimal` objects (like `fetchall` returns them), float64 and fixed-point
+integers with 2 decimals (see `preprocess.create_df`). The input is a
+mock raw extract, the CSV is written to a temporary folder.
+
+    python benchmarks/bench_preprocess_stages.py --n-products 100
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import warnings
+from decimal import Decimal
+
+from bench_utils import print_table, silence_app_logging
+import data_dicts  # noqa: E402 (path is set up in bench_utils)
+import preprocess  # noqa: E402
+
+INGESTIONS = ["decimal", "float64", "fixed-point"]
+
+
+def run_stages(df, value_decimals, csv_path: str) -> dict:
+    """Run the pipeline like `preprocess.main` and return the seconds per stage."""
+    timings = {}
+
+    def stage(name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    df = stage("calculation date", preprocess.create_calculation_date_column, df)
+    df = stage("trim strings", preprocess.trim_strings, df)
+    df = stage("invalid entries", preprocess.get_rid_of_invalid_entries, df)
+    df = stage("prettify kpi names", preprocess.prettify_kpi_names, df)
+    df = stage("mandant / sector", preprocess.add_mandant_sector_level_columns, df)
+    max_dates = stage("max date dict", preprocess.create_max_date_dict, df)
+    df = stage("expand fully", preprocess.expand_dataframe_fully, df, max_dates)
+    df_levels = stage("level rows", preprocess.create_level_rows, df)
+    df = stage("concatenate", preprocess.concatenate_all_levels, df, *df_levels)
+    df = stage("unscale values", preprocess.unscale_value_column, df, value_decimals)
+    df = stage("avg values", preprocess.add_avg_value_column, df)
+    df = stage("result dim columns", preprocess.add_result_dim_columns, df)
+    df = stage("sort", preprocess.sort_and_drop_kpi_id, df)
+    df = stage("schema", preprocess.apply_dataset_schema, df)
+    stage("write csv", df.to_csv, csv_path, index=False)
+    return timings
+
+
+def main(n_products: int):
+    from tests.data.mock_dataset import create_raw_extract, product_look_up
+
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    data_dicts.PRODUCT_LOOK_UP.update(product_look_up(n_products))
+    raw_extract = create_raw_extract(n_products=n_products)
+    print(f"Rows in mock extract: {len(raw_extract):,.0f}\n")
+
+    decimals = raw_extract["value"].map(lambda x: Decimal(f"{x:.2f}"))
+    inputs = {
+        "decimal": (raw_extract.assign(value=decimals), None),
+        "float64": (raw_extract, None),
+        "fixed-point": (
+            raw_extract.assign(value=(raw_extract["value"] * 100).round()),
+            2,
+        ),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "preprocessed_results.csv")
+        for name in INGESTIONS:
+            df, value_decimals = inputs[name]
+            results[name] = run_stages(df.copy(), value_decimals, csv_path)
+
+    rows = [
+        [stage] + [results[name][stage] for name in INGESTIONS]
+        for stage in results["decimal"]
+    ]
+    rows.append(["total"] + [sum(results[name].values()) for name in INGESTIONS])
+    print_table(["stage (s)"] + INGESTIONS, rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=100)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products)
@@ -0,0 +1,78 @@
+"""Measure the latency of the data part of an app rerun (load from the
+cache, truncation, date options) with the legacy `st.cache()` loader
+that hashes the returned frame on every call and re-parses the dates,
+compared to the frozen base dataset that is never re-hashed.
+
+    python benchmarks/bench_rerun_latency.py --n-products 400
+"""
+
+import argparse
+import datetime as dt
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from bench_utils import print_table, silence_app_logging, time_it
+import helpers  # noqa: E402 (path is set up in bench_utils)
+
+
+@st.cache()
+def load_legacy(path: str) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+
+def truncate_legacy(df: pd.DataFrame, actual_date: str) -> pd.DataFrame:
+    df["calculation_date"] = pd.to_datetime(df["calculation_date"], format="%Y-%m-%d")
+    actual_date = dt.datetime.strptime(actual_date, "%Y-%m-%d")
+    return df.loc[df["calculation_date"] <= actual_date]
+
+
+def rerun_legacy(path: str):
+    df = load_legacy(path)
+    date_list = helpers.get_filter_options_for_due_date(df, 24)
+    return truncate_legacy(df, date_list[0])
+
+
+def rerun_frozen(path: str):
+    df = helpers.load_preprocessed_data(path)
+    date_list = helpers.get_filter_options_for_due_date(df, 24)
+    return helpers.truncate_data_to_actual_date(df, date_list[0])
+
+
+def main(n_products: int, repeat: int):
+    import data_dicts
+    import preprocess
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parquet_path = str(Path(tmp_dir, "preprocessed_results.parquet"))
+        arrow_path = str(Path(tmp_dir, "preprocessed_results.arrow"))
+        df.to_parquet(parquet_path, index=False)
+        preprocess.save_to_arrow(df, path=arrow_path)
+
+        rows = []
+        for name, func, path in [
+            ("st.cache() + re-parse (before)", rerun_legacy, parquet_path),
+            ("frozen base data, parquet", rerun_frozen, parquet_path),
+            ("frozen base data, arrow", rerun_frozen, arrow_path),
+        ]:
+            func(path)  # first run fills the cache
+            seconds, _ = time_it(func, path, repeat=repeat)
+            rows.append([name, seconds * 1000])
+    print_table(["loader", "rerun latency (ms)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--repeat", type=int, default=10)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,51 @@
+"""Measure the per-click latency of switching the result dimension: the
+values and diffs computed on the KPI cube for every rerun, compared to
+the look-up of the columns materialized during preprocessing.
+
+    python benchmarks/bench_result_dim.py --n-products 400
+"""
+
+import argparse
+
+from bench_utils import print_table, silence_app_logging, time_it
+import cube  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import helpers  # noqa: E402
+
+
+def main(n_products: int, repeat: int):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+    cube_materialized = cube.KpiCube.from_frame(df)
+    cube_computed = cube.KpiCube.from_frame(df.loc[:, :"value_avg"])
+
+    rows = []
+    for result_dim in data_dicts.RESULT_DIM_DICT:
+        for name, kpi_cube in [
+            ("computed", cube_computed),
+            ("materialized", cube_materialized),
+        ]:
+            seconds, _ = time_it(
+                helpers.create_df_with_actual_period_from_cube,
+                kpi_cube,
+                "2020-12-31",
+                2,
+                result_dim,
+                False,
+                repeat=repeat,
+            )
+            rows.append([result_dim, name, seconds * 1000])
+    print_table(["result dim", "values", "time (ms)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--repeat", type=int, default=10)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,67 @@
+"""Compare the rolling aggregation of the result dimensions: the legacy
+pandas path (one rolling window over the whole concatenated frame, it
+bleeds across series), a correct pandas groupby-rolling and the
+vectorized window sums over a (series x month) array.
+
+    python benchmarks/bench_rolling.py --n-products 50 500 5000
+"""
+
+import argparse
+
+import pandas as pd
+
+from bench_utils import print_table, silence_app_logging, time_it
+import cube  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import helpers  # noqa: E402
+
+
+def rolling_legacy(df: pd.DataFrame, n_months: int) -> pd.DataFrame:
+    df_sum = df.loc[~df["kpi_name"].isin(data_dicts.NO_SUM_KPI)].copy()
+    df_no_sum = df.loc[df["kpi_name"].isin(data_dicts.NO_SUM_KPI)]
+    df_sum["value"] = df_sum["value"].rolling(window=n_months).sum()
+    return pd.concat([df_sum, df_no_sum], axis=0)
+
+
+def rolling_groupby(df: pd.DataFrame, n_months: int) -> pd.DataFrame:
+    no_sum = df["kpi_name"].isin(data_dicts.NO_SUM_KPI)
+    rolled = (
+        df.groupby(cube.SERIES_KEYS, observed=True, sort=False)["value"]
+        .rolling(n_months)
+        .sum()
+        .reset_index(level=list(range(len(cube.SERIES_KEYS))), drop=True)
+    )
+    return df.assign(value=rolled.where(~no_sum, df["value"]))
+
+
+def rolling_vectorized(df: pd.DataFrame, n_months: int) -> pd.DataFrame:
+    return helpers.prepare_values_according_to_result_dim(
+        df, f"{n_months} Monate rollierend", "2020-12-31"
+    )
+
+
+def main(n_products_list, repeat: int):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    rows = []
+    for n_products in n_products_list:
+        df = create_preprocessed_data(n_products=n_products)
+        df = df.astype(data_dicts.DATASET_SCHEMA).loc[:, :"value"]
+        for name, func in [
+            ("pandas rolling (legacy)", rolling_legacy),
+            ("pandas groupby-rolling", rolling_groupby),
+            ("vectorized", rolling_vectorized),
+        ]:
+            seconds, _ = time_it(func, df, 12, repeat=repeat)
+            rows.append([n_products, f"{len(df):,.0f}", name, seconds * 1000])
+    print_table(["products", "rows", "engine", "time (ms)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, nargs="+", default=[50, 500, 5000])
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,95 @@
+"""Compare the old row-wise python functions of the preprocessing with the
+vectorized ones in `preprocess`: the month-end dates, the trimming of the
+strings and the look-up of mandant and sector. The outputs are checked
+to be identical.
+
+    python benchmarks/bench_row_functions.py --n-products 500
+"""
+
+import argparse
+import datetime as dt
+import warnings
+
+import pandas as pd
+
+from bench_utils import print_table, silence_app_logging, time_it
+import data_dicts  # noqa: E402 (path is set up in bench_utils)
+import preprocess  # noqa: E402
+
+# The implementations before the vectorized versions, for comparison
+
+
+def create_calculation_date_column_per_row(df):
+    df = df.copy()
+    df["period_value"] = pd.to_datetime(df["period_value"], format="%Y%m")
+    df["period_value"] = df["period_value"].apply(lambda x: _get_last_day_of_month(x))
+    return df.rename(columns={"period_value": "calculation_date"})
+
+
+def _get_last_day_of_month(some_date):
+    next_month = some_date.replace(day=28) + dt.timedelta(days=4)
+    return next_month - dt.timedelta(days=next_month.day)
+
+
+def trim_strings_per_cell(df):
+    return df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+
+
+def add_mandant_sector_per_row(df):
+    df = df.copy()
+    df["mandant"] = df["product_name"].apply(
+        lambda x: data_dicts.PRODUCT_LOOK_UP[x]["mandant"]
+    )
+    df["sector"] = df["product_name"].apply(
+        lambda x: data_dicts.PRODUCT_LOOK_UP[x]["sector"]
+    )
+    df["level"] = 3
+    if df.isna().sum().sum() != 0:
+        raise AssertionError("Ups, something went wrong: NaN values in df!")
+    return df
+
+
+def main(n_products: int, repeat: int):
+    from tests.data.mock_dataset import create_raw_extract, product_look_up
+
+    silence_app_logging()
+    warnings.simplefilter("ignore", FutureWarning)
+    data_dicts.PRODUCT_LOOK_UP.update(product_look_up(n_products))
+    raw_extract = create_raw_extract(n_products=n_products)
+    # Padded strings, like the CHAR columns from the DB
+    raw_extract["product_name"] = raw_extract["product_name"] + "  "
+    print(f"Rows in mock extract: {len(raw_extract):,.0f}\n")
+
+    df_dates = preprocess.create_calculation_date_column(raw_extract)
+    df_trimmed = preprocess.trim_strings(df_dates)
+    steps = [
+        (
+            "calculation date",
+            create_calculation_date_column_per_row,
+            preprocess.create_calculation_date_column,
+            raw_extract,
+        ),
+        ("trim strings", trim_strings_per_cell, preprocess.trim_strings, df_dates),
+        (
+            "mandant / sector",
+            add_mandant_sector_per_row,
+            preprocess.add_mandant_sector_level_columns,
+            df_trimmed,
+        ),
+    ]
+    rows = []
+    for name, func_old, func_new, df in steps:
+        seconds_old, expected = time_it(func_old, df, repeat=repeat)
+        seconds_new, result = time_it(func_new, df, repeat=repeat)
+        pd.testing.assert_frame_equal(result, expected)
+        rows.append([name, seconds_old, seconds_new, seconds_old / seconds_new])
+    print_table(["stage", "per row (s)", "vectorized (s)", "speed-up"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=500)
+arg_parser.add_argument("--repeat", type=int, default=3)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,94 @@
+"""Compare the memory footprint of n concurrent app processes that each
+load the dataset and run a typical session pipeline: parquet (private
+copy per process) vs. the memory-mapped Arrow IPC file (shared pages).
+
+    python benchmarks/bench_shared_dataset.py --n-products 400
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import psutil
+
+from bench_utils import print_table, silence_app_logging
+import helpers  # noqa: E402 (path is set up in bench_utils)
+import preprocess  # noqa: E402
+
+
+def _session_pipeline(df: pd.DataFrame) -> pd.DataFrame:
+    actual_date = helpers.return_max_date_string(df)
+    df = helpers.truncate_data_n_years_back(df, actual_date, 3)
+    df = helpers.prepare_values_according_to_result_dim(df, "Monat", actual_date)
+    df = helpers.calculate_diff_column(df.drop(columns="value_avg"))
+    return helpers.create_df_with_actual_period_only(df, actual_date)
+
+
+def _worker(mode, path, barrier, queue):
+    silence_app_logging()
+    if mode == "arrow":
+        df = helpers._load_shared_arrow(Path(path))
+    else:
+        df = pd.read_parquet(path)
+    result = _session_pipeline(df)
+    barrier.wait()  # all processes hold their data now
+    mem = psutil.Process().memory_full_info()
+    queue.put((mem.rss, mem.uss))
+    barrier.wait()
+    del result
+
+
+def measure(mode: str, path: str, n_processes: int):
+    """Return the summed RSS and USS (MB) of `n_processes` workers."""
+    ctx = multiprocessing.get_context("spawn")
+    barrier, queue = ctx.Barrier(n_processes), ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(mode, path, barrier, queue))
+        for _ in range(n_processes)
+    ]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return (
+        sum(r[0] for r in results) / 2 ** 20,
+        sum(r[1] for r in results) / 2 ** 20,
+    )
+
+
+def main(n_products: int, max_processes: int):
+    import data_dicts
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        arrow_path = str(Path(tmp_dir, "preprocessed_results.arrow"))
+        parquet_path = str(Path(tmp_dir, "preprocessed_results.parquet"))
+        preprocess.save_to_arrow(df, path=arrow_path)
+        df.to_parquet(parquet_path, index=False)
+
+        rows = []
+        n = 1
+        while n <= max_processes:
+            for mode, path in [("parquet", parquet_path), ("arrow", arrow_path)]:
+                rss, uss = measure(mode, path, n)
+                rows.append([n, mode, rss, uss])
+            n *= 2
+    print_table(
+        ["processes", "format", "sum RSS (MB)", "sum USS (MB, private)"], rows
+    )
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--max-processes", type=int, default=8)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.max_processes)
@@ -0,0 +1,76 @@
+"""Measure the rerun of the pandas backend (see `backends.PandasBackend`)
+when only the KPI multiselect changes: with an empty stage cache (every
+stage is calculated, as before) and with the stages of the previous run
+in the cache (only the entity and KPI filter is calculated). The hits
+and misses per stage are printed for the cached reruns.
+
+    python benchmarks/bench_stage_cache.py --n-products 400
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+from bench_utils import print_table, silence_app_logging, time_it
+import backends  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import query  # noqa: E402
+
+ACTUAL_DATE = "2020-12-31"
+KPI_SELECTIONS = [["[alle]"], ["Umsatz Total"], ["Anzahl Kunden"]]
+
+
+def rerun(backend: backends.PandasBackend, filter_kpi: list):
+    # (Without the view cache, the stages of the query are measured)
+    return backend._run_query(
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim("12 Monate rollierend")
+        .diff(12)
+        .filter_mandant("Bonus Card")
+        .filter_kpi_group("Umsatz")
+        .filter_entity_and_kpi(["[alle]"], filter_kpi)
+    )
+
+
+def rerun_all(backend: backends.PandasBackend, clear: bool):
+    for filter_kpi in KPI_SELECTIONS:
+        if clear:
+            backend.stage_cache.clear()
+        rerun(backend, filter_kpi)
+
+
+def main(n_products: int, repeat: int):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA).loc[:, :"value_avg"]
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "preprocessed_results.parquet")
+        df.to_parquet(path, index=False)
+        backend = backends.PandasBackend(path)
+        rows = []
+        for name, clear in [("all stages", True), ("stage cache", False)]:
+            seconds, _ = time_it(rerun_all, backend, clear, repeat=repeat)
+            rows.append([name, seconds / len(KPI_SELECTIONS) * 1000])
+        print_table(["rerun", "time per KPI selection (ms)"], rows)
+        print()
+        print_table(
+            ["stage", "hits", "misses"],
+            [
+                [name, counts["hits"], counts["misses"]]
+                for name, counts in backend.stage_cache.stats().items()
+            ],
+        )
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--repeat", type=int, default=5)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
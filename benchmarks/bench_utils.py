@@ -0,0 +1,107 @@
+"""Small utilities shared by the benchmark scripts in this folder.
+
+The scripts are meant to be run from the main folder (containing the
+README file), e.g. `python benchmarks/bench_load_formats.py`.
+"""
+
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, List, Sequence, Tuple
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+sys.path.append(ROOT)
+
+
+def silence_app_logging():
+    """Do not log every helpers call (`logging_runtime`) during runs."""
+    for name in ["appLogger", "preprocessLogger"]:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def time_it(func: Callable, *args, repeat: int = 5, **kwargs) -> Tuple[float, Any]:
+    """Call `func` `repeat` times and return the best wall-clock time
+    in seconds together with the result of the last call.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _measure_worker(queue, func, args):
+    """Run `func` in a fresh process and report time and RSS growth."""
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    rss_after = process.memory_info().rss
+    queue.put((elapsed, (rss_after - rss_before) / 2 ** 20))
+    del result
+
+
+def measure_in_subprocess(func: Callable, *args) -> Tuple[float, float]:
+    """Return wall-clock seconds and resident memory growth (MB) of
+    a single call of `func` in a new process. (`func` has to be a
+    module level function, so it can be pickled.)
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure_worker, args=(queue, func, args))
+    proc.start()
+    elapsed, rss_mb = queue.get()
+    proc.join()
+    return elapsed, rss_mb
+
+
+class PeakRSS:
+    """Sample the resident memory of this process in a background thread
+    (every `interval` seconds) and keep the maximum.
+    """
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def print_table(headers: Sequence[str], rows: List[Sequence[Any]]):
+    """Print a simple markdown table to the console."""
+    str_rows = [
+        [f"{v:,.3f}" if isinstance(v, float) else str(v) for v in row]
+        for row in rows
+    ]
+    widths = [
+        max(len(str(h)), *(len(r[i]) for r in str_rows))
+        for i, h in enumerate(headers)
+    ]
+    print("| " + " | ".join(h.ljust(w) for h, w in zip(headers, widths)) + " |")
+    print("|" + "|".join("-" * (w + 2) for w in widths) + "|")
+    for row in str_rows:
+        print("| " + " | ".join(v.rjust(w) for v, w in zip(row, widths)) + " |")
@@ -0,0 +1,105 @@
+"""Measure the month-end case: `--sessions` sessions open the default
+view of the app at the same time (one thread each, on one shared
+backend). Without the caches every session calculates the view, with
+the stage cache only one does and the others wait for its result
+(single-flight). After a restart of the server (a new backend) the view
+is loaded from the view cache on disk. The summary of the stage cache
+(as in the app log) is printed with the times.
+
+    python benchmarks/bench_view_cache.py --sessions 8 16
+"""
+
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+from bench_utils import print_table, silence_app_logging, time_it
+import backends  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import query  # noqa: E402
+
+ACTUAL_DATE = "2020-12-31"
+DEFAULT_VIEW = (
+    query.ViewQuery(ACTUAL_DATE)
+    .truncate(2)
+    .result_dim("Monat")
+    .diff(12)
+    .filter_mandant("[alle]")
+    .filter_kpi_group("[alle]")
+)
+
+
+def open_sessions(n_sessions: int, open_view):
+    threads = [threading.Thread(target=open_view) for _ in range(n_sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_no_cache(backend: backends.PandasBackend, n_sessions: int):
+    backend.stage_cache.clear()
+    backend.stage_cache.max_entries = 0
+    try:
+        open_sessions(n_sessions, lambda: backend._run_query(DEFAULT_VIEW))
+    finally:
+        backend.stage_cache.max_entries = data_dicts.STAGE_CACHE_MAX_ENTRIES
+
+
+def run_single_flight(backend: backends.PandasBackend, n_sessions: int):
+    backend.stage_cache.clear()
+    backend.view_cache.clear()
+    open_sessions(n_sessions, lambda: backend.execute(DEFAULT_VIEW))
+
+
+def run_after_restart(backend: backends.PandasBackend, n_sessions: int):
+    backend = type(backend)(backend.path)
+    open_sessions(n_sessions, lambda: backend.execute(DEFAULT_VIEW))
+    return backend
+
+
+def main(n_products: int, sessions: list, backend_name: str):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA).loc[:, :"value_avg"]
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "preprocessed_results.parquet")
+        df.to_parquet(path, index=False)
+        backend = backends.BACKENDS[backend_name](path)
+        backend.execute(DEFAULT_VIEW)  # loads the data
+        rows = []
+        for n_sessions in sessions:
+            for name, func in [
+                ("no cache", run_no_cache),
+                ("single-flight", run_single_flight),
+                ("disk, after restart", run_after_restart),
+            ]:
+                seconds, result = time_it(func, backend, n_sessions, repeat=3)
+                summary = (result or backend).stage_cache.summary()
+                if func is run_no_cache:
+                    summary = {"hit_ratio": 0.0, "bytes_held": 0}
+                rows.append(
+                    [
+                        n_sessions,
+                        name,
+                        seconds,
+                        summary["hit_ratio"],
+                        summary["bytes_held"] / 1024**2,
+                    ]
+                )
+    print_table(["sessions", "cache", "time (s)", "hit ratio", "MB held"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--sessions", type=int, nargs="+", default=[8, 16])
+arg_parser.add_argument("--backend", default="pandas", choices=list(backends.BACKENDS))
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.sessions, args.backend)
@@ -0,0 +1,76 @@
+"""Compare the eager helpers chain of the app (actual period for all
+series, then the sidebar filters) with the lazy `ViewQuery` that runs
+the plan once with the filters pushed down to the KPI cube. Time and
+peak of the allocated memory (tracemalloc) per rerun, for a dataset
+with computed and with materialized result dim values.
+
+    python benchmarks/bench_view_query.py --n-products 400
+"""
+
+import argparse
+import tracemalloc
+
+from bench_utils import print_table, silence_app_logging, time_it
+import cube  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import helpers  # noqa: E402
+import query  # noqa: E402
+
+ACTUAL_DATE = "2020-12-31"
+
+
+def rerun_eager(kpi_cube: cube.KpiCube, result_dim: str):
+    df = helpers.create_df_with_actual_period_from_cube(
+        kpi_cube, ACTUAL_DATE, 2, result_dim, False
+    )
+    df = helpers.filter_for_sidebar_selections_mandant(df, "Bonus Card")
+    return helpers.filter_for_sidebar_selections_kpi(df, "Umsatz")
+
+
+def rerun_lazy(kpi_cube: cube.KpiCube, result_dim: str):
+    return (
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim(result_dim)
+        .diff(12)
+        .filter_mandant("Bonus Card")
+        .filter_kpi_group("Umsatz")
+        .execute(kpi_cube)
+    )
+
+
+def peak_memory_mb(func, *args) -> float:
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+def main(n_products: int, repeat: int):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    rows = []
+    for values, kpi_cube in [
+        ("computed", cube.KpiCube.from_frame(df.loc[:, :"value_avg"])),
+        ("materialized", cube.KpiCube.from_frame(df)),
+    ]:
+        for name, func in [("eager chain", rerun_eager), ("lazy query", rerun_lazy)]:
+            seconds, _ = time_it(func, kpi_cube, "12 Monate rollierend", repeat=repeat)
+            peak = peak_memory_mb(func, kpi_cube, "12 Monate rollierend")
+            rows.append([values, name, seconds * 1000, peak])
+    print_table(["values", "engine", "time (ms)", "peak alloc (MB)"], rows)
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--repeat", type=int, default=10)
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.repeat)
@@ -0,0 +1,79 @@
+"""Measure the warm-up of the views (see `warm_up.py`) with different
+numbers of worker processes, and the latency of the first request for
+a view in a new backend (as after the start of the app): computed
+without the warm-up, loaded from the view cache with it.
+
+    python benchmarks/bench_warm_up.py --n-dates 2 --workers 1 2 4
+"""
+
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+
+from bench_utils import print_table, silence_app_logging, time_it
+import backends  # noqa: E402 (path is set up in bench_utils)
+import data_dicts  # noqa: E402
+import view_cache  # noqa: E402
+import warm_up  # noqa: E402
+
+
+def first_request(path: str, backend_name: str, n_dates: int) -> float:
+    backend = backends.BACKENDS[backend_name](path)
+    views = warm_up.enumerate_views(backend, n_dates)
+    backend = backends.BACKENDS[backend_name](path)
+    seconds, _ = time_it(backend.execute, views[0], repeat=1)
+    return seconds
+
+
+def main(n_products: int, n_dates: int, workers: list, backend_name: str):
+    from tests.data.mock_dataset import create_preprocessed_data
+
+    silence_app_logging()
+    df = create_preprocessed_data(n_products=n_products)
+    df = df.astype(data_dicts.DATASET_SCHEMA)
+    print(f"Rows in mock dataset: {len(df):,.0f}\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "preprocessed_results.parquet")
+        df.to_parquet(path, index=False)
+        rows = []
+        cold = first_request(path, backend_name, n_dates)
+        for max_workers in workers:
+            shutil.rmtree(view_cache.view_cache_dir(path), ignore_errors=True)
+            report = warm_up.warm_up(
+                path, backend_name, max_workers=max_workers, n_dates=n_dates
+            )
+            warm = first_request(path, backend_name, n_dates)
+            rows.append(
+                [
+                    max_workers,
+                    report.n_materialized,
+                    report.seconds,
+                    report.nbytes / 1024**2,
+                    cold * 1000,
+                    warm * 1000,
+                ]
+            )
+    print_table(
+        [
+            "workers",
+            "views",
+            "warm-up (s)",
+            "MB",
+            "first request cold (ms)",
+            "warm (ms)",
+        ],
+        rows,
+    )
+
+
+arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+arg_parser.add_argument("--n-products", type=int, default=400)
+arg_parser.add_argument("--n-dates", type=int, default=2)
+arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+arg_parser.add_argument("--backend", default="cube", choices=list(backends.BACKENDS))
+
+if __name__ == "__main__":
+    args = arg_parser.parse_args()
+    main(args.n_products, args.n_dates, args.workers, args.backend)
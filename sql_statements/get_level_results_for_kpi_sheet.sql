@@ -0,0 +1,136 @@
+﻿--============================================================================================================
+-- SELECT DATA FOR KPI-SHEET WITH ALL LEVELS (AGGREGATED IN THE DB)
+--============================================================================================================
+
+--NOTE: New structure, Dec 2020. We only load agg_level_id = 5
+--NOTE: Same rows as get_results_for_kpi_sheet.sql, but cleaned, expanded and aggregated
+--      to all levels of the ENTITY_HIERARCHY (in `data_dicts`) with GROUPING SETS, so
+--      the result has the rows of all levels. The mandant and sector of the products
+--      are joined from the temporary table #product_look_up, see `preprocess.main`.
+--      Everything after the AGGREGATION marker is standard SQL (it is run on DuckDB
+--      in the tests), please keep it like that.
+
+
+-- DEFINE DATERANGE
+-------------------
+
+/*Set min date: 
+1) find last calculation date in kpi_results 
+2) from there take the last day of the previous month
+3) from there subtract the number of years passed as variable
+*/
+
+DECLARE @n_years_back INT = :n_years_back
+DECLARE @last_date DATE = (SELECT MAX(calculation_date) FROM KF_CORE.CALC.kpi_result)
+DECLARE @max_date DATE = (SELECT DATEADD(MONTH, DATEDIFF(MONTH, -1, @last_date)-1, -1))
+DECLARE @min_date DATE = (SELECT DATEADD(YEAR, (@n_years_back *-1), @max_date))
+
+
+-- SELECT DATA
+--------------
+
+;WITH product_rows AS (
+	SELECT
+		r.period_value,
+		r.kpi_id,
+		LTRIM(RTRIM(kpi.kpi_name_de)) AS kpi_name,
+		r.period_id,
+		LTRIM(RTRIM(r.agg_level_value)) AS product_name,
+		r.value,
+		LTRIM(RTRIM(vp.kartenprofil)) AS cardprofile
+	FROM calc.kpi_result AS r
+		LEFT JOIN (
+			SELECT distinct
+			produkt,
+			mandant,
+			kartenprofil
+		FROM jemas_base.dbo.v_produkt
+		) AS vp
+			ON vp.produkt = r.agg_level_value
+		JOIN kf_core.mstr.kpi AS kpi
+			ON kpi.kpi_id = r.kpi_id
+	WHERE r.calculation_date >= @min_date
+		AND r.agg_level_id = 5
+		AND r.period_id in (1, 2)
+), product_look_up AS (
+	SELECT product_name, mandant, sector FROM #product_look_up
+),
+-- AGGREGATION
+-- Remove the invalid entries (see `preprocess.get_rid_of_invalid_entries`)
+valid_rows AS (
+	SELECT *
+	FROM product_rows
+	WHERE product_name NOT LIKE 'Reserviert IT%'
+		AND kpi_name <> 'NCAs: Anzahl Antraege Completed Total'
+),
+-- Expand every series to all months up to the last month of its product,
+-- the missing values are NULL (see `preprocess.expand_dataframe_fully`)
+months AS (
+	SELECT DISTINCT period_value FROM valid_rows
+), max_months AS (
+	SELECT product_name, MAX(period_value) AS max_period_value
+	FROM valid_rows
+	GROUP BY product_name
+), series AS (
+	SELECT DISTINCT kpi_id, kpi_name, period_id, product_name, cardprofile
+	FROM valid_rows
+), expanded_rows AS (
+	SELECT
+		m.period_value,
+		s.kpi_id,
+		s.kpi_name,
+		s.period_id,
+		s.product_name,
+		v.value,
+		s.cardprofile,
+		lu.mandant,
+		lu.sector
+	FROM series AS s
+		JOIN max_months AS mm
+			ON mm.product_name = s.product_name
+		JOIN months AS m
+			ON m.period_value <= mm.max_period_value
+		LEFT JOIN valid_rows AS v
+			ON v.period_value = m.period_value
+			AND v.kpi_id = s.kpi_id
+			AND v.kpi_name = s.kpi_name
+			AND v.period_id = s.period_id
+			AND v.product_name = s.product_name
+			-- NULL-safe (products not in v_produkt have no cardprofile), so their
+			-- values are kept and the NULL fails in `clean_extracted_level_rows`
+			AND (
+				v.cardprofile = s.cardprofile
+				OR (v.cardprofile IS NULL AND s.cardprofile IS NULL)
+			)
+		LEFT JOIN product_look_up AS lu
+			ON lu.product_name = s.product_name
+)
+-- Product rows (level 3) and the sums for mandant, sector and overall (level 2 to 0),
+-- the sums of only missing values are 0 (like in `preprocess.create_level_rows`)
+SELECT
+	period_value,
+	kpi_id,
+	kpi_name,
+	period_id,
+	product_name,
+	CASE
+		WHEN GROUPING(product_name) = 0 THEN SUM(value)
+		ELSE COALESCE(SUM(value), 0)
+	END AS value,
+	cardprofile,
+	mandant,
+	sector,
+	3 - GROUPING(product_name) - GROUPING(mandant) - GROUPING(sector) AS level
+FROM expanded_rows
+GROUP BY
+	period_value,
+	kpi_id,
+	kpi_name,
+	period_id,
+	GROUPING SETS (
+		(product_name, cardprofile, mandant, sector),
+		(mandant, sector),
+		(sector),
+		()
+	)
+ORDER BY level DESC, period_value, product_name, kpi_id
@@ -0,0 +1,35 @@
+﻿--============================================================================================================
+-- SELECT THE PERIODS TO LOAD FOR KPI-SHEET
+--============================================================================================================
+
+--NOTE: New structure, Dec 2020. We only load agg_level_id = 5
+--NOTE: Returns the periods (yyyymm) of get_results_for_kpi_sheet.sql from min_period_value
+--      on, they are split into partitions by `preprocess.create_df_partitioned`
+
+
+-- DEFINE DATERANGE
+-------------------
+
+/*Set min date: 
+1) find last calculation date in kpi_results 
+2) from there take the last day of the previous month
+3) from there subtract the number of years passed as variable
+*/
+
+DECLARE @n_years_back INT = :n_years_back
+DECLARE @last_date DATE = (SELECT MAX(calculation_date) FROM KF_CORE.CALC.kpi_result)
+DECLARE @max_date DATE = (SELECT DATEADD(MONTH, DATEDIFF(MONTH, -1, @last_date)-1, -1))
+DECLARE @min_date DATE = (SELECT DATEADD(YEAR, (@n_years_back *-1), @max_date))
+
+
+-- SELECT PERIODS
+-----------------
+
+SELECT DISTINCT
+	r.period_value
+FROM calc.kpi_result AS r
+WHERE r.calculation_date >= @min_date
+	AND r.agg_level_id = 5
+	AND r.period_id in (1, 2)
+	AND r.period_value >= :min_period_value
+ORDER BY r.period_value
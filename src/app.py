@@ -1,11 +1,17 @@
+import functools
+
 import streamlit as st
 
+import backends
+import data_dicts
 import downloads
 import helpers
 import plots
+import query
 import SessionState
+import warm_up
 
-DATA_PATH = "./data/preprocessed_results.csv"
+DATA_PATH = "./data/preprocessed_results.arrow"
 
 
 def main(data_path):
@@ -13,27 +19,24 @@ def main(data_path):
     It is run after a small basic set-up and the successfull user
     authentication (see below).
     """
-    data_loaded = helpers.load_preprocessed_data(data_path)
-    date_list = helpers.get_filter_options_for_due_date(data_loaded, 24)
-    max_date = helpers.return_max_date_string(data_loaded)
+    # The data processing runs on the configured backend (see `backends.py`)
+    backend = backends.load_compute_backend(data_path)
+    if data_dicts.WARM_UP_AT_APP_START:
+        warm_up.warm_up_in_background(data_path)
+    date_list = backend.date_options(24)
+    max_date = backend.max_date()
 
     filter_due_date = st.sidebar.selectbox("Auswahl Stichdatum:", options=date_list)
 
     actual_date = helpers.return_actual_date_string(filter_due_date, max_date)
-    data_truncated_head = helpers.truncate_data_to_actual_date(data_loaded, actual_date)
-    n_years = helpers.calculate_max_n_years_available(data_truncated_head)
+    n_years = backend.n_years_available(actual_date)
 
     filter_result_dim = st.sidebar.selectbox(
         "Auswahl Resultatsdimension:",
         options=helpers.get_filter_options_for_result_dim(n_years),
     )
 
-    data_truncated = helpers.truncate_data_n_years_back(
-        data_truncated_head, actual_date, n_years
-    )
-    data_prepared = helpers.prepare_values_according_to_result_dim(
-        data_truncated, filter_result_dim, actual_date
-    )
+    data_truncated = backend.history(actual_date, n_years)
 
     if filter_result_dim == "Monat":
         avg_bool = st.sidebar.checkbox("Ø-Werte pro aktive Konten", value=False)
@@ -41,11 +44,18 @@ def main(data_path):
         st.sidebar.text("[Ø-Werte nicht verfügbar]")
         avg_bool = False
 
-    data_prepared_value = helpers.replace_monthly_values_with_avg(data_prepared, filter_result_dim, avg_bool)
-    data_with_diff = helpers.calculate_diff_column(data_prepared_value)
-    data_actual = helpers.create_df_with_actual_period_only(data_with_diff, actual_date)
+    # Aggregation, averages and diff are only recorded here and run once
+    # with the sidebar filters pushed down.
+    view_query = (
+        query.ViewQuery(actual_date)
+        .truncate(n_years)
+        .result_dim(filter_result_dim, avg_bool)
+        .diff(12)
+    )
+    # Pre-built positions of the dimension values for the filters below
+    dim_index = backend.dimension_index(actual_date)
 
-    mandant_groups = helpers.get_filter_options_for_mandant_groups(data_actual)
+    mandant_groups = backend.mandant_options(actual_date)
     kpi_groups = helpers.get_filter_options_for_kpi_groups()
 
     # SIDEBAR
@@ -70,13 +80,15 @@ def main(data_path):
 
     # UPPER FILTER OPTIONS MAIN PAGE
 
-    data = helpers.filter_for_sidebar_selections_mandant(data_actual, filter_mandant)
-    data = helpers.filter_for_sidebar_selections_kpi(data, filter_kpi_groups)
+    data = backend.execute(
+        view_query.filter_mandant(filter_mandant).filter_kpi_group(filter_kpi_groups)
+    )
 
     # GENERATING OPTION FOR MAIN PAGE FILTERS
 
-    entity_options = helpers.get_filter_options_for_entities(data)
-    kpi_options = helpers.get_filter_options_for_kpi(data)
+    entity_options, kpi_options = backend.entity_and_kpi_options(
+        actual_date, filter_mandant, filter_kpi_groups, data
+    )
 
     # MAIN PAGE FILTERS
 
@@ -93,6 +105,7 @@ def main(data_path):
         data,
         filter_entity=filter_entity,
         filter_kpi=filter_kpi,
+        dim_index=dim_index,
     )
 
     # DISPLAY AND STYLING OF DATAFRAMES
@@ -109,7 +122,12 @@ def main(data_path):
 
     # DISPLAY STANDARD PLOT IF CONDITIONS ARE MET
 
-    fig, df_plot = plots.main(data, data_truncated)
+    # (The df_plot is cached by the backend, see `PandasBackend.plot_data`)
+    fig, df_plot = plots.main(
+        data,
+        data_truncated,
+        functools.partial(backend.plot_data, actual_date, n_years),
+    )
     if fig is not None:
         st.plotly_chart(fig)
 
@@ -0,0 +1,544 @@
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+import data_dicts
+import helpers
+import plots
+from cube import ENTITY_COLS, SERIES_KEYS
+from dim_index import DimensionIndex
+from helpers import logging_runtime
+from manifest import load_manifest
+from query import ViewQuery
+from stage_cache import Stage, StageCache
+from view_cache import DiskViewCache, view_cache_dir
+
+# Columns of the dataframe returned by `execute` (if the steps are in the query)
+VIEW_COLS = [
+    "calculation_date",
+    "kpi_name",
+    "period_id",
+    "product_name",
+    "cardprofile",
+    "mandant",
+    "sector",
+    "level",
+    "value",
+    "diff_value",
+]
+
+
+class PandasBackend:
+    """Compute backend that runs the helpers functions eagerly on the
+    (cached) base dataset. This is the reference implementation for the
+    other backends, they have to return the same results.
+
+    A backend provides the option lists for the sidebar, the truncated
+    history (for the plots) and executes a `ViewQuery` for the data of
+    the actual period. The rows of all returned dataframes keep the index
+    labels of the base dataset.
+
+    The steps run as stages of the `stage_cache` (one per backend, i.e.
+    per version of the data, shared by all sessions): on a rerun only the
+    stages after the first changed parameter are calculated again, and
+    sessions asking for the same view at the same time wait for one
+    calculation. The state of the cache is logged after every query.
+    The views and plot data are also stored in the `view_cache` on disk
+    (by default next to the data), so they survive a restart of the
+    server. They are keyed by the checksum of the data file, the entries
+    of an older dataset are removed when the preprocessing publishes a
+    new one (see `preprocess.save_to_csv`).
+
+    If the preprocessing wrote a manifest for the data file (see
+    `manifest.py`), the option lists are read from it instead of
+    scanning the data.
+    """
+
+    name = "pandas"
+
+    def __init__(self, path: str, view_cache: Optional[DiskViewCache] = None):
+        self.path = path
+        self.stage_cache = StageCache()
+        self.view_cache = view_cache or DiskViewCache(view_cache_dir(path))
+        self.manifest = load_manifest(path)
+        self.checksum = helpers.return_dataset_checksum(path)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        return helpers.load_preprocessed_data(self.path)
+
+    def _data_stage(self) -> Stage:
+        """Return the base dataset as the first stage."""
+        return self.stage_cache.source(
+            "data",
+            lambda path, version: helpers.load_preprocessed_data(path),
+            self.path,
+            helpers.return_dataset_version(self.path),
+        )
+
+    def _truncated_stage(self, actual_date: str) -> Stage:
+        """Return the stage with the data up to the actual date."""
+        return self.stage_cache.run(
+            "truncate_to_date",
+            helpers.truncate_data_to_actual_date,
+            self._data_stage(),
+            actual_date,
+        )
+
+    def date_options(self, n_months_min: int = 12) -> List[str]:
+        """See `helpers.get_filter_options_for_due_date`."""
+        if self.manifest is not None:
+            return self.manifest.date_options(n_months_min)
+        return helpers.get_filter_options_for_due_date(self.data, n_months_min)
+
+    def max_date(self) -> str:
+        """See `helpers.return_max_date_string`."""
+        if self.manifest is not None:
+            return self.manifest.max_date
+        return helpers.return_max_date_string(self.data)
+
+    def n_years_available(self, actual_date: str) -> int:
+        """See `helpers.calculate_max_n_years_available`."""
+        if self.manifest is not None:
+            return self.manifest.n_years_available(actual_date)
+        df = self._truncated_stage(actual_date).value
+        return helpers.calculate_max_n_years_available(df)
+
+    def history(self, actual_date: str, n_years: int) -> pd.DataFrame:
+        """Return the monthly data of `n_years` back from the actual date."""
+        return self.stage_cache.run(
+            "truncate",
+            helpers.truncate_data_n_years_back,
+            self._truncated_stage(actual_date),
+            actual_date,
+            n_years,
+        ).value
+
+    def mandant_options(self, actual_date: str) -> List[str]:
+        """See `helpers.get_filter_options_for_mandant_groups`."""
+        if self.manifest is not None:
+            return self.manifest.mandant_options(actual_date)
+        df = helpers.create_df_with_actual_period_only(self.data, actual_date)
+        return helpers.get_filter_options_for_mandant_groups(df)
+
+    def entity_and_kpi_options(
+        self,
+        actual_date: str,
+        filter_mandant: str,
+        filter_kpi_groups: str,
+        data: pd.DataFrame,
+    ) -> Tuple[List[str], List[str]]:
+        """Return the entity and KPI options for the sidebar selections
+        (see `helpers.get_filter_options_for_entities` and `_kpi`), from
+        the manifest or else from the `data` returned by `execute`.
+        """
+        if self.manifest is not None:
+            options = self.manifest.entity_and_kpi_options(
+                actual_date, filter_mandant, filter_kpi_groups
+            )
+            if options is not None:
+                return options["entities"], options["kpis"]
+        return (
+            helpers.get_filter_options_for_entities(data),
+            helpers.get_filter_options_for_kpi(data),
+        )
+
+    def dimension_index(self, actual_date: str) -> Optional[DimensionIndex]:
+        """Return the dimension index for the rows of the actual period,
+        if the backend has one (it is optional for the filters).
+        """
+        return None
+
+    def execute(self, view_query: ViewQuery) -> pd.DataFrame:
+        """Return the data of the actual period for the query: from the
+        stage cache, from the view cache on disk or else run the query.
+        """
+        df = self.stage_cache.run(
+            "view",
+            lambda actual_date, steps: self.view_cache.load_or_run(
+                *self._view_cache_key(ViewQuery(actual_date, steps)),
+                self._run_query,
+                ViewQuery(actual_date, steps),
+            ),
+            view_query.actual_date,
+            view_query.steps,
+        ).value
+        self._log_stage_cache()
+        return df
+
+    def has_cached_view(self, view_query: ViewQuery) -> bool:
+        """Return True if the view is in the view cache on disk."""
+        return self.view_cache.contains(*self._view_cache_key(view_query))
+
+    def store_view(self, view_query: ViewQuery, df: pd.DataFrame):
+        """Store a view that was computed by `_run_query` in another
+        process (see `warm_up.py`) in the view cache on disk.
+        """
+        self.view_cache.put(*self._view_cache_key(view_query), df)
+
+    def _view_cache_key(self, view_query: ViewQuery) -> tuple:
+        """Return checksum, name and parameters of the view for the
+        view cache on disk.
+        """
+        return (
+            self.checksum,
+            f"{self.name}_view",
+            (view_query.actual_date, view_query.steps),
+        )
+
+    def plot_data(
+        self,
+        actual_date: str,
+        n_years: int,
+        kpi_for_plot: List,
+        entities_for_plot: List,
+        level_for_plot: List,
+    ) -> pd.DataFrame:
+        """Return the df_plot (see `plots.create_df_plot`) for the
+        history of `n_years`, like the views from the stage cache or from
+        the view cache on disk. (It is a copy, the plots change it.)
+        """
+        params = (
+            actual_date,
+            n_years,
+            tuple(str(kpi) for kpi in kpi_for_plot),
+            tuple(str(entity) for entity in entities_for_plot),
+            tuple(int(level) for level in level_for_plot),
+        )
+        return self.stage_cache.run(
+            "df_plot",
+            lambda *params: self.view_cache.load_or_run(
+                self.checksum,
+                f"{self.name}_df_plot",
+                params,
+                lambda: plots.create_df_plot(
+                    self.history(actual_date, n_years),
+                    kpi_for_plot,
+                    entities_for_plot,
+                    level_for_plot,
+                ),
+            ),
+            *params,
+        ).value.copy()
+
+    def _run_query(self, view_query: ViewQuery) -> pd.DataFrame:
+        """Run the steps of the query one after the other, each one as
+        a stage that only depends on the stage before and its arguments.
+        """
+        actual_date = view_query.actual_date
+        run = self.stage_cache.run
+        stage = self._truncated_stage(actual_date)
+        for name, args in view_query.steps:
+            if name == "truncate":
+                stage = run(
+                    "truncate",
+                    helpers.truncate_data_n_years_back,
+                    stage,
+                    actual_date,
+                    *args,
+                )
+            elif name == "result_dim":
+                result_dim, avg_bool = args
+                stage = run(
+                    "result_dim",
+                    helpers.prepare_values_according_to_result_dim,
+                    stage,
+                    result_dim,
+                    actual_date,
+                )
+                stage = run(
+                    "avg", helpers.replace_monthly_values_with_avg, stage, *args
+                )
+            elif name == "diff":
+                stage = run("diff", _calculate_diff_column, stage, *args)
+        stage = run(
+            "actual_period",
+            helpers.create_df_with_actual_period_only,
+            stage,
+            actual_date,
+        )
+        for name, args in view_query.steps:
+            if name == "filter_mandant":
+                stage = run(
+                    name, helpers.filter_for_sidebar_selections_mandant, stage, *args
+                )
+            elif name == "filter_kpi_group":
+                stage = run(
+                    name, helpers.filter_for_sidebar_selections_kpi, stage, *args
+                )
+            elif name == "filter_entity_and_kpi":
+                stage = run(name, helpers.filter_for_entity_and_kpi, stage, *args)
+        df = stage.value
+        if "diff" not in dict(view_query.steps):
+            df = df.drop(columns="diff_value", errors="ignore")
+        return df[[col for col in VIEW_COLS if col in df.columns]]
+
+    def _log_stage_cache(self):
+        """Write the hit ratio, evictions and memory of the stage cache
+        to the app log. (This is called within `execute`.)
+        """
+        summary = self.stage_cache.summary()
+        helpers.logger.debug(
+            f"Stage cache ({self.name}) - hit ratio: {summary['hit_ratio']:.2f}, "
+            f"evictions: {summary['evictions']}, rejected: {summary['rejected']}, "
+            f"entries: {summary['entries']}, "
+            f"MB held: {summary['bytes_held'] / 1024 ** 2:.1f}"
+        )
+
+
+class CubeBackend(PandasBackend):
+    """Compute backend that executes the queries on the (cached) KPI
+    cube, with the filters pushed down (see `ViewQuery.execute`). This
+    is the default of the app.
+    """
+
+    name = "cube"
+
+    def mandant_options(self, actual_date: str) -> List[str]:
+        if self.manifest is not None:
+            return self.manifest.mandant_options(actual_date)
+        kpi_cube = helpers.load_kpi_cube(self.path).month_slice(actual_date)
+        return helpers.get_filter_options_for_mandant_groups(
+            kpi_cube.present_entities()
+        )
+
+    def dimension_index(self, actual_date: str) -> Optional[DimensionIndex]:
+        return helpers.load_dimension_index(self.path, actual_date)
+
+    def _run_query(self, view_query: ViewQuery) -> pd.DataFrame:
+        """The query runs as one step (on the cube the filters are
+        applied first, so all steps depend on them).
+        """
+        return view_query.execute(helpers.load_kpi_cube(self.path))
+
+
+class DuckDBBackend(PandasBackend):
+    """Compute backend that runs the same logic as SQL in an embedded
+    DuckDB database, using all cores for the window functions. The
+    parquet file (or the CSV fallback) is loaded once into a DuckDB
+    table, its row ids are the index labels of the base dataset.
+    The steps of a query are run in the order truncation, result dim,
+    diff, the filters are applied to the rows before the window functions.
+    (DuckDB is an optional dependency, only needed for this backend.)
+    """
+
+    name = "duckdb"
+
+    def __init__(
+        self,
+        path: str,
+        threads: Optional[int] = None,
+        view_cache: Optional[DiskViewCache] = None,
+    ):
+        import duckdb
+
+        super().__init__(path, view_cache)
+        self._con = duckdb.connect()
+        if threads is not None:
+            self._con.execute(f"SET threads = {int(threads)}")
+        self._con.execute(f"CREATE TABLE data AS SELECT * FROM {self._source()}")
+
+        self._categories = {}
+        for col, dtype in data_dicts.DATASET_SCHEMA.items():
+            if dtype == "category":
+                values = self._query(f"SELECT DISTINCT {col} FROM data")[col]
+                self._categories[col] = pd.CategoricalDtype(sorted(values.dropna()))
+        self._dates = self._typed(
+            self._query("SELECT DISTINCT calculation_date FROM data")
+        )
+        self._kpis = self._query("SELECT DISTINCT kpi_name FROM data")
+        self._entities = self._query(
+            f"SELECT DISTINCT {', '.join(ENTITY_COLS)} FROM data"
+        )
+
+    def _source(self) -> str:
+        """Return the table function reading the parquet or CSV file."""
+        path = Path(self.path).with_suffix(".parquet")
+        if path.exists():
+            return f"read_parquet('{_escape(path)}')"
+        path = path.with_suffix(".csv")
+        if not path.exists():
+            raise FileNotFoundError(f"No parquet or CSV data found for {self.path}.")
+        return f"read_csv('{_escape(path)}', header=true)"
+
+    def _query(self, sql: str, params: Optional[list] = None, **frames) -> pd.DataFrame:
+        """Run the query on a new cursor (one per thread / session) with
+        the `frames` registered as views, return the result as dataframe.
+        """
+        cursor = self._con.cursor()
+        for name, frame in frames.items():
+            cursor.register(name, frame)
+        return cursor.execute(sql, params or []).df()
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return the dataframe with the column types of the DATASET_SCHEMA
+        and the `row_label` column (if any) as index.
+        """
+        if "row_label" in df.columns:
+            df = df.set_index("row_label")
+            df.index.name = None
+        schema = {
+            col: self._categories.get(col, dtype)
+            for col, dtype in data_dicts.DATASET_SCHEMA.items()
+            if col in df.columns
+        }
+        return df.astype(schema)
+
+    def date_options(self, n_months_min: int = 12) -> List[str]:
+        if self.manifest is not None:
+            return self.manifest.date_options(n_months_min)
+        return helpers.get_filter_options_for_due_date(self._dates, n_months_min)
+
+    def max_date(self) -> str:
+        if self.manifest is not None:
+            return self.manifest.max_date
+        return helpers.return_max_date_string(self._dates)
+
+    def n_years_available(self, actual_date: str) -> int:
+        if self.manifest is not None:
+            return self.manifest.n_years_available(actual_date)
+        df = helpers.truncate_data_to_actual_date(self._dates, actual_date)
+        return helpers.calculate_max_n_years_available(df)
+
+    def history(self, actual_date: str, n_years: int) -> pd.DataFrame:
+        return self.stage_cache.run(
+            "history", self._query_history, actual_date, n_years
+        ).value
+
+    def _query_history(self, actual_date: str, n_years: int) -> pd.DataFrame:
+        start_date = _return_truncation_start(actual_date, n_years)
+        df = self._query(
+            "SELECT rowid AS row_label, * FROM data "
+            "WHERE calculation_date <= ? AND calculation_date > ? ORDER BY rowid",
+            [actual_date, start_date],
+        )
+        return self._typed(df)
+
+    def mandant_options(self, actual_date: str) -> List[str]:
+        if self.manifest is not None:
+            return self.manifest.mandant_options(actual_date)
+        df = self._query(
+            "SELECT DISTINCT mandant FROM data WHERE calculation_date = ?",
+            [actual_date],
+        )
+        return helpers.get_filter_options_for_mandant_groups(df)
+
+    @logging_runtime
+    def _run_query(self, view_query: ViewQuery) -> pd.DataFrame:
+        """The query runs as one SQL statement."""
+        actual_date = view_query.actual_date
+        args = dict(view_query.steps)
+        where, params, frames = ["calculation_date <= ?"], [actual_date], {}
+        if "truncate" in args:
+            where.append("calculation_date > ?")
+            params.append(_return_truncation_start(actual_date, *args["truncate"]))
+
+        # Filters only remove whole series, so they can go before the windows
+        kpis, entities = view_query.select_axes(self._kpis, self._entities)
+        if len(kpis) < len(self._kpis):
+            where.append("kpi_name IN (SELECT kpi_name FROM selected_kpis)")
+            frames["selected_kpis"] = kpis
+        if len(entities) < len(self._entities):
+            cols = ", ".join(ENTITY_COLS)
+            where.append(f"({cols}) IN (SELECT {cols} FROM selected_entities)")
+            frames["selected_entities"] = entities
+
+        series = f"PARTITION BY {', '.join(SERIES_KEYS)} ORDER BY month_ord"
+        value = "value"
+        if "result_dim" in args:
+            result_dim, avg_bool = args["result_dim"]
+            if avg_bool:
+                value = "value_avg"
+            elif result_dim != "Monat":
+                n_months = helpers.return_n_months_for_result_dim(
+                    result_dim, actual_date
+                )
+                window = (
+                    f"({series} RANGE BETWEEN {n_months - 1} PRECEDING AND CURRENT ROW)"
+                )
+                # Like pandas `rolling`: NULL if the window is not complete
+                value = (
+                    "CASE WHEN list_contains(?, kpi_name) THEN value "
+                    f"WHEN count(value) OVER {window} = {n_months} "
+                    f"THEN sum(value) OVER {window} END"
+                )
+                params.append(data_dicts.NO_SUM_KPI)
+
+        diff, select_diff = "", ""
+        if "diff" in args:
+            lag = int(args["diff"][0])
+            diff = (
+                f", value_out / first_value(value_out) OVER ({series} RANGE "
+                f"BETWEEN {lag} PRECEDING AND {lag} PRECEDING) - 1 AS diff_raw"
+            )
+            # Capp unreasonable diff values (e.g. for new products)
+            select_diff = (
+                ", CASE WHEN abs(diff_raw) < 100 THEN diff_raw END AS diff_value"
+            )
+
+        sql = f"""
+            WITH base AS (
+                SELECT rowid AS row_label, *,
+                    year(calculation_date) * 12 + month(calculation_date) AS month_ord
+                FROM data
+                WHERE {" AND ".join(where)}
+            ), agg AS (
+                SELECT *, {value} AS value_out FROM base
+            ), diffs AS (
+                SELECT *{diff} FROM agg
+            )
+            SELECT row_label, {", ".join(VIEW_COLS[:-2])}, value_out AS value
+                {select_diff}
+            FROM diffs
+            WHERE calculation_date = ?
+            ORDER BY row_label
+        """
+        params.append(actual_date)
+        return self._typed(self._query(sql, params, **frames))
+
+
+# Backends that can be configured with COMPUTE_BACKEND in the `data_dicts`
+BACKENDS = {
+    backend.name: backend for backend in [PandasBackend, CubeBackend, DuckDBBackend]
+}
+
+
+def load_compute_backend(
+    path: str, name: str = data_dicts.COMPUTE_BACKEND
+) -> PandasBackend:
+    """Return the compute backend `name` for the data in `path`. It is
+    created only once per version of the data.
+    """
+    return _create_compute_backend_cached(
+        path, helpers.return_dataset_version(path), name
+    )
+
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=1)
+def _create_compute_backend_cached(path: str, version: tuple, name: str):
+    """Create the backend. The `version` is only used as part of the cache
+    key, only the backend of the latest version is kept (with its stage
+    cache).
+    """
+    return BACKENDS[name](path)
+
+
+def _calculate_diff_column(df: pd.DataFrame, n_months_diff: int) -> pd.DataFrame:
+    """See `helpers.calculate_diff_column`, it resets the index, the
+    labels are set again here (the order of the rows is kept).
+    """
+    return helpers.calculate_diff_column(df, n_months_diff).set_axis(df.index)
+
+
+def _return_truncation_start(actual_date: str, n_years: int) -> str:
+    """Return the (excluded) start date of the truncation to `n_years`
+    back, see `helpers.truncate_data_n_years_back`.
+    """
+    actual_date = pd.Timestamp(actual_date)
+    return f"{actual_date.year - n_years:04d}-{actual_date.month:02d}-01"
+
+
+def _escape(path: Path) -> str:
+    return str(path).replace("'", "''")
@@ -0,0 +1,403 @@
+import datetime as dt
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import data_dicts
+
+# Columns describing an entity (one row per entity in `KpiCube.entities`)
+ENTITY_COLS = ["product_name", "cardprofile", "mandant", "sector", "level"]
+# Sort order of the entities, the same as in the preprocessed dataset
+ENTITY_SORT = ["level", "mandant", "product_name", "cardprofile", "sector"]
+# Columns identifying a time series in the long-format dataframe
+SERIES_KEYS = [
+    "kpi_name", "period_id", "level", "product_name", "mandant", "cardprofile"
+]
+
+
+def rolling_window_sum(
+    values: np.ndarray, n_months: Union[int, np.ndarray]
+) -> np.ndarray:
+    """Return the sum over a trailing window of `n_months` along the
+    last axis (the months) of a (series x month) or cube array. Like
+    `pandas.rolling(n_months).sum()` per series the result is NaN if
+    the window is incomplete or contains a NaN. Each window is summed
+    directly (from the latest month back), so a sum is the same to the
+    last bit whatever the first month of the array is (unlike differences
+    of cumulative sums). `n_months` can also be an array with one window
+    length per month (e.g. the month number for year-to-date sums).
+    """
+    n_total = values.shape[-1]
+    n_months = np.broadcast_to(n_months, (n_total,))
+    window_sum = np.array(values, dtype=np.float64)
+    for lag in range(1, min(int(n_months.max(initial=1)), n_total)):
+        in_window = n_months[lag:] > lag
+        window_sum[..., lag:] += np.where(in_window, values[..., :-lag], 0.0)
+    window_sum[..., np.arange(n_total) < n_months - 1] = np.nan
+    return window_sum
+
+
+def lagged_pct_changes(
+    values: np.ndarray, lags: Iterable[int], cap: float = 100
+) -> Dict[int, np.ndarray]:
+    """Return the %-difference of every value to the value `lag` months
+    earlier along the last axis (the months) for each of the `lags`
+    (e.g. 1, 12 and 24 for the previous month, year and 2 years), as
+    dict keyed by lag. The lagged values are just a shifted view of the
+    array. Unreasonable values with abs >= `cap` (e.g. for new products)
+    are NaN, as are the first `lag` months.
+    """
+    diffs = {}
+    for lag in lags:
+        diff = np.full(values.shape, np.nan)
+        if 0 < lag < values.shape[-1]:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                np.divide(values[..., lag:], values[..., :-lag], out=diff[..., lag:])
+                diff[..., lag:] -= 1
+                diff[~(np.abs(diff) < cap)] = np.nan
+        diffs[lag] = diff
+    return diffs
+
+
+def lagged_pct_change(
+    values: np.ndarray, n_months: int = 12, cap: float = 100
+) -> np.ndarray:
+    """Return the %-difference to the value `n_months` earlier, see
+    `lagged_pct_changes`.
+    """
+    return lagged_pct_changes(values, [n_months], cap)[n_months]
+
+
+def _combine_codes(df: pd.DataFrame, cols: List[str]) -> np.ndarray:
+    """Return one int64 code per row for the combination of the values
+    in `cols` (faster to group by than the columns themselves).
+    """
+    codes, sizes = [], []
+    for col in cols:
+        if df[col].dtype.name == "category":
+            col_codes = df[col].cat.codes.to_numpy().astype(np.int64)
+            size = len(df[col].cat.categories)
+        elif df[col].dtype.kind in "iu" and len(df):
+            col_codes = df[col].to_numpy().astype(np.int64)
+            col_codes = col_codes - col_codes.min()
+            size = col_codes.max() + 1
+        else:
+            col_codes, uniques = pd.factorize(df[col])
+            size = len(uniques)
+        codes.append(col_codes)
+        sizes.append(max(size, 1))
+    return np.ravel_multi_index(codes, sizes)
+
+
+def series_month_positions(
+    df: pd.DataFrame,
+) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """Return the position of every row of the long-format dataframe
+    in a dense (series x month) array and the shape of that array.
+    Series are numbered in order of appearance, the months are calendar
+    months counted from the earliest date. Raise a ValueError if two rows
+    fall into the same cell.
+    """
+    series, _ = pd.factorize(_combine_codes(df, SERIES_KEYS))
+    # Calendar month of the (few) unique dates, mapped back to the rows
+    date_codes, dates = pd.factorize(df["calculation_date"])
+    month = np.asarray(dates, dtype="datetime64[M]").astype(np.int64)
+    if len(month):
+        month = month - month.min()
+    month = month[date_codes]
+    shape = (series.max(initial=-1) + 1, month.max(initial=-1) + 1)
+    flat = series * shape[1] + month
+    if np.bincount(flat).max(initial=0) > 1:
+        raise ValueError("More than one row per series and month.")
+    return series, month, shape
+
+
+def result_dim_columns(
+    df: pd.DataFrame, no_sum_kpi: List[str] = data_dicts.NO_SUM_KPI
+) -> pd.DataFrame:
+    """Return the values for every result dim (named as in
+    `data_dicts.RESULT_DIM_COLUMNS`) and the 12 month %-difference of
+    each of them and of `value_avg` as "diff_" columns, aligned with the
+    long-format dataframe. Sums are calculated per series over the whole
+    history, the kpi in `no_sum_kpi` keep their monthly values.
+    """
+    series, month, shape = series_month_positions(df)
+    first_month = df["calculation_date"].min().month if len(df) else 1
+    month_numbers = (first_month - 1 + np.arange(shape[1])) % 12 + 1
+    no_sum = df["kpi_name"].isin(no_sum_kpi).to_numpy()
+
+    def _to_grid(col_values: np.ndarray) -> np.ndarray:
+        grid = np.full(shape, np.nan)
+        grid[series, month] = col_values
+        return grid
+
+    values = df["value"].to_numpy(dtype=np.float64)
+    cols = {"value": values}
+    for result_dim, col in data_dicts.RESULT_DIM_COLUMNS.items():
+        if result_dim == "Monat":
+            continue
+        n_months = data_dicts.RESULT_DIM_DICT[result_dim]
+        if result_dim == "Year To Date":
+            n_months = month_numbers
+        rolled = rolling_window_sum(_to_grid(values), n_months)[series, month]
+        cols[col] = np.where(no_sum, values, rolled)
+    if "value_avg" in df.columns:
+        cols["value_avg"] = df["value_avg"].to_numpy(dtype=np.float64)
+
+    diff_cols = {
+        f"diff_{col}": lagged_pct_change(_to_grid(col_values), 12)[series, month]
+        for col, col_values in cols.items()
+    }
+    cols.pop("value")
+    cols.pop("value_avg", None)
+    return pd.DataFrame({**cols, **diff_cols}, index=df.index)
+
+
+def mask_result_dim_columns(
+    df: pd.DataFrame,
+    first_date: pd.Timestamp,
+    no_sum_kpi: List[str] = data_dicts.NO_SUM_KPI,
+) -> pd.DataFrame:
+    """Return the dataframe with the result dim columns (see
+    `result_dim_columns`) as they are for data starting at `first_date`:
+    the values whose window or 12 month lag reaches back before it are
+    NaN, all others stay the same. Like this the rows of a dataset whose
+    oldest months are dropped do not have to be calculated again.
+    """
+    # Months since the first date and month number of the (few) unique dates
+    date_codes, dates = pd.factorize(df["calculation_date"])
+    dates = pd.DatetimeIndex(dates)
+    month = (dates.year - first_date.year) * 12 + dates.month - first_date.month
+    month = month.to_numpy()[date_codes]
+    month_numbers = dates.month.to_numpy()[date_codes]
+    no_sum = df["kpi_name"].isin(no_sum_kpi).to_numpy()
+
+    masked = {}
+    for result_dim, col in data_dicts.RESULT_DIM_COLUMNS.items():
+        n_months = data_dicts.RESULT_DIM_DICT[result_dim] or 1
+        if result_dim == "Year To Date":
+            n_months = month_numbers
+        n_months = np.where(no_sum, 1, n_months)
+        if col != "value":
+            masked[col] = np.where(month >= n_months - 1, df[col].to_numpy(), np.nan)
+        masked[f"diff_{col}"] = np.where(
+            month >= n_months + 11, df[f"diff_{col}"].to_numpy(), np.nan
+        )
+    if "diff_value_avg" in df.columns:
+        masked["diff_value_avg"] = np.where(
+            month >= 12, df["diff_value_avg"].to_numpy(), np.nan
+        )
+    return df.assign(**masked)
+
+
+class KpiCube:
+    """Dense representation of the long-format dataset. Every measure
+    (`value`, `value_avg`, ...) is a contiguous float64 array indexed
+    by kpi x entity x period_id x month. The dimension values are kept
+    in index arrays (`kpi_names`, `entities`, `period_ids`, `months`).
+    Cells that have no row in the dataset are False in `present` and
+    NaN in the measures. `labels` holds the index label of the row of
+    each cell (-1 if there is none).
+
+    A cube is never changed, all methods return a new cube. Slices
+    along the month axis share the arrays of the original cube.
+    """
+
+    def __init__(
+        self,
+        measures: Dict[str, np.ndarray],
+        present: np.ndarray,
+        labels: np.ndarray,
+        kpi_names: pd.Series,
+        entities: pd.DataFrame,
+        period_ids: np.ndarray,
+        months: pd.DatetimeIndex,
+    ):
+        self.measures = measures
+        self.present = present
+        self.labels = labels
+        self.kpi_names = kpi_names
+        self.entities = entities
+        self.period_ids = period_ids
+        self.months = months
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "KpiCube":
+        """Build the cube from the long-format dataframe (as loaded by
+        `helpers.load_preprocessed_data`). All float columns become
+        measures. Raise a ValueError if a cell has more than one row.
+        """
+        kpi_codes, _ = pd.factorize(df["kpi_name"])
+        period_codes, _ = pd.factorize(df["period_id"], sort=True)
+        month_codes, months = pd.factorize(df["calculation_date"], sort=True)
+        entity_codes = (
+            df[ENTITY_SORT].groupby(ENTITY_SORT, sort=True, observed=True).ngroup()
+        ).to_numpy()
+
+        _, kpi_first = np.unique(kpi_codes, return_index=True)
+        _, entity_first = np.unique(entity_codes, return_index=True)
+        _, period_first = np.unique(period_codes, return_index=True)
+        kpi_names = df["kpi_name"].iloc[kpi_first].reset_index(drop=True)
+        period_ids = df["period_id"].to_numpy()[period_first]
+        entities = df[ENTITY_COLS].iloc[entity_first].reset_index(drop=True)
+
+        shape = (len(kpi_first), len(entity_first), len(period_ids), len(months))
+        flat = np.ravel_multi_index(
+            (kpi_codes, entity_codes, period_codes, month_codes), shape
+        )
+        if np.bincount(flat, minlength=np.prod(shape)).max(initial=0) > 1:
+            raise ValueError("More than one row per kpi, entity, period and month.")
+
+        present = np.zeros(shape, dtype=bool)
+        present.ravel()[flat] = True
+        labels = np.full(shape, -1, dtype=np.int64)
+        labels.ravel()[flat] = df.index.to_numpy(dtype=np.int64)
+
+        measures = {}
+        for col in df.columns:
+            if df[col].dtype.kind == "f":
+                values = np.full(shape, np.nan)
+                values.ravel()[flat] = df[col].to_numpy()
+                measures[col] = values
+
+        return cls(
+            measures,
+            present,
+            labels,
+            kpi_names,
+            entities,
+            period_ids,
+            pd.DatetimeIndex(months),
+        )
+
+    @property
+    def shape(self):
+        return self.present.shape
+
+    def present_entities(self) -> pd.DataFrame:
+        """Return the entities with at least one row in the cube."""
+        return self.entities.loc[self.present.any(axis=(0, 2, 3))]
+
+    def _replace(self, **kwargs) -> "KpiCube":
+        """Return a new cube with some of the attributes replaced."""
+        attrs = dict(self.__dict__)
+        attrs.update(kwargs)
+        return KpiCube(**attrs)
+
+    def _slice_months(self, month_slice: slice) -> "KpiCube":
+        """Return a new cube with a slice of the month axis (views)."""
+        return self._replace(
+            measures={k: v[..., month_slice] for k, v in self.measures.items()},
+            present=self.present[..., month_slice],
+            labels=self.labels[..., month_slice],
+            months=self.months[month_slice],
+        )
+
+    def truncate(self, actual_date: str, n_years: int) -> "KpiCube":
+        """Keep the months from `n_years` back up to and including the
+        actual date (see `helpers.truncate_data_n_years_back`).
+        """
+        actual = dt.datetime.strptime(actual_date, "%Y-%m-%d")
+        end_date = dt.datetime(actual.year - n_years, actual.month, 1)
+        start = self.months.searchsorted(end_date, side="right")
+        stop = self.months.searchsorted(actual, side="right")
+        return self._slice_months(slice(start, stop))
+
+    def month_slice(self, date: str) -> "KpiCube":
+        """Return a cube with the single month `date` only."""
+        pos = self.months.get_loc(pd.Timestamp(date))
+        return self._slice_months(slice(pos, pos + 1))
+
+    def select(
+        self,
+        kpi_mask: Optional[np.ndarray] = None,
+        entity_mask: Optional[np.ndarray] = None,
+    ) -> "KpiCube":
+        """Return a cube with the selected kpi and / or entities only.
+        The masks are boolean arrays along the kpi and entity axis.
+        """
+        kpi_idx = np.arange(self.shape[0])
+        if kpi_mask is not None:
+            kpi_idx = np.flatnonzero(kpi_mask)
+        ent_idx = np.arange(self.shape[1])
+        if entity_mask is not None:
+            ent_idx = np.flatnonzero(entity_mask)
+
+        def _take(arr: np.ndarray) -> np.ndarray:
+            return arr[kpi_idx][:, ent_idx]
+
+        return self._replace(
+            measures={k: _take(v) for k, v in self.measures.items()},
+            present=_take(self.present),
+            labels=_take(self.labels),
+            kpi_names=self.kpi_names.iloc[kpi_idx].reset_index(drop=True),
+            entities=self.entities.iloc[ent_idx].reset_index(drop=True),
+        )
+
+    def with_measure(self, name: str, values: np.ndarray) -> "KpiCube":
+        """Return a cube with a new or replaced measure."""
+        measures = dict(self.measures)
+        measures[name] = values
+        return self._replace(measures=measures)
+
+    def without_measure(self, name: str) -> "KpiCube":
+        """Return a cube without the measure `name`."""
+        return self._replace(
+            measures={k: v for k, v in self.measures.items() if k != name}
+        )
+
+    def with_rolling_sum(
+        self, n_months: int, no_sum_kpi: List[str] = data_dicts.NO_SUM_KPI
+    ) -> "KpiCube":
+        """Replace `value` with the sum over a window of `n_months` for
+        each series (NaN if the window is not complete). The kpi in
+        `no_sum_kpi` keep their monthly values.
+        """
+        values = self.measures["value"]
+        rolled = rolling_window_sum(values, n_months)
+        no_sum = self.kpi_names.isin(no_sum_kpi).to_numpy()
+        rolled[no_sum] = values[no_sum]
+        return self.with_measure("value", rolled)
+
+    def with_diff(self, n_months_diff: Union[int, Dict[str, int]] = 12) -> "KpiCube":
+        """Add a `diff_value` measure with the %-difference of `value`
+        to the value `n_months_diff` months earlier of the same series.
+        Unreasonable values (abs >= 100, e.g. for new products) are NaN.
+        Pass a dict of measure name and lag to add several diffs at once.
+        """
+        if isinstance(n_months_diff, int):
+            n_months_diff = {"diff_value": n_months_diff}
+        diffs = lagged_pct_changes(self.measures["value"], n_months_diff.values())
+        measures = dict(self.measures)
+        measures.update({name: diffs[lag] for name, lag in n_months_diff.items()})
+        return self._replace(measures=measures)
+
+    def select_measures(self, names: Dict[str, str]) -> "KpiCube":
+        """Return a cube with only the measures in `names`, renamed from
+        the values to the keys of the dict (e.g. to pick materialized
+        result dim columns as `value` and `diff_value`).
+        """
+        return self._replace(
+            measures={new: self.measures[old] for new, old in names.items()}
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the cells with a row in the dataset as long-format
+        dataframe, with the same column types, order and index labels
+        as the dataframe the cube was built from.
+        """
+        flat = np.flatnonzero(self.present)
+        k, e, p, m = np.unravel_index(flat, self.shape)
+        entities = self.entities.iloc[e].reset_index(drop=True)
+        df = pd.DataFrame(
+            {
+                "calculation_date": self.months[m],
+                "kpi_name": self.kpi_names.iloc[k].reset_index(drop=True),
+                "period_id": self.period_ids[p],
+                **{col: entities[col] for col in ENTITY_COLS},
+                **{name: v.ravel()[flat] for name, v in self.measures.items()},
+            },
+        )
+        df.index = pd.Index(self.labels.ravel()[flat])
+        return df
@@ -6,6 +6,30 @@ RESULT_DIM_DICT = {
     "12 Monate rollierend": 12,
 }
 
+# Columns with the values per result dimension, they are materialized
+# during preprocessing together with a "diff_" column for each of them
+# (and for `value_avg`), so the app only has to look them up
+RESULT_DIM_COLUMNS = {
+    "Monat": "value",
+    "Year To Date": "value_ytd",
+    "3 Monate rollierend": "value_3m",
+    "6 Monate rollierend": "value_6m",
+    "12 Monate rollierend": "value_12m",
+}
+
+# Engine for the data processing in the app (see `backends.py`): "cube" (the
+# default), "pandas" (the reference implementation) or "duckdb" (needs duckdb)
+COMPUTE_BACKEND = "cube"
+
+# Compute the common views for the view cache in the background when the app
+# loads a new version of the data (see `warm_up.py`)
+WARM_UP_AT_APP_START = False
+
+# Limits of the stage cache of a backend (see `stage_cache.py`), the least
+# recently used results are dropped above them
+STAGE_CACHE_MAX_ENTRIES = 32
+STAGE_CACHE_MAX_BYTES = 512 * 1024**2
+
 COLORS_BCAG = {
     "rot_matt": "#D2535F",  # non-bcag
     "orange_hell": "#FFC000",
@@ -34,6 +58,32 @@ KPI_GROUPS = {
 }
 
 
+# Column types of the preprocessed dataset. They are stored with the
+# columnar (parquet) file and applied when the CSV fallback is loaded
+DATASET_SCHEMA = {
+    "calculation_date": "datetime64[ns]",
+    "kpi_name": "category",
+    "period_id": "int8",
+    "product_name": "category",
+    "cardprofile": "category",
+    "mandant": "category",
+    "sector": "category",
+    "level": "int8",
+    "value": "float64",
+    "value_avg": "float64",
+    "value_ytd": "float64",
+    "value_3m": "float64",
+    "value_6m": "float64",
+    "value_12m": "float64",
+    "diff_value": "float64",
+    "diff_value_ytd": "float64",
+    "diff_value_3m": "float64",
+    "diff_value_6m": "float64",
+    "diff_value_12m": "float64",
+    "diff_value_avg": "float64",
+}
+
+
 # Some values that are expected outcomes for the preprocessed data file
 # They are used for validation of the data and to control the log messages
 # These values can change over time and should be updated accordingly
@@ -66,7 +116,17 @@ PREPROCESS_VALIDATION = {
         "sector",
         "level",
         "value",
-        "value_avg"
+        "value_avg",
+        "value_ytd",
+        "value_3m",
+        "value_6m",
+        "value_12m",
+        "diff_value",
+        "diff_value_ytd",
+        "diff_value_3m",
+        "diff_value_6m",
+        "diff_value_12m",
+        "diff_value_avg",
     ],
     "cardprofile": ["all", "CC", "PP", "CCL"],
     "level": [0, 1, 2, 3],
@@ -74,6 +134,37 @@ PREPROCESS_VALIDATION = {
     "n_period": 37,
 }
 
+# The levels above the products (level 3), aggregated during preprocessing (see
+# `preprocess.create_level_rows`). Each level is summed up from the one before
+# by the `group_by` columns (and date / kpi), the other entity columns of the
+# new rows are set from the templates in `entity` (filled with the group values)
+ENTITY_HIERARCHY = [
+    {
+        "level": 2,
+        "group_by": ["mandant", "sector"],
+        "entity": {"product_name": "{mandant} - Total", "cardprofile": "all"},
+    },
+    {
+        "level": 1,
+        "group_by": ["sector"],
+        "entity": {
+            "mandant": "{sector}",
+            "product_name": "{sector} - Total",
+            "cardprofile": "all",
+        },
+    },
+    {
+        "level": 0,
+        "group_by": [],
+        "entity": {
+            "mandant": "BCAG",
+            "sector": "BCAG",
+            "product_name": "BCAG - Total",
+            "cardprofile": "all",
+        },
+    },
+]
+
 # This dictionary is used during preprocessing to determine mandant / sector / profile
 # It has to be updated here in case new products are loaded
 # Defunct products have to stay in the dict for as long as they are loaded
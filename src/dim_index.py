@@ -0,0 +1,106 @@
+import functools
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+import data_dicts
+
+# Columns with an entry for each of their values in the index
+INDEX_COLS = ["level", "sector", "mandant", "kpi_name", "product_name"]
+
+
+class DimensionIndex:
+    """Inverted index of a long-format dataframe: for every value of the
+    `INDEX_COLS` and every prefix of the `KPI_GROUPS` it holds the sorted
+    positions of the rows with that value. Filters are unions and
+    intersections of these position arrays instead of scans over the
+    (string) columns.
+
+    Filtered subsets of the indexed frame keep its index labels, so the
+    positions can be applied to them as well (see `take`).
+    """
+
+    def __init__(
+        self,
+        labels: pd.Index,
+        positions: Dict[str, Dict[Any, np.ndarray]],
+        kpi_groups: Dict[str, np.ndarray],
+    ):
+        self.labels = labels
+        self.positions = positions
+        self.kpi_groups = kpi_groups
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DimensionIndex":
+        """Build the index for all `INDEX_COLS` of the dataframe."""
+        positions = {}
+        for col in INDEX_COLS:
+            codes, uniques = pd.factorize(df[col])
+            # Stable sort of the (small int) codes keeps positions sorted
+            order = np.argsort(codes, kind="stable")
+            order = order[codes[order] >= 0]
+            bounds = np.cumsum(np.bincount(codes[order], minlength=len(uniques)))
+            positions[col] = dict(
+                zip(pd.Index(uniques).tolist(), np.split(order, bounds[:-1]))
+            )
+
+        kpi_groups = {}
+        for prefix in data_dicts.KPI_GROUPS.values():
+            if prefix is not None:
+                kpi_groups[prefix] = _union(
+                    pos
+                    for kpi_name, pos in positions["kpi_name"].items()
+                    if kpi_name.startswith(prefix)
+                )
+        return cls(df.index, positions, kpi_groups)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def lookup(self, col: str, values: Iterable[Any]) -> np.ndarray:
+        """Return the sorted positions of the rows with one of the
+        `values` in column `col` (values not in the index are ignored).
+        """
+        col_positions = self.positions[col]
+        return _union(col_positions[val] for val in values if val in col_positions)
+
+    def lookup_kpi_group(self, prefix: str, exclude: bool = False) -> np.ndarray:
+        """Return the sorted positions of the rows with a `kpi_name`
+        starting with `prefix`, or of all other rows if `exclude` is True.
+        """
+        group = self.kpi_groups.get(prefix, np.array([], dtype=np.int64))
+        if not exclude:
+            return group
+        others = np.ones(len(self), dtype=bool)
+        others[group] = False
+        return np.flatnonzero(others)
+
+    @staticmethod
+    def intersect(*positions: np.ndarray) -> np.ndarray:
+        """Return the sorted positions contained in all arrays."""
+        return functools.reduce(
+            lambda a, b: np.intersect1d(a, b, assume_unique=True), positions
+        )
+
+    def take(self, df: pd.DataFrame, positions: np.ndarray) -> pd.DataFrame:
+        """Return the rows of `df` at the `positions` of the indexed
+        frame. `df` has to be the indexed frame or a subset of it (with
+        the same index labels), the order of its rows is kept.
+        """
+        if df.index is self.labels:
+            return df.iloc[positions]
+        row_positions = self.labels.get_indexer(df.index)
+        if (row_positions < 0).any():
+            raise ValueError("The dataframe is not a subset of the indexed frame.")
+        selected = np.zeros(len(self), dtype=bool)
+        selected[positions] = True
+        return df.loc[selected[row_positions]]
+
+
+def _union(positions: Iterable[np.ndarray]) -> np.ndarray:
+    """Return the sorted union of disjoint position arrays."""
+    positions: List[np.ndarray] = list(positions)
+    if not positions:
+        return np.array([], dtype=np.int64)
+    return np.sort(np.concatenate(positions))
@@ -1,22 +1,39 @@
 import datetime as dt
 import functools
+import hashlib
 import logging
 import logging.config
+import threading
 import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 
 import data_dicts
+from cube import (
+    KpiCube,
+    lagged_pct_changes,
+    rolling_window_sum,
+    series_month_positions,
+)
+from dim_index import DimensionIndex
 
 
 LOGGING_CONFIG = (Path(__file__).parent.parent / "logging.conf").absolute()
 logging.config.fileConfig(fname=LOGGING_CONFIG, disable_existing_loggers=False)
 logger = logging.getLogger("appLogger")
 
+# Data formats in the order they are tried to load (the next is the fallback)
+DATA_FORMATS = [".arrow", ".parquet", ".csv"]
+
+# The memory-mapped dataset is shared by all sessions of the server process
+_SHARED_DATASETS: Dict[Tuple[str, int], pd.DataFrame] = {}
+_SHARED_DATASETS_LOCK = threading.Lock()
+
 
 def logging_runtime(func):
     """Create a decorator that logs time for a function call.
@@ -37,9 +54,174 @@ def logging_runtime(func):
 
 
 @logging_runtime
-@st.cache()  # TODO reactivate if not active
 def load_preprocessed_data(path: str) -> pd.DataFrame:
-    """Load data and return a dataframe."""
+    """Return the base dataset. It is loaded once per published
+    version of the data file and then handed out to every rerun (and
+    session) as a frozen, read-only dataframe: it is never re-hashed
+    by the cache and nothing in the app may write into it. A new
+    version of the data (after preprocessing) is picked up without
+    having to clear the cache.
+    """
+    return _load_preprocessed_data_cached(path, return_dataset_version(path))
+
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=1)
+def _load_preprocessed_data_cached(path: str, version: Tuple[str, int]):
+    """Load data and return a read-only dataframe. The Arrow IPC file
+    is memory-mapped and shared by all sessions (see `_load_shared_arrow`).
+    If it is not available, the parquet file and then the CSV file
+    with the same name are loaded as fallback. (The CSV gets the types
+    of the DATASET_SCHEMA, the other formats store them with the data.)
+    The `version` argument is only used as part of the cache key, only
+    the latest version is kept (so an old mapping can be released).
+    """
+    path = Path(path)
+    suffixes = DATA_FORMATS[DATA_FORMATS.index(path.suffix):]
+    for suffix in suffixes[:-1]:
+        try:
+            if suffix == ".arrow":
+                return _load_shared_arrow(path)
+            return _freeze_dataframe(pd.read_parquet(path.with_suffix(suffix)))
+        except (OSError, ImportError) as e:
+            logger.warning(f"Could not load the {suffix} data, trying next: {e}")
+    return _freeze_dataframe(_load_preprocessed_csv(path.with_suffix(".csv")))
+
+
+@logging_runtime
+def load_kpi_cube(path: str) -> KpiCube:
+    """Return the base dataset as dense KPI cube (see the `cube` module).
+    Like the dataframe it is built only once per version of the data.
+    """
+    return _build_kpi_cube_cached(path, return_dataset_version(path))
+
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=1)
+def _build_kpi_cube_cached(path: str, version: Tuple[str, int]) -> KpiCube:
+    """Build the KPI cube from the (cached) base dataset and make its
+    arrays read-only. The `version` is only used as part of the cache key,
+    only the cube of the latest version is kept.
+    """
+    kpi_cube = KpiCube.from_frame(load_preprocessed_data(path))
+    for arr in [kpi_cube.present, kpi_cube.labels, *kpi_cube.measures.values()]:
+        arr.flags.writeable = False
+    return kpi_cube
+
+
+@logging_runtime
+def load_dimension_index(path: str, actual_date: str) -> DimensionIndex:
+    """Return the dimension index (see the `dim_index` module) for the
+    rows of the actual period, as returned by
+    `create_df_with_actual_period_from_cube`. It is built only once per
+    version of the data and actual date.
+    """
+    return _build_dimension_index_cached(
+        path, return_dataset_version(path), actual_date
+    )
+
+
+@st.cache(allow_output_mutation=True, show_spinner=False)
+def _build_dimension_index_cached(
+    path: str, version: Tuple[str, int], actual_date: str
+) -> DimensionIndex:
+    """Build the dimension index for the actual period from the (cached)
+    KPI cube. The `version` is only used as part of the cache key.
+    """
+    kpi_cube = load_kpi_cube(path).month_slice(actual_date)
+    return DimensionIndex.from_frame(kpi_cube.select_measures({}).to_frame())
+
+
+def return_dataset_checksum(path: str) -> str:
+    """Return the checksum of the content of the data file that will be
+    loaded for `path`. Unlike the version it stays the same if the same
+    data is published again. It is calculated once per version.
+    """
+    return _return_dataset_checksum_cached(path, return_dataset_version(path))
+
+
+@st.cache(show_spinner=False)
+def _return_dataset_checksum_cached(path: str, version: Tuple[str, int]) -> str:
+    """Hash the data file. (This is called within
+    `return_dataset_checksum`.)
+    """
+    return return_file_checksum(Path(path).parent / version[0])
+
+
+def return_file_checksum(path: Union[str, Path]) -> str:
+    """Return the SHA-256 of the file in `path`, hashed in blocks."""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(functools.partial(f.read, 1024 ** 2), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def return_dataset_version(path: str) -> Tuple[str, int]:
+    """Return name and modification time of the data file that will
+    be loaded for `path` (see `DATA_FORMATS` for the order).
+    """
+    path = Path(path)
+    for suffix in DATA_FORMATS[DATA_FORMATS.index(path.suffix):]:
+        if suffix == ".arrow":
+            candidate = _find_latest_arrow_version(path)
+        else:
+            candidate = path.with_suffix(suffix)
+        if candidate is not None and candidate.exists():
+            return candidate.name, candidate.stat().st_mtime_ns
+    return path.name, 0
+
+
+def _find_latest_arrow_version(path: Path) -> Optional[Path]:
+    """Return the path of the latest version of the Arrow IPC file
+    (see `preprocess.save_to_arrow`) or None if there is none.
+    """
+    versions = sorted(path.parent.glob(f"{path.stem}_*.arrow"))
+    return versions[-1] if versions else None
+
+
+def _load_shared_arrow(path: Path) -> pd.DataFrame:
+    """Memory-map the latest version of the Arrow IPC file and return
+    a dataframe on top of the mapped buffer. Its columns are zero-copy,
+    read-only views, so all server processes share the same pages in
+    memory. Within a process the same dataframe is handed out to every
+    session until a newer version of the file is published. (This
+    function is called within `load_preprocessed_data`.)
+    """
+    latest = _find_latest_arrow_version(path)
+    if latest is None:
+        raise FileNotFoundError(f"No version of {path.name} found.")
+    key = (str(latest.resolve()), latest.stat().st_mtime_ns)
+
+    with _SHARED_DATASETS_LOCK:
+        if key not in _SHARED_DATASETS:
+            source = pa.memory_map(str(latest), "r")
+            table = pa.ipc.open_file(source).read_all()
+            # Release the mapping of an outdated version
+            _SHARED_DATASETS.clear()
+            _SHARED_DATASETS[key] = table.to_pandas(split_blocks=True)
+        return _SHARED_DATASETS[key]
+
+
+def _freeze_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Return the data with read-only columns backed by Arrow buffers
+    (like the memory-mapped data), so that writing into the cached base
+    dataset raises instead of silently changing it for all sessions.
+    Float NaN are kept as values to keep the conversion zero-copy.
+    """
+    arrays = [
+        pa.array(df[col].to_numpy(), from_pandas=False)
+        if df[col].dtype.kind == "f"
+        else pa.array(df[col])
+        for col in df.columns
+    ]
+    table = pa.Table.from_arrays(arrays, names=list(df.columns))
+    return table.to_pandas(split_blocks=True)
+
+
+def _load_preprocessed_csv(path: Path) -> pd.DataFrame:
+    """Load the CSV version of the data and return a dataframe with
+    the column types of the DATASET_SCHEMA. (This function is called
+    within `load_preprocessed_data`.)
+    """
     try:
         df = pd.read_csv(
             path,
@@ -56,7 +238,12 @@ def load_preprocessed_data(path: str) -> pd.DataFrame:
             parse_dates=["calculation_date"],
             encoding="UTF-8",
         )
-    return df
+    schema = {
+        col: dtype
+        for col, dtype in data_dicts.DATASET_SCHEMA.items()
+        if col in df.columns
+    }
+    return df.astype(schema)
 
 
 # FILTER DISPLAY DATA
@@ -64,10 +251,10 @@ def load_preprocessed_data(path: str) -> pd.DataFrame:
 
 @logging_runtime
 # @st.cache()
-def _return_full_date_list(df: pd.DataFrame) -> List[str]:
+def return_full_date_list(df: pd.DataFrame) -> List[str]:
     """Return a list of all unique dates in the dataframe, as strings
-    in descending order. (This function is called within
-    get_filter_options_for_due_date.)
+    in descending order (for the due date filter and the dataset
+    manifest).
     """
     date_list = sorted(list(df["calculation_date"].unique()), reverse=True)
     date_list = [str(np.datetime_as_string(x, unit="D")) for x in date_list]
@@ -85,14 +272,18 @@ def get_filter_options_for_due_date(
     column. (n_months_min defaults to 12.)
     """
     # Note: at the moment we hide 24 months
-    date_list = _return_full_date_list(df)
+    date_list = return_full_date_list(df)
+    return remove_oldest_dates(date_list, n_months_min)
+
+
+def remove_oldest_dates(date_list: List[str], n_months_min: int) -> List[str]:
+    """Return a copy of the date list (in descending order) without the
+    oldest n months. (This is called within
+    get_filter_options_for_due_date and for the dataset manifest.)
+    """
     if n_months_min >= len(date_list):
         raise ValueError("The observation period is too short for n_months_min.")
-    elif n_months_min == 0:
-        return date_list
-    else:
-        del date_list[-n_months_min:]
-        return date_list
+    return list(date_list[: len(date_list) - n_months_min])
 
 
 @logging_runtime
@@ -120,10 +311,10 @@ def return_actual_date_string(filter_now_date: str, max_date: str) -> str:
 # @st.cache()
 def truncate_data_to_actual_date(df: pd.DataFrame, actual_date: str) -> pd.DataFrame:
     """Remove all periods "younger" than the selected actual date and
-    return the truncated data. (Note: From here on the `calcuation_date`
-    column will be in datetime format.)
+    return the truncated data. (Note: The `calcuation_date` column is
+    already in datetime format when loaded, the frozen base data must
+    not be written to.)
     """
-    df["calculation_date"] = pd.to_datetime(df["calculation_date"], format="%Y-%m-%d")
     actual_date = dt.datetime.strptime(actual_date, "%Y-%m-%d")
     df = df.loc[df["calculation_date"] <= actual_date]
     return df
@@ -193,62 +384,83 @@ def prepare_values_according_to_result_dim(
     df: pd.DataFrame, result_dim: str, actual_date: str,
 ) -> pd.DataFrame:
     """Prepare the `value` column according to the selected result
-    dimension. If other than the default "Monat" temporarily set aside
-    all kpis that cannot be cumulated, then calculate a sum for a
-    rolling window of desired length and re-append the "no_sum_kpi".
+    dimension. If other than the default "Monat" calculate a sum for a
+    rolling window of desired length for each series separately (so no
+    window reaches into the previous series) in one vectorized pass over
+    a (series x month) array. The kpis that cannot be cumulated keep
+    their monthly values. The row order is not changed.
     """
     if result_dim == "Monat":
-        pass
-    else:
-        df_sum = df.loc[~df["kpi_name"].isin(data_dicts.NO_SUM_KPI)].copy()
-        df_no_sum = df.loc[df["kpi_name"].isin(data_dicts.NO_SUM_KPI)]
-        assert (len(df_sum) + len(df_no_sum)) == len(df)
+        return df
 
-        if result_dim == "Year To Date":
-            n_months = dt.datetime.strptime(actual_date, "%Y-%m-%d").month
-        else:
-            n_months = data_dicts.RESULT_DIM_DICT[result_dim]
+    n_months = return_n_months_for_result_dim(result_dim, actual_date)
+    series, month, shape = series_month_positions(df)
+    values = np.full(shape, np.nan)
+    values[series, month] = df["value"].to_numpy()
+    rolled = rolling_window_sum(values, n_months)[series, month]
 
-        df_sum["value"] = df_sum["value"].rolling(window=n_months).sum()
-        df = pd.concat([df_sum, df_no_sum], axis=0)
-    return df
+    no_sum = df["kpi_name"].isin(data_dicts.NO_SUM_KPI).to_numpy()
+    return df.assign(value=np.where(no_sum, df["value"].to_numpy(), rolled))
+
+
+def return_n_months_for_result_dim(result_dim: str, actual_date: str) -> int:
+    """Return the window length in months for a result dimension other
+    than "Monat". For "Year To Date" it is the month of the actual date.
+    """
+    if result_dim == "Year To Date":
+        return dt.datetime.strptime(actual_date, "%Y-%m-%d").month
+    return data_dicts.RESULT_DIM_DICT[result_dim]
+
+
+def can_look_up_result_dim(actual_date: str, n_years: int, result_dim: str) -> bool:
+    """Return True if the result dim columns materialized over the whole
+    history (see `preprocess.add_result_dim_columns`) are the same as the
+    values calculated on the history truncated to `n_years` before the
+    actual date, i.e. the window and the 12 month lag of the diff fit
+    into the truncated history.
+    """
+    n_months = 1
+    if result_dim != "Monat":
+        n_months = return_n_months_for_result_dim(result_dim, actual_date)
+    return n_years * 12 >= n_months + 12
 
 
 @logging_runtime
 # @st.cache()
 def replace_monthly_values_with_avg(df: pd.DataFrame, result_dim: str, avg_bool: bool):
+    """Return a dataframe without the `value_avg` column. If `avg_bool`
+    is True, its values replace the ones in the `value` column. (Works
+    on a new frame, the input can be a view on the cached base data.)
+    """
     if avg_bool:
         assert result_dim == "Monat", "Uups, wrong result dim for averages."
-        df["value"] = df["value_avg"]
-    df.drop("value_avg", axis=1, inplace=True)
-    return df
+        df = df.assign(value=df["value_avg"])
+    return df.drop(columns="value_avg")
 
 
 @logging_runtime
 # @st.cache()
-def calculate_diff_column(df: pd.DataFrame, n_months_diff: int = 12) -> pd.DataFrame:
+def calculate_diff_column(
+    df: pd.DataFrame, n_months_diff: Union[int, Dict[str, int]] = 12
+) -> pd.DataFrame:
     """Calculate the %-difference for the KPI values between two
     periods and write it into a new colum. Return a new dataframe.
-    The period lag defaults to 12 months.
+    The period lag defaults to 12 months. Pass a dict of column name and
+    lag to get several diff columns at once (e.g. previous month and
+    year), the values are then laid out in a (series x month) array only
+    once. Unreasonable diff values (e.g. for new products) are capped.
     """
-    df_diff = df.copy()
-    df_diff["temp_index"] = pd.to_datetime(
-        df_diff["calculation_date"], format="%Y-%m-%d"
+    if isinstance(n_months_diff, int):
+        n_months_diff = {"diff_value": n_months_diff}
+    series, month, shape = series_month_positions(df)
+    values = np.full(shape, np.nan)
+    values[series, month] = df["value"].to_numpy(dtype=np.float64)
+    diffs = lagged_pct_changes(values, n_months_diff.values())
+
+    # (No copy of the frame needed, the new columns are added to a view)
+    return df.reset_index(drop=True).assign(
+        **{col: diffs[lag][series, month] for col, lag in n_months_diff.items()}
     )
-    df_diff.set_index("temp_index", inplace=True)
-
-    df_diff["diff_value"] = df_diff.groupby(
-        ["kpi_name", "period_id", "level", "product_name", "mandant", "cardprofile"]
-    )["value"].pct_change(n_months_diff, fill_method=None)
-
-    df_diff.reset_index(drop=True, inplace=True)
-
-    # Capp unreasonalbe diff values (e.g. for new products)
-    df_diff["diff_value"] = df_diff["diff_value"].apply(
-        lambda x: np.nan if not abs(x) < 100 else x
-    )
-
-    return df_diff
 
 
 @logging_runtime
@@ -263,6 +475,47 @@ def create_df_with_actual_period_only(
     return df
 
 
+@logging_runtime
+def create_df_with_actual_period_from_cube(
+    kpi_cube: KpiCube,
+    actual_date: str,
+    n_years: int,
+    result_dim: str,
+    avg_bool: bool,
+) -> pd.DataFrame:
+    """Run the steps from `truncate_data_n_years_back` up to
+    `create_df_with_actual_period_only` as vectorized slice and axis
+    operations on the KPI cube. Only the actual period is converted
+    back to a dataframe (with the same columns as the dataframe version).
+    If the values for the result dim are materialized in the dataset
+    (see `preprocess.add_result_dim_columns`) they are only looked up,
+    as long as they do not reach before the `n_years` of history (see
+    `can_look_up_result_dim`).
+    """
+    if avg_bool:
+        assert result_dim == "Monat", "Uups, wrong result dim for averages."
+    value_col = "value_avg" if avg_bool else data_dicts.RESULT_DIM_COLUMNS[result_dim]
+    if f"diff_{value_col}" in kpi_cube.measures and can_look_up_result_dim(
+        actual_date, n_years, result_dim
+    ):
+        return (
+            kpi_cube.month_slice(actual_date)
+            .select_measures({"value": value_col, "diff_value": f"diff_{value_col}"})
+            .to_frame()
+        )
+
+    # (Without the materialized columns, they are not truncated)
+    kpi_cube = kpi_cube.select_measures({"value": "value", "value_avg": "value_avg"})
+    kpi_cube = kpi_cube.truncate(actual_date, n_years)
+    if result_dim != "Monat":
+        n_months = return_n_months_for_result_dim(result_dim, actual_date)
+        kpi_cube = kpi_cube.with_rolling_sum(n_months)
+    if avg_bool:
+        kpi_cube = kpi_cube.with_measure("value", kpi_cube.measures["value_avg"])
+    kpi_cube = kpi_cube.without_measure("value_avg").with_diff(12)
+    return kpi_cube.month_slice(actual_date).to_frame()
+
+
 # FILTERING FOR MANDANT AND KPI GROUPS (HIGH LEVEL, SIDEBAR)
 
 
@@ -299,9 +552,12 @@ def get_filter_options_for_kpi_groups() -> List:
 def filter_for_sidebar_selections_mandant(
     df: pd.DataFrame,
     filter_mandant_groups: str,
+    dim_index: Optional[DimensionIndex] = None,
 ) -> pd.DataFrame:
     """Return the dataframe filtered for the necessary `level`
     depending on selected product dim, mandant group and display view.
+    If a `dim_index` of the (unfiltered) dataframe is passed, the rows
+    are looked up in the index instead of comparing the columns.
     """
     mandant = None
     # if filter_product_dim == "Produkt":
@@ -322,6 +578,16 @@ def filter_for_sidebar_selections_mandant(
         agg_level = [2, 3]
         mandant = filter_mandant_groups
 
+    if dim_index is not None:
+        if mandant:
+            dim_positions = dim_index.lookup("mandant", [mandant])
+        else:
+            dim_positions = dim_index.lookup("sector", sector)
+        positions = dim_index.intersect(
+            dim_index.lookup("level", agg_level), dim_positions
+        )
+        return dim_index.take(df, positions)
+
     if mandant:
         return df.loc[
             (df["level"].isin(agg_level))
@@ -337,12 +603,24 @@ def filter_for_sidebar_selections_mandant(
 @logging_runtime
 # @st.cache()
 def filter_for_sidebar_selections_kpi(
-    df: pd.DataFrame, filter_kpi_groups: str
+    df: pd.DataFrame,
+    filter_kpi_groups: str,
+    dim_index: Optional[DimensionIndex] = None,
 ) -> pd.DataFrame:
     """Return a dataframe filtered for `kpi_name` belonging to the
     selected kpi group. If not "[alle]" is selected, the filtering
     is done with `str.startswith()` using the KPI_GROUP.values().
+    With a `dim_index` the rows of the group are looked up instead.
     """
+    if dim_index is not None:
+        if filter_kpi_groups == "[alle]":
+            return df
+        positions = dim_index.lookup_kpi_group(
+            data_dicts.KPI_GROUPS[filter_kpi_groups],
+            exclude=(filter_kpi_groups == "[alle] ohne NCA"),
+        )
+        return dim_index.take(df, positions)
+
     if filter_kpi_groups == "[alle]":
         kpi_options = list(df["kpi_name"].unique())
     elif filter_kpi_groups == "[alle] ohne NCA":
@@ -388,13 +666,25 @@ def get_filter_options_for_kpi(df: pd.DataFrame) -> List:
 def filter_for_entity_and_kpi(
     df: pd.DataFrame,
     filter_entity: List[str],
-    filter_kpi: List[str]
+    filter_kpi: List[str],
+    dim_index: Optional[DimensionIndex] = None,
 ) -> pd.DataFrame:
     """Filter df according to the user choices for entity and kpi.
     Only if "[alle]" is the only value in the multi-select it actually
     selects all entities. For the moment this is the desired behaviour.
+    With a `dim_index` the rows are looked up in the index.
     TODO: Check if behaviour of "[alle]" could be improved (low prio).
     """
+    if dim_index is not None:
+        positions = []
+        if filter_entity != ["[alle]"]:
+            positions.append(dim_index.lookup("product_name", filter_entity))
+        if filter_kpi != ["[alle]"]:
+            positions.append(dim_index.lookup("kpi_name", filter_kpi))
+        if not positions:
+            return df
+        return dim_index.take(df, dim_index.intersect(*positions))
+
     if filter_entity != ["[alle]"]:
         df = df.loc[df["product_name"].isin(filter_entity)]
     if filter_kpi != ["[alle]"]:
@@ -411,7 +701,8 @@ def create_dict_of_df_for_each_kpi(
     dict with that value as key and the respective df slice as value.
     """
     display_dict = {
-        kpi: df_slice for kpi, df_slice in df.groupby("kpi_name", sort=False)
+        kpi: df_slice
+        for kpi, df_slice in df.groupby("kpi_name", sort=False, observed=True)
     }
     return display_dict
 
@@ -425,7 +716,8 @@ def create_dict_of_df_for_each_entity(
     dict with that value as key and the respective df slice as value.
     """
     display_dict = {
-        entity: df_slice for entity, df_slice in df.groupby("product_name")
+        entity: df_slice
+        for entity, df_slice in df.groupby("product_name", observed=True)
     }
     return display_dict
 
@@ -437,13 +729,13 @@ def prepare_for_display(df: pd.DataFrame, filter_display_mode: str) -> pd.DataFr
     columns for display depending on the selected display filter mode.
     """
     if filter_display_mode.endswith("KPI"):
-        display_df = df[["kpi_name", "product_name", "value", "diff_value"]].copy()
-        display_df.set_index("kpi_name", inplace=True)
+        display_df = df[["kpi_name", "product_name", "value", "diff_value"]]
+        display_df = display_df.set_index("kpi_name")
         display_df.columns = ["Entität", "Wert", "Abw VJ"]
 
     else:
-        display_df = df[["product_name", "kpi_name", "value", "diff_value"]].copy()
-        display_df.set_index("product_name", inplace=True)
+        display_df = df[["product_name", "kpi_name", "value", "diff_value"]]
+        display_df = display_df.set_index("product_name")
         display_df.columns = ["KPI", "Wert", "Abw VJ"]
 
     # display_df = display_df.reset_index(drop=True)
@@ -469,7 +761,7 @@ def display_dataframes(
     else:
         value_fmt = "{:,.0f}"
 
-    for k, v in df.groupby(df.index, sort=False):
+    for k, v in df.groupby(df.index, sort=False, observed=True):
         st.write(f"**{k}**")
         # TODO the comment in the next line is a hack to get rid of the index
         v = v.reset_index(drop=True)  # v.set_index("KPI", inplace=True)
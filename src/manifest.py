@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+import helpers
+
+# Version of the manifest layout, older manifests are ignored by the app
+MANIFEST_VERSION = 1
+
+
+class DatasetManifest:
+    """Metadata of a published dataset that never changes until the next
+    preprocessing run: the date list, the max date, the years available
+    and the mandant groups per date, the entity and KPI options of every
+    combination of date, mandant group and KPI group, row counts and a
+    hash of the content. It is written by the preprocessing next to the
+    data (see `save_manifest`) and read by the backends instead of
+    scanning the data on every rerun.
+
+    The manifest is only used for the data files it lists (checksums of
+    the files, see `load_manifest`).
+    """
+
+    def __init__(self, content: Dict[str, Any]):
+        self.content = content
+
+    @property
+    def content_hash(self) -> str:
+        return self.content["content_hash"]
+
+    @property
+    def max_date(self) -> str:
+        return self.content["max_date"]
+
+    @property
+    def n_rows(self) -> int:
+        return self.content["n_rows"]
+
+    def date_options(self, n_months_min: int = 12) -> List[str]:
+        """See `helpers.get_filter_options_for_due_date`."""
+        return helpers.remove_oldest_dates(self.content["dates"], n_months_min)
+
+    def n_years_available(self, actual_date: str) -> int:
+        """See `helpers.calculate_max_n_years_available`."""
+        try:
+            return self.content["n_years"][actual_date]
+        except KeyError:
+            raise ValueError("Something went wrong. Not enough data periods loaded.")
+
+    def mandant_options(self, actual_date: str) -> List[str]:
+        """See `helpers.get_filter_options_for_mandant_groups`."""
+        return list(self.content["mandant_groups"][actual_date])
+
+    def entity_and_kpi_options(
+        self, actual_date: str, filter_mandant: str, filter_kpi_groups: str
+    ) -> Optional[Dict[str, Any]]:
+        """Return the entity and KPI options (see
+        `helpers.get_filter_options_for_entities` and `_kpi`) and the
+        number of rows of the actual period for the sidebar selections,
+        None if the combination is not in the manifest.
+        """
+        options = self.content["options"].get(
+            _return_options_key(actual_date, filter_mandant, filter_kpi_groups)
+        )
+        if options is None:
+            return None
+        entity_names = self.content["entity_names"]
+        kpi_names = self.content["kpi_names"]
+        return {
+            "entities": ["[alle]"] + [entity_names[i] for i in options["entities"]],
+            "kpis": ["[alle]"] + [kpi_names[i] for i in options["kpis"]],
+            "n_rows": options["n_rows"],
+        }
+
+
+def create_manifest(df: pd.DataFrame) -> Dict[str, Any]:
+    """Return the content of the manifest for the dataset `df` (as it is
+    saved, with the column types of the DATASET_SCHEMA). The options are
+    created with the same helpers functions the app uses on the data,
+    for all dates with at least one year of history. The entities and
+    kpi of the options are stored as positions in the name lists.
+    """
+    dates = helpers.return_full_date_list(df)
+    entity_names, kpi_names = [], []
+    entity_positions, kpi_positions = {}, {}
+    content = {
+        "manifest_version": MANIFEST_VERSION,
+        "content_hash": return_content_hash(df),
+        "n_rows": len(df),
+        "max_date": helpers.return_max_date_string(df),
+        "dates": dates,
+        "n_years": {},
+        "mandant_groups": {},
+        "entity_names": entity_names,
+        "kpi_names": kpi_names,
+        "options": {},
+    }
+    kpi_groups = helpers.get_filter_options_for_kpi_groups()
+    for actual_date in dates[: len(dates) - 12]:
+        df_truncated = helpers.truncate_data_to_actual_date(df, actual_date)
+        content["n_years"][actual_date] = helpers.calculate_max_n_years_available(
+            df_truncated
+        )
+        df_actual = helpers.create_df_with_actual_period_only(df, actual_date)
+        mandant_groups = helpers.get_filter_options_for_mandant_groups(df_actual)
+        content["mandant_groups"][actual_date] = mandant_groups
+        for filter_mandant in mandant_groups:
+            df_mandant = helpers.filter_for_sidebar_selections_mandant(
+                df_actual, filter_mandant
+            )
+            for filter_kpi_groups in kpi_groups:
+                df_kpi = helpers.filter_for_sidebar_selections_kpi(
+                    df_mandant, filter_kpi_groups
+                )
+                entities = helpers.get_filter_options_for_entities(df_kpi)[1:]
+                kpis = helpers.get_filter_options_for_kpi(df_kpi)[1:]
+                key = _return_options_key(
+                    actual_date, filter_mandant, filter_kpi_groups
+                )
+                content["options"][key] = {
+                    "entities": _return_positions(
+                        entities, entity_names, entity_positions
+                    ),
+                    "kpis": _return_positions(kpis, kpi_names, kpi_positions),
+                    "n_rows": len(df_kpi),
+                }
+    return content
+
+
+def return_content_hash(df: pd.DataFrame) -> str:
+    """Return a SHA-256 of the values of the dataset (independent of the
+    file format, the same as long as the data does not change).
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    content_hash = hashlib.sha256(row_hashes.tobytes())
+    content_hash.update(json.dumps([str(col) for col in df.columns]).encode("utf-8"))
+    return content_hash.hexdigest()
+
+
+def save_manifest(
+    content: Dict[str, Any], path: str, data_files: Optional[List[str]] = None
+):
+    """Save the manifest next to the data files of `path`, for the data
+    files with the checksums in `data_files` (by default the data files
+    of `path` that exist now).
+    """
+    if data_files is None:
+        data_files = return_data_file_checksums(path)
+    content = dict(content, data_files=data_files)
+    manifest_path = return_manifest_path(path)
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_manifest(path: str) -> Optional[DatasetManifest]:
+    """Return the manifest of the data in `path`, or None if there is
+    none or it is not for the data file that will be loaded.
+    """
+    try:
+        with open(return_manifest_path(path), encoding="utf-8") as f:
+            content = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        content.get("manifest_version") != MANIFEST_VERSION
+        or helpers.return_dataset_checksum(path) not in content["data_files"]
+    ):
+        return None
+    return DatasetManifest(content)
+
+
+def publish_data_file(
+    content: Dict[str, Any], path: str, tmp_path: Path, data_path: Path
+):
+    """Publish a data file of `path` that was written to `tmp_path` under
+    its name `data_path`: its checksum is added to the data files of the
+    manifest `content` and the manifest is saved before the file is
+    renamed. An app loading the data in between finds the old file,
+    for which the manifest is not valid anymore, or the new file with
+    its manifest.
+    """
+    content.setdefault("data_files", []).append(helpers.return_file_checksum(tmp_path))
+    save_manifest(content, path, content["data_files"])
+    os.replace(tmp_path, data_path)
+
+
+def return_manifest_path(path: str) -> Path:
+    """Return the path of the manifest for the data in `path` (the same
+    for all formats of the data).
+    """
+    return Path(path).with_suffix(".manifest.json")
+
+
+def return_data_file_checksums(path: str) -> List[str]:
+    """Return the checksums of all data files of `path`."""
+    checksums = []
+    for suffix in helpers.DATA_FORMATS:
+        data_path = Path(path).with_suffix(suffix)
+        if helpers.return_dataset_version(data_path)[1]:
+            checksum = helpers.return_dataset_checksum(str(data_path))
+            if checksum not in checksums:
+                checksums.append(checksum)
+    return checksums
+
+
+def _return_options_key(
+    actual_date: str, filter_mandant: str, filter_kpi_groups: str
+) -> str:
+    return f"{actual_date}|{filter_mandant}|{filter_kpi_groups}"
+
+
+def _return_positions(
+    values: List[str], names: List[str], positions: Dict[str, int]
+) -> List[int]:
+    """Return the positions of the `values` in `names`, new values are
+    added to `names`. (This is called within `create_manifest`.)
+    """
+    for value in values:
+        if value not in positions:
+            positions[value] = len(names)
+            names.append(value)
+    return [positions[value] for value in values]
@@ -1,5 +1,6 @@
 import datetime as dt
-from typing import List, Tuple, Union
+import functools
+from typing import Callable, List, Optional, Tuple, Union
 
 import pandas as pd
 import plotly.express as px
@@ -86,9 +87,11 @@ def _add_growth_col(df_plot: pd.DataFrame) -> pd.DataFrame:
     not to have a 'spill over' from one entity's last month to another
     entity's first month. This is called within `create_df_plot`.
     """
-    df_plot = df_plot.assign(Abw_VM=df_plot.groupby(["KPI", "Entität"])
-                             ["Wert"].transform("pct_change")
-                             )
+    df_plot = df_plot.assign(
+        Abw_VM=df_plot.groupby(["KPI", "Entität"], observed=True)["Wert"].transform(
+            "pct_change"
+        )
+    )
     df_plot = df_plot.rename(columns={"Abw_VM": "Abw VM"})
     return df_plot
 
@@ -167,22 +170,30 @@ def create_plotly_figure_with_two_kpis_facet(df_plot: pd.DataFrame, kpi_for_plot
     return fig
 
 
-def main(data: pd.DataFrame, data_truncated: pd.DataFrame):
+def main(
+    data: pd.DataFrame,
+    data_truncated: pd.DataFrame,
+    load_df_plot: Optional[Callable] = None,
+):
+    """Return the figure and the df_plot if the selected data can be
+    plotted, otherwise (None, None). If `load_df_plot` is given, the
+    df_plot is returned by `load_df_plot(kpi_for_plot, entities_for_plot,
+    level_for_plot)` (e.g. from the cache of the backend) instead of
+    being created from `data_truncated`.
+    """
     kpi_for_plot, entities_for_plot, level_for_plot = get_dimensions_for_plot(
         data
     )
+    if load_df_plot is None:
+        load_df_plot = functools.partial(create_df_plot, data_truncated)
     check_result = check_if_plot(kpi_for_plot, entities_for_plot)
     if check_result == 1:
-        df_plot = create_df_plot(
-            data_truncated, kpi_for_plot, entities_for_plot, level_for_plot
-        )
+        df_plot = load_df_plot(kpi_for_plot, entities_for_plot, level_for_plot)
         fig = create_plotly_figure_with_one_kpi(df_plot, kpi_for_plot)
         return fig, df_plot
 
     elif check_result == 2:
-        df_plot = create_df_plot(
-            data_truncated, kpi_for_plot, entities_for_plot, level_for_plot
-        )
+        df_plot = load_df_plot(kpi_for_plot, entities_for_plot, level_for_plot)
         if check_if_facet_or_not(kpi_for_plot):
             fig = create_plotly_figure_with_two_kpis(df_plot, kpi_for_plot)
         else:
@@ -1,14 +1,21 @@
+import argparse
 import datetime as dt
 import logging
 import logging.config
+import os
+import string
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+import pyarrow as pa
+from sqlalchemy import create_engine, text
 
+import cube
 import data_dicts
+from view_cache import DiskViewCache, view_cache_dir
 
 LOGGING_CONFIG = (Path(__file__).parent.parent / "logging.conf").absolute()
 logging.config.fileConfig(fname=LOGGING_CONFIG, disable_existing_loggers=False)
@@ -16,60 +23,235 @@ logger = logging.getLogger("preprocessLogger")
 
 SERVER = "JES2010HA01\\HA01,57226"
 DB_NAME = "KF_CORE"
+# Years of history to load (plus the actual month)
+N_YEARS_BACK = 3
+
+# Column types of the streaming extraction (see `create_df`), all other
+# columns are kept as python objects (strings)
+EXTRACT_DTYPES = {"kpi_id": "int64", "period_id": "int64", "value": "float64"}
+EXTRACT_CHUNK_SIZE = 50_000
+# The months are extracted in partitions of this size, by (at most) this
+# number of parallel queries, see `create_df_partitioned`
+EXTRACT_PARTITION_MONTHS = 10
+EXTRACT_MAX_WORKERS = 4
+# If set, the values are loaded as fixed-point numbers with this number of
+# decimals (integers, the sums of the levels are then exact) and only
+# scaled back after the aggregation, see `unscale_value_column`
+VALUE_DECIMALS = None
+# Relative tolerance for the sums in the sanity checks of the aggregation
+SUM_CHECK_RTOL = 1e-9
+# Columns that every level is grouped by, in addition to the entity columns
+LEVEL_KEYS = ["calculation_date", "kpi_id", "kpi_name", "period_id"]
+
+# The cleaned rows of the last extraction, kept for the incremental mode
+EXTRACTED_ROWS_PATH = "./data/extracted_rows.parquet"
+# Months before the last month of the previous data that are extracted again
+# in the incremental mode (in case they were corrected in the DB)
+RESTATEMENT_MONTHS = 1
+# Months before a row that its result dims depend on: the longest window
+# (12 months) and the lag of the diffs (12 months), see `update_dataset`
+RESULT_DIM_LOOK_BACK = 12 + 12 - 1
+# Columns identifying a product level series in the cleaned rows
+SERIES_COLS = [
+    "kpi_name", "period_id", "product_name", "cardprofile", "mandant", "sector"
+]
 
 
 def connect_to_engine(server: str, db_name: str) -> Any:
     """Assemble a connection string, connect to the db engine and
     return a connection object.
     """
-    con_string = f"mssql+pyodbc://@{server}/{db_name}?driver=SQL Server"
-    engine = create_engine(con_string)
-    connection = engine.connect()
+    connection = create_db_engine(server, db_name).connect()
     return connection
 
 
-def read_query(file_path: str, n_years_back: int = 3) -> str:
+def create_db_engine(server: str, db_name: str) -> Any:
+    """Return the db engine, its connection pool has a connection for
+    every worker of the partitioned extraction.
+    """
+    con_string = f"mssql+pyodbc://@{server}/{db_name}?driver=SQL Server"
+    return create_engine(con_string, pool_size=EXTRACT_MAX_WORKERS)
+
+
+def read_query(file_path: str, n_years_back: int = N_YEARS_BACK) -> str:
     """Open the sql-query file, parse and return the query while
     replacing the placeholder with the value of the n years
     you want to get the data back for (defaults to 3).
     """
-    with open(file_path, "r", encoding="utf-8-sig") as file:
-        query = file.read()
+    query = read_sql(file_path)
     query = query.replace("@n_years_back", str(n_years_back))
     return query
 
 
-def create_df(query, connection):
+def read_sql(file_path: str) -> str:
+    """Return the content of the sql file, e.g. a query with bind
+    parameters (`:name`) whose values are passed at execution.
+    """
+    with open(file_path, "r", encoding="utf-8-sig") as file:
+        return file.read()
+
+
+def create_df(
+    query,
+    connection,
+    chunk_size: Optional[int] = None,
+    value_decimals: Optional[int] = None,
+    params: Optional[dict] = None,
+):
     """Read the data from the db and return a dataframe with
-    correct datatpyes (is `decimal` for value column).
+    correct datatpyes (is `decimal` for value column). The `params`
+    are the values of the bind parameters of the query (if any).
+
+    If a `chunk_size` is passed, the rows are streamed from a server-side
+    cursor instead and every chunk of rows is converted directly to typed
+    column arrays (see EXTRACT_DTYPES, `value` is float64 then). Like this
+    only one chunk of row objects is in memory at any time. With
+    `value_decimals` the values are scaled to fixed-point integers
+    (e.g. cents for 2 decimals), kept in the float64 column so that missing
+    values can still be NaN. Sums of them are exact (up to 2**53). This
+    is done with or without `chunk_size`.
     """
-    result = connection.execute(query).fetchall()
-    df = pd.DataFrame(result, columns=result[0].keys())
-    # df["value"] = pd.to_numeric(df["value"], errors="raise", downcast="float")
-    return df
+    execute_args = (query,) if params is None else (query, params)
+    if chunk_size is None:
+        result = connection.execute(*execute_args).fetchall()
+        df = pd.DataFrame(result, columns=result[0].keys())
+        # df["value"] = pd.to_numeric(df["value"], errors="raise", downcast="float")
+        if value_decimals is not None:
+            values = _to_column_array(df["value"], "value", {})
+            df["value"] = np.round(values * 10 ** value_decimals)
+        return df
+
+    result = connection.execution_options(stream_results=True).execute(*execute_args)
+    columns = list(result.keys())
+    arrays = {col: [] for col in columns}
+    # One object per distinct string, not one per row
+    distinct = {col: {} for col in columns}
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            for col, values in zip(columns, zip(*rows)):
+                array = _to_column_array(values, col, distinct[col])
+                if col == "value" and value_decimals is not None:
+                    array = np.round(array * 10 ** value_decimals)
+                arrays[col].append(array)
+    finally:
+        result.close()
+    if not arrays[columns[0]]:
+        raise ValueError("Uups, the query did not return any rows.")
+    return pd.DataFrame({col: np.concatenate(chunks) for col, chunks in arrays.items()})
+
+
+def create_df_partitioned(
+    engine: Any,
+    periods_query: str,
+    query: str,
+    params: Optional[dict] = None,
+    months_per_partition: int = EXTRACT_PARTITION_MONTHS,
+    max_workers: int = EXTRACT_MAX_WORKERS,
+    chunk_size: Optional[int] = EXTRACT_CHUNK_SIZE,
+    value_decimals: Optional[int] = None,
+) -> pd.DataFrame:
+    """Return the same dataframe as `create_df`, but extracted in
+    partitions of months that are queried in parallel. The
+    `periods_query` returns the periods (yyyymm) to load, they are
+    split into partitions of `months_per_partition` and every partition
+    is loaded with `query` (with the bind parameters `first_period` and
+    `last_period` in addition to the `params`). At most `max_workers`
+    queries run at the same time, each on its own connection of the
+    `engine`. The partitions are concatenated in the order of the periods.
+    """
+    params = params or {}
+    with engine.connect() as connection:
+        result = connection.execute(text(periods_query), params)
+        periods = sorted(row[0] for row in result)
+    if not periods:
+        raise ValueError("Uups, the query did not return any rows.")
+    partitions = [
+        periods[i : i + months_per_partition]
+        for i in range(0, len(periods), months_per_partition)
+    ]
+    logger.info(
+        f"Extracting {len(periods)} months in {len(partitions)} partitions "
+        f"({max_workers} in parallel) ..."
+    )
+
+    def _extract_partition(partition: List[int]) -> pd.DataFrame:
+        partition_params = {
+            **params,
+            "first_period": partition[0],
+            "last_period": partition[-1],
+        }
+        with engine.connect() as connection:
+            return create_df(
+                text(query), connection, chunk_size, value_decimals, partition_params
+            )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(_extract_partition, partitions))
+    return pd.concat(dfs, ignore_index=True)
+
+
+def create_df_with_levels(
+    engine: Any,
+    query: str,
+    params: Optional[dict] = None,
+    chunk_size: Optional[int] = EXTRACT_CHUNK_SIZE,
+    value_decimals: Optional[int] = None,
+) -> pd.DataFrame:
+    """Return the rows of all levels aggregated in the DB with the `query`
+    (see get_level_results_for_kpi_sheet.sql and `clean_extracted_level_rows`).
+    The PRODUCT_LOOK_UP (in the `data_dicts` module) is written into the
+    temporary table `#product_look_up` first, it is joined in the query.
+    (The table is dropped when the connection is closed.)
+    """
+    look_up = pd.DataFrame.from_dict(data_dicts.PRODUCT_LOOK_UP, orient="index")
+    look_up = look_up.rename_axis("product_name").reset_index()
+    with engine.connect() as connection:
+        look_up.to_sql("#product_look_up", connection, index=False)
+        return create_df(text(query), connection, chunk_size, value_decimals, params)
+
+
+def _to_column_array(values: tuple, col: str, distinct: dict) -> np.ndarray:
+    """Return the values of one column of a chunk as numpy array with the
+    type from EXTRACT_DTYPES (None becomes NaN for floats). Other columns
+    get an object array that re-uses the objects in `distinct`.
+    (This is called within `create_df`.)
+    """
+    if col in EXTRACT_DTYPES:
+        return np.array(values, dtype=EXTRACT_DTYPES[col])
+    array = np.empty(len(values), dtype=object)
+    array[:] = [distinct.setdefault(value, value) for value in values]
+    return array
 
 
 def create_calculation_date_column(df: pd.DataFrame) -> pd.DataFrame:
     """Replace the `period_value`with a "calculation date" that is
     set to the last day of the same month. (Note: this is not equal
-    to the actual calculation date as defined in the DB.)
+    to the actual calculation date as defined in the DB.) The dates are
+    only parsed once per distinct period (there are just a few).
     """
-    df["period_value"] = pd.to_datetime(df["period_value"], format="%Y%m")
-    df["period_value"] = df["period_value"].apply(lambda x: _get_last_day_of_month(x))
+    codes, periods = pd.factorize(df["period_value"])
+    month_ends = pd.to_datetime(periods, format="%Y%m") + pd.offsets.MonthEnd(0)
+    df = df.assign(period_value=month_ends[codes])
     return df.rename(columns={"period_value": "calculation_date"},)
 
 
-def _get_last_day_of_month(some_date):
-    """Return date of last day of the same month for a datetime object."""
-    next_month = some_date.replace(day=28) + dt.timedelta(
-        days=4
-    )  # this will never fail
-    return next_month - dt.timedelta(days=next_month.day)
-
-
 def trim_strings(df: pd.DataFrame) -> pd.DataFrame:
-    """Trim whitespace from right end of every string in the dataframe."""
-    df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    """Trim whitespace from both ends of every string in the dataframe.
+    This is done column-wise for the object columns only, vectorized for
+    the columns of strings (missing values are kept as they are). Other
+    object columns (e.g. the `Decimal` values of the DB) are mapped
+    value by value, only their strings are trimmed.
+    """
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) == "string":
+            trimmed = df[col].str.strip()
+            df[col] = trimmed.where(trimmed.notna(), df[col])
+        else:
+            df[col] = df[col].map(lambda x: x.strip() if isinstance(x, str) else x)
     return df
 
 
@@ -84,33 +266,44 @@ def get_rid_of_invalid_entries(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def prettify_kpi_names(df: pd.DataFrame) -> pd.DataFrame:
-    """Cosmetics. Note: Replacing parantheses is a pain ..."""
-    df["kpi_name"] = df["kpi_name"].str.replace("gueltig", "gültig")
-    df["kpi_name"] = (
-        df["kpi_name"]
-        .str.replace("(", "")
+    """Cosmetics. Note: Replacing parantheses is a pain ... (This is
+    done once per distinct name, then broadcast to the rows.)
+    """
+    codes, names = pd.factorize(df["kpi_name"], use_na_sentinel=False)
+    names = pd.Series(names).str.replace("gueltig", "gültig")
+    names = (
+        names.str.replace("(", "")
         .str.replace(")", "")
         .str.replace(" Monatl.", "")
     )
+    df["kpi_name"] = names.to_numpy()[codes]
     return df
 
 
 def add_mandant_sector_level_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Look-up `mandant` and `sector` values from the PRODUCT_LOOK_UP
     dict (in the `data_dicts` module.) and crate new columns. Raise
-    when there is a KeyError. Also create a `level` column with all
-    values set to '3' (-> 'prodcut level'). Return transformed df.
+    when there is a KeyError (listing all the unknown products). Also
+    create a `level` column with all values set to '3' (-> 'prodcut level').
+    Return transformed df.
     """
-    try:
-        df["mandant"] = df["product_name"].apply(
-            lambda x: data_dicts.PRODUCT_LOOK_UP[x]["mandant"]
-        )
-        df["sector"] = df["product_name"].apply(
-            lambda x: data_dicts.PRODUCT_LOOK_UP[x]["sector"]
+    # Look-up once per distinct product, then broadcast to the rows
+    codes, products = pd.factorize(df["product_name"])
+    look_up = pd.DataFrame(
+        [data_dicts.PRODUCT_LOOK_UP.get(product, {}) for product in products],
+        columns=["mandant", "sector"],
+    )
+    unknown = sorted(products[look_up["mandant"].isna().to_numpy()])
+    if unknown:
+        raise KeyError(
+            f"Loaded products not in PRODUCT_LOOK_UP. LOOK_UP has to be updated!: "
+            f"{unknown}"
         )
-    except KeyError as e:
-        print(f"Loaded product not in PRODUCT_LOOK_UP. LOOK_UP has to be updated!: {e}")
-    df["level"] = 3
+    df = df.assign(
+        mandant=look_up["mandant"].to_numpy()[codes],
+        sector=look_up["sector"].to_numpy()[codes],
+        level=3,
+    )
 
     # Sanity check
     if df.isna().sum().sum() != 0:
@@ -133,49 +326,63 @@ def create_max_date_dict(df: pd.DataFrame) -> Dict[str, pd.Timestamp]:
     return dict_max_date_per_entity
 
 
-def expand_dataframe_fully(df: pd.DataFrame) -> pd.DataFrame:
+def expand_dataframe_fully(
+    df: pd.DataFrame,
+    dict_max_date_per_entity: Optional[Dict[str, pd.Timestamp]] = None,
+    n_months: int = 12 * N_YEARS_BACK + 1,
+) -> pd.DataFrame:
     """Expand the dataframe to have a complete time series of
     `calculation_date` for each possible kpi, agg_level, profile combi.
     Non-existent `value` entries get a NaN entry. (This step is necessary
     to ensure correct difference calculation for the values in later
     stages - because in rare cases it is possible that some entities
     get no value for certain months. See old dev notebook's appendix for
-    details on this issue.)
-    """
-    months = pd.DataFrame(
-        {"calculation_date": sorted(df["calculation_date"].unique()), "merge_col": 0}
-    )
-
-    # All but `calculation_date` and `value`
-    rest = df.drop(["calculation_date", "value"], axis=1).drop_duplicates()
-    rest["merge_col"] = 0
+    details on this issue.) If the `dict_max_date_per_entity` is passed,
+    the rows after the max date of an entity are not generated at all
+    (see `reduce_dataframe_to_max_date_per_entity`).
 
-    temp_tbl = months.merge(rest, how="outer", on="merge_col")
-    temp_tbl = temp_tbl.drop(columns={"merge_col"})
-    temp_tbl = temp_tbl.sort_values(["kpi_id", "calculation_date"])
-
-    df = temp_tbl.merge(
-        df,
-        how="left",
-        on=[
-            "calculation_date",
-            "kpi_id",
-            "kpi_name",
-            "period_id",
-            "product_name",
-            "cardprofile",
-            "mandant",
-            "sector",
-            "level",
-        ],
-    ).reset_index(drop=True)
+    The rows are placed by their integer positions in a series x month
+    grid (no merges), `n_months` is the number of months that have to
+    be loaded (defaults to the N_YEARS_BACK plus the actual month).
+    """
+    # All but `calculation_date` and `value`. The series are sorted by their
+    # keys, so the order of the rows (and of the additions in the sums of
+    # the levels) does not depend on the order of the rows loaded
+    series_cols = df.columns.drop(["calculation_date", "value"]).tolist()
+    series_codes = df.groupby(series_cols, dropna=False).ngroup().to_numpy()
+    series = df[series_cols].iloc[np.unique(series_codes, return_index=True)[1]]
+    months = np.sort(df["calculation_date"].unique())
+    month_codes = np.searchsorted(months, df["calculation_date"].to_numpy())
 
     # Sanity check
-    if df.shape[0] / len(df.groupby(["product_name", "kpi_name"]).groups.keys()) != 37:
+    if len(months) != n_months:
         raise AssertionError(
-            "In case you did not load 3 years, something went wrong, please check!"
+            f"In case you did not load {n_months} months, something went wrong, "
+            "please check!"
         )
-    return df
+    # (Integer values become float for the NaN, like in a merge)
+    dtype = df["value"].dtype if df["value"].dtype.kind in "fO" else "float64"
+    values = np.full((len(series), len(months)), np.nan, dtype=dtype)
+    values[series_codes, month_codes] = df["value"].to_numpy()
+    is_loaded = np.zeros(values.shape, dtype=bool)
+    is_loaded[series_codes, month_codes] = True
+    if is_loaded.sum() != len(df):
+        raise AssertionError("Ups, duplicated rows in the df, please check!")
+
+    in_grid = np.ones(values.shape, dtype=bool)
+    if dict_max_date_per_entity is not None:
+        max_dates = pd.to_datetime(series["product_name"].map(dict_max_date_per_entity))
+        in_grid = ~(months[None, :] > max_dates.to_numpy()[:, None])
+
+    # Rows of the grid sorted by kpi, month and series
+    series_pos, month_pos = np.nonzero(in_grid)
+    order = np.lexsort([series_pos, month_pos, series["kpi_id"].to_numpy()[series_pos]])
+    series_pos, month_pos = series_pos[order], month_pos[order]
+
+    df_expanded = series.iloc[series_pos].reset_index(drop=True)
+    df_expanded.insert(0, "calculation_date", months[month_pos])
+    df_expanded["value"] = values[series_pos, month_pos]
+    return df_expanded
 
 
 def reduce_dataframe_to_max_date_per_entity(
@@ -184,15 +391,70 @@ def reduce_dataframe_to_max_date_per_entity(
     """For each entity drop all rows for calculation_dates that are
     larger than it's max date before the full expansion. So we make sure
     to display entities only that still exist(ed) at any point in time.
+    (The max dates are mapped to the rows, so this is a single pass
+    over the df. Entities without max date are kept.)
     """
-    for entity, date_ in dict_max_date_per_entity.items():
-        df.drop(
-            df.loc[
-                (df["product_name"] == entity) & (df["calculation_date"] > date_)
-            ].index,
-            inplace=True,
+    max_dates = pd.to_datetime(df["product_name"].map(dict_max_date_per_entity))
+    return df.loc[~(df["calculation_date"] > max_dates)]
+
+
+def create_level_rows(
+    df: pd.DataFrame, hierarchy: List[dict] = data_dicts.ENTITY_HIERARCHY
+) -> List[pd.DataFrame]:
+    """Return a dataframe with the aggregated values for each level of the
+    `hierarchy` (see ENTITY_HIERARCHY in the `data_dicts`), with the
+    columns of the product level values (the original input df) so that
+    they can be merged later on. All levels are built in one pass: each
+    one is summed up from the level before, not from the products again.
+    The values are always grouped per date and kpi, so the kpi that cannot
+    be summed up over time (NO_SUM_KPI, e.g. the number of accounts) are
+    still correct: they are only summed over the entities of one month.
+    """
+    df_levels = []
+    df_below, group_by_below = df, df.columns.tolist()
+    for level in hierarchy:
+        if not set(level["group_by"]) <= set(group_by_below):
+            raise ValueError(
+                f"Level {level['level']} is grouped by {level['group_by']}, this "
+                "is not possible from the level before."
+            )
+        df_g = (
+            df_below.groupby(LEVEL_KEYS + level["group_by"])["value"]
+            .sum()
+            .reset_index()
         )
-    return df
+        for col, template in level["entity"].items():
+            df_g[col] = _fill_template(df_g, template)
+        df_g["level"] = level["level"]
+        df_g = df_g.reindex(df.columns, axis=1)
+
+        # Sanity Check
+        _check_sum_of_values(df_g, df_below)
+        df_levels.append(df_g)
+        df_below, group_by_below = df_g, level["group_by"]
+    return df_levels
+
+
+def _fill_template(df: pd.DataFrame, template: str) -> Union[str, pd.Series]:
+    """Return the `template` string with the fields replaced by the values
+    of the columns with the same name (e.g. "{mandant} - Total"), as series.
+    A template without fields is returned as it is. (This is called within
+    `create_level_rows`.)
+    """
+    parts = list(string.Formatter().parse(template))
+    if all(field is None for _, field, _, _ in parts):
+        return template
+    result = ""
+    for literal, field, _, _ in parts:
+        result = result + literal
+        if field is not None:
+            result = result + df[field].astype(str)
+    return result
+
+
+def _level_in_hierarchy(level: int) -> List[dict]:
+    """Return the ENTITY_HIERARCHY entry for `level` (as list)."""
+    return [entry for entry in data_dicts.ENTITY_HIERARCHY if entry["level"] == level]
 
 
 def create_new_mandant_level_rows(df: pd.DataFrame) -> pd.DataFrame:
@@ -200,18 +462,7 @@ def create_new_mandant_level_rows(df: pd.DataFrame) -> pd.DataFrame:
     Add and fill the necessary columns so that it can be merged with the
     product level values (the original input df) later on.
     """
-    df_g = df.groupby(
-        ["calculation_date", "kpi_id", "kpi_name", "period_id", "mandant", "sector"]
-    )["value"].sum().reset_index()
-    df_g["product_name"] = df_g["mandant"] + " - Total"
-    df_g["cardprofile"] = "all"
-    df_g["level"] = 2
-    df_g = df_g.reindex(df.columns, axis=1)
-
-    # Sanity Check
-    if df_g["value"].sum() != df["value"].sum():
-        raise AssertionError("Ups, something went wrong, please check.")
-    return df_g
+    return create_level_rows(df, _level_in_hierarchy(2))[0]
 
 
 def create_new_sector_level_rows(df: pd.DataFrame) -> pd.DataFrame:
@@ -219,19 +470,7 @@ def create_new_sector_level_rows(df: pd.DataFrame) -> pd.DataFrame:
     Add and fill the necessary columns so that it can be merged with the
     product level values (the original input df) later on.
     """
-    df_g = df.groupby(
-        ["calculation_date", "kpi_id", "kpi_name", "period_id", "sector"]
-    )["value"].sum().reset_index()
-    df_g["mandant"] = df_g["sector"]
-    df_g["product_name"] = df_g["sector"] + " - Total"
-    df_g["cardprofile"] = "all"
-    df_g["level"] = 1
-    df_g = df_g.reindex(df.columns, axis=1)
-
-    # Sanity Check
-    if df_g["value"].sum() != df["value"].sum():
-        raise AssertionError("Ups, something went wrong, please check.")
-    return df_g
+    return create_level_rows(df, _level_in_hierarchy(1))[0]
 
 
 def create_new_overall_level_rows(df: pd.DataFrame) -> pd.DataFrame:
@@ -239,60 +478,353 @@ def create_new_overall_level_rows(df: pd.DataFrame) -> pd.DataFrame:
     Add and fill the necessary columns so that it can be merged with the
     product level values (the original input df) later on.
     """
-    df_g = df.groupby(
-        ["calculation_date", "kpi_id", "kpi_name", "period_id"]
-    )["value"].sum().reset_index()
-    df_g["mandant"] = "BCAG"
-    df_g["sector"] = "BCAG"
-    df_g["product_name"] = df_g["sector"] + " - Total"
-    df_g["cardprofile"] = "all"
-    df_g["level"] = 0
-    df_g = df_g.reindex(df.columns, axis=1)
+    return create_level_rows(df, _level_in_hierarchy(0))[0]
 
-    # Sanity Check
-    if df_g["value"].sum() != df["value"].sum():
-        raise AssertionError("Ups, something went wrong, please check.")
-    return df_g
 
+def _check_sum_of_values(df_g: pd.DataFrame, df: pd.DataFrame):
+    """Raise if the sum of the aggregated values is not the same as for
+    the input df. Float sums depend on the order of the additions, so
+    they are compared with a (very small) relative tolerance. (This is
+    called within `create_level_rows`.)
+    """
+    sum_g, sum_df = float(df_g["value"].sum()), float(df["value"].sum())
+    if not np.isclose(sum_g, sum_df, rtol=SUM_CHECK_RTOL, atol=0):
+        raise AssertionError(
+            f"Ups, something went wrong, please check. ({sum_g} vs. {sum_df})"
+        )
 
-def concatenate_all_levels(
-    df: pd.DataFrame,
-    df_mandant: pd.DataFrame,
-    df_sector: pd.DataFrame,
-    df_overall: pd.DataFrame,
-) -> pd.DataFrame:
+
+def concatenate_all_levels(df: pd.DataFrame, *df_levels: pd.DataFrame) -> pd.DataFrame:
     """Return a concactenated dataframe with all levels. """
-    return pd.concat([df, df_mandant, df_sector, df_overall], ignore_index=True)
+    return pd.concat([df, *df_levels], ignore_index=True)
 
 
-def add_avg_value_column(df):
+def unscale_value_column(
+    df: pd.DataFrame, value_decimals: Optional[int] = None
+) -> pd.DataFrame:
+    """Scale the fixed-point values (see `create_df`) back to their
+    decimal values. This is done after the aggregation of the levels.
+    Return the df unchanged if `value_decimals` is None.
+    """
+    if value_decimals is None:
+        return df
+    return df.assign(value=df["value"] / 10 ** value_decimals)
+
+
+def add_avg_value_column(df: pd.DataFrame) -> pd.DataFrame:
     """Add an 'value_avg' column where the total value is divided
     by the 'Aktive Konten' of the respective product-date combination.
-    If 'Aktive Konten' is missing, fill with np.nan.
+    If 'Aktive Konten' is missing, fill with np.nan. (The 'Aktive Konten'
+    are looked up once per product-date and broadcast to all rows, the
+    division is done for the whole column at once.)
+    """
+    keys = ["calculation_date", "product_name"]
+    is_active = df["kpi_name"] == "Anzahl aktive Konten Total"
+    n_active = (
+        df.loc[is_active, keys + ["value"]]
+        .drop_duplicates(subset=keys)
+        .set_index(keys)["value"]
+    )
+    n_active_per_row = n_active.reindex(pd.MultiIndex.from_frame(df[keys]))
+    values = df["value"].to_numpy(dtype="float64")
+    value_avg = (values + 0.001) / n_active_per_row.to_numpy(dtype="float64")
+    return df.assign(value_avg=value_avg)
+
+
+def add_result_dim_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the materialized values for every result dimension (e.g.
+    `value_3m` for "3 Monate rollierend", see `RESULT_DIM_COLUMNS` in the
+    `data_dicts`) and their 12 months %-difference, also for the monthly
+    `value` and the `value_avg`. Like this the app only has to look up
+    the columns for the selected result dim instead of re-calculating
+    them for every rerun.
     """
-    df_grouped = df.groupby(["calculation_date", "product_name"], sort=False)
-    df_w_avg = df_grouped.apply(_calc_avg_value)
-    # Sanity Check
-    assert df_w_avg.iloc[:, :-1].equals(df), "Uups, something went wrong."
-    return df_w_avg
+    df_result_dims = cube.result_dim_columns(df)
+    logger.info(f"Added {df_result_dims.shape[1]} materialized result dim columns.")
+    return pd.concat([df, df_result_dims], axis=1)
 
 
-def _calc_avg_value(df_chunk):
-    """Return the respective groupby chunk with a new avg column.
-    (This is called within `add_avg_value_column`.)
+def clean_extracted_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Run the first steps of the preprocessing on the extracted rows,
+    up to the look-up of the mandant and sector (product level only).
     """
-    try:
-        n_active = float(
-            df_chunk[df_chunk["kpi_name"] == "Anzahl aktive Konten Total"]
-            ["value"].values[0]
+    df = create_calculation_date_column(df)
+    df = trim_strings(df)
+    df = get_rid_of_invalid_entries(df)
+    df = prettify_kpi_names(df)
+    return add_mandant_sector_level_columns(df)
+
+
+def clean_extracted_level_rows(
+    df: pd.DataFrame,
+    hierarchy: List[dict] = data_dicts.ENTITY_HIERARCHY,
+    n_months: int = 12 * N_YEARS_BACK + 1,
+) -> pd.DataFrame:
+    """Run the first steps of the preprocessing on the rows extracted with
+    the levels aggregated in the DB (get_level_results_for_kpi_sheet.sql).
+    These rows are already expanded and contain all levels, only the dates
+    and kpi names are converted and the entity columns of the higher levels
+    are filled from the `hierarchy` (like in `create_level_rows`). Raise for
+    unknown products and NaN values like `add_mandant_sector_level_columns`.
+    """
+    df = create_calculation_date_column(df)
+    df = prettify_kpi_names(df)
+    df["level"] = df["level"].astype("int64")
+    levels = {3, *(level["level"] for level in hierarchy)}
+    if set(df["level"].unique()) != levels:
+        raise ValueError(
+            f"The query returned the levels {sorted(df['level'].unique())}, they "
+            f"have to be the same as in the hierarchy ({sorted(levels)})."
+        )
+
+    is_product = df["level"] == 3
+    unknown = sorted(df.loc[is_product & df["mandant"].isna(), "product_name"].unique())
+    if unknown:
+        raise KeyError(
+            f"Loaded products not in PRODUCT_LOOK_UP. LOOK_UP has to be updated!: "
+            f"{unknown}"
         )
-        df_chunk["value_avg"] = (
-            (pd.to_numeric(df_chunk["value"], errors="raise", downcast="float") + 0.001)
-            / n_active
+    for level in hierarchy:
+        is_level = df["level"] == level["level"]
+        for col, template in level["entity"].items():
+            df.loc[is_level, col] = _fill_template(df.loc[is_level], template)
+
+    # Sanity checks
+    if df.drop(columns="value").isna().sum().sum() != 0:
+        raise AssertionError(
+            "Ups, something went wrong: NaN values in df, please check!"
         )
-    except IndexError:
-        df_chunk["value_avg"] = np.nan
-    return df_chunk
+    if df["calculation_date"].nunique() != n_months:
+        raise AssertionError(
+            f"In case you did not load {n_months} months, something went wrong, "
+            "please check!"
+        )
+    # Same column order as the expanded rows
+    return df[df.columns.drop("value").tolist() + ["value"]]
+
+
+def return_first_new_date(
+    df_previous: pd.DataFrame, restatement_months: int = RESTATEMENT_MONTHS
+) -> pd.Timestamp:
+    """Return the first month to extract in the incremental mode: the one
+    after the last month of the previous data, or `restatement_months`
+    earlier (these months are extracted again and replace the old rows).
+    """
+    last_date = df_previous["calculation_date"].max()
+    return last_date + pd.offsets.MonthEnd(1 - restatement_months)
+
+
+def update_extracted_rows(
+    df_rows_previous: pd.DataFrame,
+    df_rows_new: pd.DataFrame,
+    n_months: int = 12 * N_YEARS_BACK + 1,
+) -> pd.DataFrame:
+    """Return the cleaned rows of the previous extraction updated with the
+    newly extracted ones: the new rows replace all rows from their first
+    month on and only the last `n_months` are kept (i.e. the oldest months
+    are dropped).
+    """
+    first_new_date = df_rows_new["calculation_date"].min()
+    df_rows = pd.concat(
+        [
+            df_rows_previous.loc[df_rows_previous["calculation_date"] < first_new_date],
+            df_rows_new,
+        ],
+        ignore_index=True,
+    )
+    months = np.sort(df_rows["calculation_date"].unique())
+    return df_rows.loc[df_rows["calculation_date"] >= months[-n_months:][0]]
+
+
+def build_dataset(
+    df_rows: pd.DataFrame,
+    df_previous: Optional[pd.DataFrame] = None,
+    first_new_date: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    """Run the preprocessing steps from the full expansion on for the
+    cleaned rows (see `clean_extracted_rows`) and return the dataset.
+
+    In the incremental mode the `df_previous` dataset is passed and only
+    the months from `first_new_date` on are calculated, then they are
+    spliced into the previous dataset (see `update_dataset`). If this is
+    not possible (e.g. because a new product appeared), all months are
+    calculated.
+    """
+    if df_previous is not None and first_new_date is not None:
+        df = update_dataset(df_rows, df_previous, first_new_date)
+        if df is not None:
+            return df
+    dict_max_date_per_entity = create_max_date_dict(df_rows)
+    df = expand_dataframe_fully(df_rows, dict_max_date_per_entity)
+    df_levels = create_level_rows(df)
+    df = concatenate_all_levels(df, *df_levels)
+    df = unscale_value_column(df, VALUE_DECIMALS)
+    df = add_avg_value_column(df)
+    df = add_result_dim_columns(df)
+    df = sort_and_drop_kpi_id(df)
+    return apply_dataset_schema(df)
+
+
+def update_dataset(
+    df_rows: pd.DataFrame, df_previous: pd.DataFrame, first_new_date: pd.Timestamp
+) -> Optional[pd.DataFrame]:
+    """Return the previous dataset updated with the cleaned rows of the
+    months from `first_new_date` on (the rows of the other months have to
+    be the ones of the previous extraction, see `update_extracted_rows`).
+    Only these months are expanded, aggregated to the levels and get the
+    averages. Their result dims are calculated with the rows of the
+    RESULT_DIM_LOOK_BACK months before them from the previous dataset.
+    The rows of the previous months keep their values, only the result
+    dims whose window now reaches before the first month become NaN (see
+    `cube.mask_result_dim_columns`), the oldest months are dropped.
+
+    Return None if the product level rows of the previous months are not
+    the ones of a full run (e.g. because a new product appeared), see
+    `_return_missing_series`, or a kpi of the previous dataset is not in
+    the rows anymore (its `kpi_id` is needed for the sorting).
+    """
+    first_date = df_rows["calculation_date"].min()
+    df_new = df_rows.loc[df_rows["calculation_date"] >= first_new_date]
+    df_missing = _return_missing_series(df_previous, df_new, first_date, first_new_date)
+    kpi_ids = df_rows.drop_duplicates("kpi_name").set_index("kpi_name")["kpi_id"]
+    if df_missing is None or not df_previous["kpi_name"].isin(kpi_ids.index).all():
+        logger.info("Product level rows have changed, all months are calculated.")
+        return None
+
+    last_date = df_new["calculation_date"].max()
+    df = expand_dataframe_fully(
+        pd.concat([df_new, df_missing], ignore_index=True),
+        create_max_date_dict(df_new),
+        n_months=_count_months(first_new_date, last_date) + 1,
+    )
+    df_levels = create_level_rows(df)
+    df = concatenate_all_levels(df, *df_levels)
+    df = unscale_value_column(df, VALUE_DECIMALS)
+    df = add_avg_value_column(df)
+
+    # Both parts with the column types of the dataset and the same categories
+    df_kept = df_previous.loc[
+        (df_previous["calculation_date"] >= first_date)
+        & (df_previous["calculation_date"] < first_new_date)
+    ]
+    df = apply_dataset_schema(df.drop(columns="kpi_id"))
+    df_kept, df = _align_categories(df_kept, df)
+
+    # The result dims of the new months, with the look-back window before
+    is_look_back = df_kept["calculation_date"] > first_new_date - pd.offsets.MonthEnd(
+        RESULT_DIM_LOOK_BACK + 1
+    )
+    df_look_back = df_kept.loc[is_look_back, df.columns]
+    df_result_dims = cube.result_dim_columns(
+        pd.concat([df_look_back, df], ignore_index=True)
+    ).iloc[len(df_look_back):]
+    df = pd.concat([df, df_result_dims.set_axis(df.index)], axis=1)
+    df_kept = cube.mask_result_dim_columns(df_kept, first_date)
+
+    # Sorted like in a full run, whatever the order of the previous rows
+    df = pd.concat([df_kept, df[df_kept.columns]], ignore_index=True)
+    kpi_names = df["kpi_name"]
+    kpi_ids = kpi_ids.reindex(kpi_names.cat.categories).to_numpy()
+    df.insert(0, "kpi_id", kpi_ids[kpi_names.cat.codes])
+    logger.info(f"Updated {len(df) - len(df_kept)} rows of the previous dataset.")
+    return sort_and_drop_kpi_id(df)
+
+
+def build_dataset_from_level_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Run the remaining preprocessing steps for the rows of all levels
+    (see `clean_extracted_level_rows`) and return the dataset, it is the
+    same as from `build_dataset` for the product level rows.
+    """
+    df = unscale_value_column(df, VALUE_DECIMALS)
+    df = add_avg_value_column(df)
+    df = add_result_dim_columns(df)
+    df = sort_and_drop_kpi_id(df)
+    return apply_dataset_schema(df)
+
+
+def _return_missing_series(
+    df_previous: pd.DataFrame,
+    df_new: pd.DataFrame,
+    first_date: pd.Timestamp,
+    first_new_date: pd.Timestamp,
+) -> Optional[pd.DataFrame]:
+    """Return one row with a NaN value at `first_new_date` for every
+    product level series of the previous dataset that has no new row but
+    is expanded to the new months in a full run (its product has new
+    rows). Return None if the previous rows from `first_date` on are not
+    the ones of a full run: the series have to be the same as in the
+    extracted rows (a series with NaN values only in these months is not
+    extracted anymore), every product with new rows has a row in each of
+    these months and all other products ended before `first_new_date`.
+    (This is called within `update_dataset`.)
+    """
+    is_product = df_previous["level"] == 3
+    dates = df_previous["calculation_date"]
+    products_new = df_new["product_name"].unique()
+    is_ended = ~df_previous["product_name"].isin(products_new)
+    if (is_product & (dates >= first_new_date) & is_ended).any():
+        return None
+
+    df_kept = df_previous.loc[
+        is_product & (dates >= first_date) & (dates < first_new_date),
+        ["calculation_date", "level", "value"] + SERIES_COLS,
+    ]
+    series, _, (n_series, _) = cube.series_month_positions(df_kept)
+    df_series = df_kept.iloc[np.unique(series, return_index=True)[1]]
+    n_rows = np.bincount(series, minlength=n_series)
+    has_value = df_kept["value"].notna().to_numpy()
+    n_values = np.bincount(series[has_value], minlength=n_series)
+    series_new = set(_iter_series(df_new.drop_duplicates(SERIES_COLS)))
+    is_new = np.array([series in series_new for series in _iter_series(df_series)])
+    is_active = df_series["product_name"].isin(products_new).to_numpy()
+    if (
+        is_new.sum() != len(series_new)
+        or not ((n_values > 0) | is_new).all()
+        or not (n_rows[is_active] == _count_months(first_date, first_new_date)).all()
+    ):
+        return None
+
+    df_missing = df_series.loc[is_active & ~is_new].astype(
+        {col: df_new[col].dtype for col in SERIES_COLS}
+    )
+    kpi_ids = df_new.drop_duplicates("kpi_name").set_index("kpi_name")["kpi_id"]
+    if not df_missing["kpi_name"].isin(kpi_ids.index).all():
+        return None
+    return df_missing.assign(
+        calculation_date=first_new_date,
+        kpi_id=df_missing["kpi_name"].map(kpi_ids),
+        value=np.nan,
+        level=3,
+    )[df_new.columns]
+
+
+def _iter_series(df: pd.DataFrame) -> Iterable[tuple]:
+    """Return the product level series of the rows as tuples."""
+    return df[SERIES_COLS].astype(object).itertuples(index=False, name=None)
+
+
+def _align_categories(
+    df_kept: pd.DataFrame, df_new: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return both parts of an update with the categories of both parts
+    (sorted like `astype` does), only the categories still in use are kept.
+    (This is called within `update_dataset`.)
+    """
+    dtypes = {}
+    for col in df_new.columns[df_new.dtypes == "category"]:
+        categories = df_kept[col].cat.categories.union(df_new[col].cat.categories)
+        used = np.zeros(len(categories), dtype=bool)
+        for df in [df_kept, df_new]:
+            codes = np.unique(df[col].cat.codes)
+            positions = categories.get_indexer(df[col].cat.categories)
+            used[positions[codes[codes >= 0]]] = True
+        dtypes[col] = pd.CategoricalDtype(categories[used])
+    return df_kept.astype(dtypes), df_new.astype(dtypes)
+
+
+def _count_months(start_date: pd.Timestamp, end_date: pd.Timestamp) -> int:
+    """Return the number of calendar months from `start_date` to `end_date`."""
+    return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month
 
 
 def sort_and_drop_kpi_id(df: pd.DataFrame) -> pd.DataFrame:
@@ -314,16 +846,111 @@ def sort_and_drop_kpi_id(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def save_to_csv(df: pd.DataFrame):
+def apply_dataset_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the columns to the types defined in the DATASET_SCHEMA dict
+    (in the `data_dicts` module): datetime for the dates, small ints for
+    `level` and `period_id` and categoricals for the string dimensions.
+    """
+    schema = {
+        col: dtype
+        for col, dtype in data_dicts.DATASET_SCHEMA.items()
+        if col in df.columns
+    }
+    return df.astype(schema)
+
+
+def save_to_parquet(
+    df: pd.DataFrame,
+    path: str = "./data/preprocessed_results.parquet",
+    manifest_content: Optional[Dict[str, Any]] = None,
+):
+    """Save the 'working' file in the columnar parquet format. This is
+    the file the app is loading (the CSV is kept as fallback). The
+    column types are stored with the file, so nothing has to be parsed
+    when it is read. (See `publish_file` for the `manifest_content`.)
+    """
+    tmp_path = Path(f"{path}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    publish_file(tmp_path, Path(path), path, manifest_content)
+
+
+def save_to_arrow(
+    df: pd.DataFrame,
+    path: str = "./data/preprocessed_results.arrow",
+    manifest_content: Optional[Dict[str, Any]] = None,
+):
+    """Save the data as uncompressed Arrow IPC file that the app can
+    memory-map and share between all sessions and processes. Each run
+    writes a new version with a timestamp in the name (a mapped file
+    cannot be replaced on Windows) and older versions are removed if
+    they are not in use anymore. Float NaN are kept as values (not as
+    nulls), so that the columns can be mapped without copying them.
+    (See `publish_file` for the `manifest_content`.)
+    """
+    path = Path(path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            table = table.set_column(
+                i, field.name, pa.array(df[field.name].to_numpy(), from_pandas=False)
+            )
+
+    timestamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+    new_path = path.with_name(f"{path.stem}_{timestamp}{path.suffix}")
+    tmp_path = Path(f"{new_path}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    publish_file(tmp_path, new_path, str(path), manifest_content)
+
+    for old_path in path.parent.glob(f"{path.stem}_*{path.suffix}"):
+        if old_path != new_path:
+            try:
+                old_path.unlink()
+            except OSError:
+                logger.info(f"{old_path.name} is still in use, not removed.")
+
+
+def save_to_csv(
+    df: pd.DataFrame, manifest_content: Optional[Dict[str, Any]] = None
+):
     """Save two copies of the dataframe: The 'working' file that is
     overwriting the old data and will be overwritten next month. And
     a copy that will be permanently stored in the "history" folder.
+    This is the last file of a run, then the views cached on disk by
+    the app are removed (see `view_cache.py`). (See `publish_file` for
+    the `manifest_content`.)
     """
-    df.to_csv("./data/preprocessed_results.csv", index=False)
+    path = "./data/preprocessed_results.csv"
+    df.to_csv(f"{path}.tmp", index=False)
+    publish_file(Path(f"{path}.tmp"), Path(path), path, manifest_content)
     # History copy with yearmon_str in name
     end_date = df["calculation_date"].max()
     yearmon_str = str(end_date.date().strftime('%Y-%m'))
     df.to_csv(f"./data/history/{yearmon_str}_preprocessed_results.csv", index=False)
+    # The views cached for the old data are not valid anymore
+    DiskViewCache(view_cache_dir("./data/preprocessed_results.csv")).clear()
+
+
+def publish_file(
+    tmp_path: Path,
+    data_path: Path,
+    path: str,
+    manifest_content: Optional[Dict[str, Any]] = None,
+):
+    """Replace the data file `data_path` with the file written to
+    `tmp_path`, so the app never reads a file that is half written. If
+    the `manifest_content` of the dataset `path` is given, the manifest
+    that lists the new file is saved before (see
+    `manifest.publish_data_file`).
+    """
+    if manifest_content is None:
+        os.replace(tmp_path, data_path)
+    else:
+        # (Imported here like the warm-up, it uses the helpers of the app)
+        import manifest
+
+        manifest.publish_data_file(manifest_content, path, tmp_path, data_path)
 
 
 def validate_and_log_results(df: pd.DataFrame):
@@ -400,30 +1027,101 @@ def validate_and_log_results(df: pd.DataFrame):
         )
 
 
-def main(server, db_name):
+def main(
+    server,
+    db_name,
+    incremental: bool = False,
+    aggregate_in_db: bool = False,
+    warm_up_views: bool = False,
+):
     logger.info("Start preprocessing ...")
-    connection = connect_to_engine(server, db_name)
-    query = read_query("sql_statements/get_results_for_kpi_sheet.sql", n_years_back=3)
-    df = create_df(query, connection)
-    df = create_calculation_date_column(df)
-    df = trim_strings(df)
-    df = get_rid_of_invalid_entries(df)
-    df = prettify_kpi_names(df)
-    df = add_mandant_sector_level_columns(df)
-    dict_max_date_per_entity = create_max_date_dict(df)
-    df = expand_dataframe_fully(df)
-    df = reduce_dataframe_to_max_date_per_entity(df, dict_max_date_per_entity)
-    df_mandant = create_new_mandant_level_rows(df)
-    df_sector = create_new_sector_level_rows(df)
-    df_overall = create_new_overall_level_rows(df)
-    df = concatenate_all_levels(df, df_mandant, df_sector, df_overall)
-    df = add_avg_value_column(df)
-    df = sort_and_drop_kpi_id(df)
-    save_to_csv(df)
+    engine = create_db_engine(server, db_name)
+    parquet_path = "./data/preprocessed_results.parquet"
+    if aggregate_in_db:
+        # Always a full run (the product rows are kept for incremental runs)
+        logger.info("Extracting the rows of all levels aggregated in the DB ...")
+        df = create_df_with_levels(
+            engine,
+            read_sql("sql_statements/get_level_results_for_kpi_sheet.sql"),
+            params={"n_years_back": N_YEARS_BACK},
+            value_decimals=VALUE_DECIMALS,
+        )
+        df = clean_extracted_level_rows(df)
+        df_rows = df.loc[(df["level"] == 3) & df["value"].notna()]
+        df_rows.to_parquet(EXTRACTED_ROWS_PATH, index=False)
+        df = build_dataset_from_level_rows(df)
+    else:
+        df_previous, first_new_date = None, None
+        min_period_value = 0
+        has_previous = (
+            Path(EXTRACTED_ROWS_PATH).exists() and Path(parquet_path).exists()
+        )
+        if incremental and has_previous:
+            df_previous = pd.read_parquet(parquet_path)
+            first_new_date = return_first_new_date(df_previous, RESTATEMENT_MONTHS)
+            min_period_value = int(first_new_date.strftime("%Y%m"))
+            logger.info(
+                f"Incremental update, extracting from {first_new_date:%Y-%m} on."
+            )
+        df = create_df_partitioned(
+            engine,
+            read_sql("sql_statements/get_periods_for_kpi_sheet.sql"),
+            read_sql("sql_statements/get_results_for_kpi_sheet_partition.sql"),
+            params={"n_years_back": N_YEARS_BACK, "min_period_value": min_period_value},
+            value_decimals=VALUE_DECIMALS,
+        )
+        df_rows = clean_extracted_rows(df)
+        if df_previous is not None:
+            df_rows = update_extracted_rows(
+                pd.read_parquet(EXTRACTED_ROWS_PATH), df_rows
+            )
+        df_rows.to_parquet(EXTRACTED_ROWS_PATH, index=False)
+        df = build_dataset(df_rows, df_previous, first_new_date)
+    # (Imported here like the warm-up, it uses the helpers of the app)
+    import manifest
+
+    # The manifest is saved before each data file is published
+    manifest_content = manifest.create_manifest(df)
+    save_to_arrow(df, manifest_content=manifest_content)
+    save_to_parquet(df, parquet_path, manifest_content)
+    save_to_csv(df, manifest_content)
+    logger.info("Dataset and manifest saved.")
 
     validate_and_log_results(df)
+    if warm_up_views:
+        # (Imported here, the app modules are only needed for the warm-up)
+        import warm_up
+
+        report = warm_up.warm_up("./data/preprocessed_results.arrow")
+        logger.info(
+            f"Warm-up: {report.n_materialized} of {report.n_views} views "
+            f"materialized, {report.n_skipped} skipped."
+        )
     logger.info("Preprocessing complete!\n\n")
 
 
 if __name__ == "__main__":
-    main(SERVER, DB_NAME)
+    arg_parser = argparse.ArgumentParser(description="Monthly data preprocessing.")
+    arg_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="extract only the new months and update the previous data",
+    )
+    arg_parser.add_argument(
+        "--aggregate-in-db",
+        action="store_true",
+        help="aggregate the levels in the DB with GROUPING SETS (always a full run)",
+    )
+    arg_parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="compute the common views of the app for the view cache",
+    )
+    args = arg_parser.parse_args()
+    main(
+        SERVER,
+        DB_NAME,
+        incremental=args.incremental,
+        aggregate_in_db=args.aggregate_in_db,
+        warm_up_views=args.warm_up,
+    )
@@ -0,0 +1,197 @@
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import data_dicts
+import helpers
+from cube import KpiCube
+
+# Steps that only remove whole series (kpi or entities), the rolling and
+# diff calculations are per series, so they can run before these steps
+FILTER_STEPS = ["filter_mandant", "filter_kpi_group", "filter_entity_and_kpi"]
+
+
+class ViewQuery:
+    """Lazy query for the data of the actual period shown in the app.
+    Every method returns a new query with one more step recorded in the
+    plan, nothing is calculated before `execute`. The plan is then run
+    once on the KPI cube: the filters are applied to the kpi and entity
+    axes first (this is safe because rolling sums and diffs are calculated
+    per series), then the value steps run on the remaining series and only
+    the actual period is converted to a dataframe.
+
+    The result is the same as from the eager helpers chain, i.e.
+    `create_df_with_actual_period_from_cube` and the filter functions.
+    """
+
+    def __init__(self, actual_date: str, steps: Tuple[Tuple[str, Any], ...] = ()):
+        self.actual_date = actual_date
+        self.steps = steps
+
+    def _add(self, name: str, *args) -> "ViewQuery":
+        return ViewQuery(self.actual_date, self.steps + ((name, args),))
+
+    def truncate(self, n_years: int) -> "ViewQuery":
+        """Keep `n_years` of history before the actual date."""
+        return self._add("truncate", n_years)
+
+    def result_dim(self, result_dim: str, avg_bool: bool = False) -> "ViewQuery":
+        """Aggregate the values according to the result dimension (or
+        replace them with the averages if `avg_bool` is True).
+        """
+        if avg_bool:
+            assert result_dim == "Monat", "Uups, wrong result dim for averages."
+        return self._add("result_dim", result_dim, avg_bool)
+
+    def diff(self, n_months_diff: int = 12) -> "ViewQuery":
+        """Add the `diff_value` column (%-difference to `n_months_diff`
+        months earlier).
+        """
+        return self._add("diff", n_months_diff)
+
+    def filter_mandant(self, filter_mandant_groups: str) -> "ViewQuery":
+        """See `helpers.filter_for_sidebar_selections_mandant`."""
+        return self._add("filter_mandant", filter_mandant_groups)
+
+    def filter_kpi_group(self, filter_kpi_groups: str) -> "ViewQuery":
+        """See `helpers.filter_for_sidebar_selections_kpi`."""
+        return self._add("filter_kpi_group", filter_kpi_groups)
+
+    def filter_entity_and_kpi(
+        self, filter_entity: List[str], filter_kpi: List[str]
+    ) -> "ViewQuery":
+        """See `helpers.filter_for_entity_and_kpi`."""
+        return self._add("filter_entity_and_kpi", filter_entity, filter_kpi)
+
+    def plan(self, kpi_cube: KpiCube) -> List[str]:
+        """Return the names of the steps in the order they are executed
+        on `kpi_cube`. If the values for the result dim are materialized
+        in the dataset (and the truncated history is long enough for
+        them, see `helpers.can_look_up_result_dim`), truncation,
+        aggregation and diff are replaced by a look-up of the columns in
+        the actual period.
+        """
+        if self._materialized_cols(kpi_cube) is not None:
+            return ["lookup", "month_slice", "select"]
+        plan = []
+        for name, _ in self.steps:
+            if name not in FILTER_STEPS:
+                if name != "truncate" and "select" not in plan:
+                    plan.append("select")
+                plan.append(name)
+        if "select" not in plan:
+            plan.append("select")
+        return plan + ["month_slice"]
+
+    def execute(self, kpi_cube: KpiCube) -> pd.DataFrame:
+        """Run the plan on `kpi_cube` and return the dataframe with the
+        rows of the actual period.
+        """
+        materialized_cols = self._materialized_cols(kpi_cube)
+        if materialized_cols is not None:
+            kpi_cube = kpi_cube.select_measures(materialized_cols)
+            return self._select(kpi_cube.month_slice(self.actual_date)).to_frame()
+
+        selected = False
+        for name, args in self.steps:
+            if name in FILTER_STEPS:
+                continue
+            # Truncation is a view on the cube, all other steps calculate
+            # new arrays and should only do this for the selected series
+            if name != "truncate" and not selected:
+                kpi_cube, selected = self._select(kpi_cube), True
+            if name == "truncate":
+                kpi_cube = kpi_cube.truncate(self.actual_date, *args)
+            elif name == "result_dim":
+                kpi_cube = self._run_result_dim(kpi_cube, *args)
+            elif name == "diff":
+                kpi_cube = kpi_cube.with_diff(*args)
+        if not selected:
+            kpi_cube = self._select(kpi_cube)
+
+        output_cols = ["value"]
+        if "diff" in dict(self.steps):
+            output_cols.append("diff_value")
+        kpi_cube = kpi_cube.select_measures({col: col for col in output_cols})
+        return kpi_cube.month_slice(self.actual_date).to_frame()
+
+    def _select(self, kpi_cube: KpiCube) -> KpiCube:
+        """Return the cube with the kpi and entities left by the filters."""
+        kpi_mask, entity_mask = self._axis_masks(kpi_cube)
+        if kpi_mask is None and entity_mask is None:
+            return kpi_cube
+        return kpi_cube.select(kpi_mask, entity_mask)
+
+    def _run_result_dim(
+        self, kpi_cube: KpiCube, result_dim: str, avg_bool: bool
+    ) -> KpiCube:
+        if result_dim != "Monat":
+            n_months = helpers.return_n_months_for_result_dim(
+                result_dim, self.actual_date
+            )
+            kpi_cube = kpi_cube.with_rolling_sum(n_months)
+        if avg_bool:
+            kpi_cube = kpi_cube.with_measure("value", kpi_cube.measures["value_avg"])
+        return kpi_cube.without_measure("value_avg")
+
+    def _materialized_cols(self, kpi_cube: KpiCube) -> Optional[dict]:
+        """Return the measures to look up for `value` and `diff_value` if
+        the plan aggregates and diffs (by 12 months) values that are
+        materialized in the cube and the plan does not truncate the history
+        to less than they need, otherwise None.
+        """
+        args = dict(self.steps)
+        if "result_dim" not in args or args.get("diff") != (12,):
+            return None
+        result_dim, avg_bool = args["result_dim"]
+        if "truncate" in args and not helpers.can_look_up_result_dim(
+            self.actual_date, *args["truncate"], result_dim
+        ):
+            return None
+        value_col = (
+            "value_avg" if avg_bool else data_dicts.RESULT_DIM_COLUMNS[result_dim]
+        )
+        if f"diff_{value_col}" not in kpi_cube.measures:
+            return None
+        return {"value": value_col, "diff_value": f"diff_{value_col}"}
+
+    def select_axes(
+        self, kpis: pd.DataFrame, entities: pd.DataFrame
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Apply the filter steps to a frame with the kpi names and one
+        with the entities (with the same filter functions as for the
+        long-format data) and return the remaining rows of both.
+        """
+        for name, args in self.steps:
+            if name == "filter_mandant":
+                entities = helpers.filter_for_sidebar_selections_mandant(
+                    entities, *args
+                )
+            elif name == "filter_kpi_group":
+                kpis = helpers.filter_for_sidebar_selections_kpi(kpis, *args)
+            elif name == "filter_entity_and_kpi":
+                filter_entity, filter_kpi = args
+                entities = helpers.filter_for_entity_and_kpi(
+                    entities, filter_entity, ["[alle]"]
+                )
+                kpis = helpers.filter_for_entity_and_kpi(kpis, ["[alle]"], filter_kpi)
+        return kpis, entities
+
+    def _axis_masks(
+        self, kpi_cube: KpiCube
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Return the masks of the kpi and entity axes of the cube for
+        `KpiCube.select` (None if nothing is filtered out).
+        """
+        kpis, entities = self.select_axes(
+            pd.DataFrame({"kpi_name": kpi_cube.kpi_names}), kpi_cube.entities
+        )
+        kpi_mask, entity_mask = None, None
+        if len(kpis) < kpi_cube.shape[0]:
+            kpi_mask = np.zeros(kpi_cube.shape[0], dtype=bool)
+            kpi_mask[kpis.index] = True
+        if len(entities) < kpi_cube.shape[1]:
+            entity_mask = np.zeros(kpi_cube.shape[1], dtype=bool)
+            entity_mask[entities.index] = True
+        return kpi_mask, entity_mask
@@ -0,0 +1,191 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import pandas as pd
+
+import data_dicts
+
+# (The app logger, configured in the `helpers`)
+logger = logging.getLogger("appLogger")
+
+
+class Stage(NamedTuple):
+    """Result of a stage, with the key it is cached under. The key
+    contains the keys of the upstream stages, so it identifies the
+    whole path through the DAG that lead to the `value`.
+    """
+
+    key: tuple
+    value: Any
+
+
+class StageCache:
+    """Memoizes the stages of a computation shaped as a DAG (e.g. the
+    helpers chain from the truncation to the filters, see
+    `backends.PandasBackend.execute`). Every stage is cached on its own
+    name, the keys of its upstream stages and its parameters. If only a
+    parameter of a later stage changes (e.g. a filter), the earlier stages
+    are hits and only the stages downstream of the change are calculated.
+
+    The cache can be shared by the sessions of the server process: if a
+    stage is requested while another thread calculates it, the request
+    waits for that result (single-flight). The least recently used results
+    are dropped if there are more than `max_entries` or they take more than
+    `max_bytes` of memory (see `_return_nbytes`, the defaults are set in
+    the `data_dicts`). A result larger than `max_bytes` is not stored at
+    all, it is counted as rejected.
+
+    The cached values are handed out to every caller, they must not be
+    changed in place. The number of hits and misses per stage is
+    counted, see `stats` and `summary`.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        if max_entries is None:
+            max_entries = data_dicts.STAGE_CACHE_MAX_ENTRIES
+        if max_bytes is None:
+            max_bytes = data_dicts.STAGE_CACHE_MAX_BYTES
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._results: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._nbytes: Dict[tuple, int] = {}
+        self._running: Dict[tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.evictions = 0
+        self.rejected = 0
+
+    @property
+    def bytes_held(self) -> int:
+        return sum(self._nbytes.values())
+
+    def source(self, name: str, func: Callable, *params) -> Stage:
+        """Return the result of `func(*params)` as the first stage of
+        a DAG, for data that is cached elsewhere (e.g. the base dataset
+        loaded with `st.cache`). It is not held by this cache, the stage
+        only provides the key for the downstream stages.
+        """
+        return Stage(
+            (name, tuple(_return_key(param) for param in params)), func(*params)
+        )
+
+    def run(self, name: str, func: Callable, *args) -> Stage:
+        """Return the result of `func(*args)` for the stage `name`. Upstream
+        stages are passed as `Stage` in the `args` (their values are passed
+        to `func`), all other args are parameters and have to be hashable
+        (lists are converted to tuples).
+        """
+        key = (name, tuple(_return_key(arg) for arg in args))
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits[name] += 1
+                return Stage(key, self._results[key])
+            running = self._running.get(key)
+            if running is None:
+                self._running[key] = threading.Event()
+                self.misses[name] += 1
+
+        if running is not None:
+            # Calculated by another thread, wait for its result
+            running.wait()
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.hits[name] += 1
+                    return Stage(key, self._results[key])
+            # (The calculation failed or the result is already dropped)
+            return self.run(name, func, *args)
+
+        try:
+            value = func(
+                *(arg.value if isinstance(arg, Stage) else arg for arg in args)
+            )
+            self._add(key, value)
+        finally:
+            with self._lock:
+                self._running.pop(key).set()
+        return Stage(key, value)
+
+    def _add(self, key: tuple, value: Any):
+        """Store the result and drop the least recently used ones if
+        the limits are exceeded. (This is called within `run`.)
+        """
+        nbytes = _return_nbytes(value)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                self.rejected += 1
+                logger.debug(
+                    f"Stage cache - result of {key[0]} not stored, "
+                    f"MB: {nbytes / 1024 ** 2:.1f} (budget: "
+                    f"{self.max_bytes / 1024 ** 2:.1f})"
+                )
+                return
+            self._results[key] = value
+            self._nbytes[key] = nbytes
+            bytes_held = self.bytes_held
+            while len(self._results) > self.max_entries or bytes_held > self.max_bytes:
+                old_key, _ = self._results.popitem(last=False)
+                bytes_held -= self._nbytes.pop(old_key)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return the number of hits and misses per stage name."""
+        with self._lock:
+            return {
+                name: {"hits": self.hits[name], "misses": self.misses[name]}
+                for name in sorted(set(self.hits) | set(self.misses))
+            }
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the hit ratio over all stages, the number of dropped
+        and of rejected (too large) results and the memory held by the
+        results.
+        """
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "entries": len(self._results),
+                "bytes_held": self.bytes_held,
+            }
+
+    def clear(self):
+        """Drop all results and reset the counters."""
+        with self._lock:
+            self._results.clear()
+            self._nbytes.clear()
+            self.hits.clear()
+            self.misses.clear()
+            self.evictions = 0
+            self.rejected = 0
+
+
+def _return_key(arg: Any) -> Any:
+    """Return the part of the cache key for an argument of a stage."""
+    if isinstance(arg, Stage):
+        return arg.key
+    if isinstance(arg, (list, tuple)):
+        return tuple(_return_key(item) for item in arg)
+    return arg
+
+
+def _return_nbytes(value: Any) -> int:
+    """Return the memory footprint of a stage result: dataframes and
+    series with their (deep) memory usage, arrays with their `nbytes`,
+    other values are not counted.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    return int(getattr(value, "nbytes", 0))
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+# Folder of the cache, next to the data file (see `view_cache_dir`)
+VIEW_CACHE_DIR_NAME = "view_cache"
+# Size budget for the files in the cache (least recently used are removed)
+VIEW_CACHE_MAX_BYTES = 1024**3
+# File with the entries of the cache (key, dataset checksum, size, last use)
+INDEX_FILE_NAME = "index.json"
+
+
+class DiskViewCache:
+    """Persistent cache for the computed views (and plot data) of the
+    app, so that a restarted server does not start with a cold cache.
+    Every result is stored as parquet file (with its index and column
+    types), the `index.json` in the same folder lists the entries.
+
+    The entries are keyed by the checksum of the dataset (see
+    `helpers.return_dataset_checksum`) plus the name and parameters of
+    the result. Entries of other datasets are removed with `prune`, the
+    least recently used entries are removed if the files take more
+    than `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = VIEW_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._index_mtime = None
+        self._sync_index()
+
+    def get(self, checksum: str, name: str, params: tuple) -> Optional[pd.DataFrame]:
+        """Return the stored result or None if it is not in the cache."""
+        if not self.contains(checksum, name, params):
+            return None
+        file_name = _return_file_name(checksum, name, params)
+        try:
+            df = pd.read_parquet(self.directory / file_name)
+        except OSError:  # removed in the meantime
+            return None
+        # (The last use is written to the index file with the next change)
+        with self._lock:
+            if file_name in self._index:
+                self._index[file_name]["last_used"] = time.time()
+        return df
+
+    def put(self, checksum: str, name: str, params: tuple, df: pd.DataFrame):
+        """Store the result and remove the least recently used entries
+        if the size budget is exceeded.
+        """
+        file_name = _return_file_name(checksum, name, params)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f"{file_name}.{_return_writer_id()}.tmp"
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, self.directory / file_name)
+        with self._lock:
+            self._sync_index()
+            self._index[file_name] = {
+                "checksum": checksum,
+                "name": name,
+                "params": repr(params),
+                "nbytes": (self.directory / file_name).stat().st_size,
+                "last_used": time.time(),
+            }
+            self._evict()
+            self._write_index()
+
+    def contains(self, checksum: str, name: str, params: tuple) -> bool:
+        with self._lock:
+            self._sync_index()
+            return _return_file_name(checksum, name, params) in self._index
+
+    def load_or_run(
+        self, checksum: str, name: str, params: tuple, func: Callable, *args
+    ) -> pd.DataFrame:
+        """Return the stored result, or run `func(*args)` and store it."""
+        df = self.get(checksum, name, params)
+        if df is None:
+            df = func(*args)
+            self.put(checksum, name, params, df)
+        return df
+
+    def prune(self, checksum: str):
+        """Remove all entries that are not for the dataset `checksum`."""
+        with self._lock:
+            self._sync_index()
+            old_files = [
+                file_name
+                for file_name, entry in self._index.items()
+                if entry["checksum"] != checksum
+            ]
+            for file_name in old_files:
+                self._remove(file_name)
+            if old_files:
+                self._write_index()
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._sync_index()
+            for file_name in list(self._index):
+                self._remove(file_name)
+            self._write_index()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry["nbytes"] for entry in self._index.values())
+
+    def _evict(self):
+        """Remove the least recently used entries above the size budget.
+        (This is called within `put`.)
+        """
+        by_last_use = sorted(self._index, key=lambda f: self._index[f]["last_used"])
+        nbytes = self.nbytes
+        for file_name in by_last_use:
+            if nbytes <= self.max_bytes:
+                break
+            nbytes -= self._index[file_name]["nbytes"]
+            self._remove(file_name)
+
+    def _remove(self, file_name: str):
+        del self._index[file_name]
+        try:
+            (self.directory / file_name).unlink()
+        except OSError:  # already removed (or still open on Windows)
+            pass
+
+    def _sync_index(self):
+        """Read the index file again if it was replaced by another
+        instance (e.g. of another process, see `warm_up.py`).
+        """
+        try:
+            mtime = (self.directory / INDEX_FILE_NAME).stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self.directory / INDEX_FILE_NAME, encoding="utf-8") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._index_mtime = mtime
+
+    def _write_index(self):
+        """Replace the index file (atomically, so that a crash or a
+        concurrent reader never sees half of it).
+        """
+        if not self.directory.exists():
+            return
+        tmp_path = self.directory / f"{INDEX_FILE_NAME}.{_return_writer_id()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.directory / INDEX_FILE_NAME)
+        self._index_mtime = (self.directory / INDEX_FILE_NAME).stat().st_mtime_ns
+
+
+def view_cache_dir(data_path: str) -> Path:
+    """Return the folder of the view cache for the data in `data_path`."""
+    return Path(data_path).parent / VIEW_CACHE_DIR_NAME
+
+
+def _return_writer_id() -> str:
+    """Return a part for the names of temporary files that is unique
+    per process and thread.
+    """
+    return f"{os.getpid()}-{threading.get_ident()}"
+
+
+def _return_file_name(checksum: str, name: str, params: tuple) -> str:
+    """Return the file name for a result (a hash of its full key)."""
+    key = repr((checksum, name, params)).encode("utf-8")
+    return f"{name}_{hashlib.sha1(key).hexdigest()}.parquet"
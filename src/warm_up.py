@@ -0,0 +1,204 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+import backends
+import data_dicts
+import helpers
+from query import ViewQuery
+
+# Time budget for a warm-up, the views not computed by then are skipped
+WARM_UP_MAX_SECONDS = 15 * 60
+# Memory budget for the computed views (memory usage of the dataframes)
+WARM_UP_MAX_BYTES = 512 * 1024**2
+# Months hidden in the date options, as in the app (see `app.main`)
+N_MONTHS_MIN = 24
+# Start method of the worker processes (spawned like on Windows, forking
+# the threads of the app is not safe)
+WARM_UP_START_METHOD = "spawn"
+
+# Backends of a worker process, created for the first view it computes
+_WORKER_BACKENDS: Dict[Tuple[str, str], backends.PandasBackend] = {}
+
+
+class WarmUpReport(NamedTuple):
+    """Summary of a warm-up: the number of views of the app, how many
+    of them were already in the view cache, computed and stored now,
+    or skipped because a budget was exceeded.
+    """
+
+    n_views: int
+    n_cached: int
+    n_materialized: int
+    n_skipped: int
+    seconds: float
+    nbytes: int
+
+
+def enumerate_views(
+    backend: backends.PandasBackend, n_dates: Optional[int] = None
+) -> List[ViewQuery]:
+    """Return the queries of the app for all combinations of the date,
+    result dim, mandant group and KPI group options, built like in
+    `app.main` (without the averages and the main page filters). The
+    latest date and the first (default) options come first. Only the
+    latest `n_dates` dates are enumerated if it is given.
+    """
+    max_date = backend.max_date()
+    kpi_groups = helpers.get_filter_options_for_kpi_groups()
+    views = []
+    for filter_due_date in backend.date_options(N_MONTHS_MIN)[:n_dates]:
+        actual_date = helpers.return_actual_date_string(filter_due_date, max_date)
+        n_years = backend.n_years_available(actual_date)
+        mandant_groups = backend.mandant_options(actual_date)
+        for result_dim in helpers.get_filter_options_for_result_dim(n_years):
+            view_query = (
+                ViewQuery(actual_date)
+                .truncate(n_years)
+                .result_dim(result_dim, False)
+                .diff(12)
+            )
+            for filter_mandant in mandant_groups:
+                for filter_kpi_groups in kpi_groups:
+                    views.append(
+                        view_query.filter_mandant(filter_mandant).filter_kpi_group(
+                            filter_kpi_groups
+                        )
+                    )
+    return views
+
+
+def warm_up(
+    path: str,
+    backend_name: str = data_dicts.COMPUTE_BACKEND,
+    max_seconds: float = WARM_UP_MAX_SECONDS,
+    max_bytes: int = WARM_UP_MAX_BYTES,
+    max_workers: Optional[int] = None,
+    n_dates: Optional[int] = None,
+) -> WarmUpReport:
+    """Compute the views of the app (see `enumerate_views`) that are not
+    in the view cache yet in a pool of `max_workers` processes (default:
+    one per core) and store them in the view cache on disk, where the
+    app finds them on the first request. At most `max_workers` views are
+    submitted at a time, a new one only while the warm-up took less than
+    `max_seconds` and the computed views less than `max_bytes`. When a
+    budget is exceeded, the views in progress are still stored and the
+    remaining views are skipped. The report is logged.
+    """
+    start = time.perf_counter()
+    backend = backends.BACKENDS[backend_name](path)
+    views = enumerate_views(backend, n_dates)
+    todo = [view for view in views if not backend.has_cached_view(view)]
+
+    n_workers = max_workers or os.cpu_count() or 1
+    n_materialized, nbytes = 0, 0
+    views_left = iter(todo)
+    pending = {}
+    executor = ProcessPoolExecutor(
+        n_workers, mp_context=multiprocessing.get_context(WARM_UP_START_METHOD)
+    )
+    try:
+        while True:
+            while len(pending) < n_workers and _is_within_budget(
+                start, max_seconds, nbytes, max_bytes
+            ):
+                view = next(views_left, None)
+                if view is None:
+                    break
+                future = executor.submit(
+                    _run_view, path, backend_name, view.actual_date, view.steps
+                )
+                pending[future] = view
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                view = pending.pop(future)
+                df = future.result()
+                backend.store_view(view, df)
+                n_materialized += 1
+                nbytes += int(df.memory_usage(index=True, deep=True).sum())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    report = WarmUpReport(
+        n_views=len(views),
+        n_cached=len(views) - len(todo),
+        n_materialized=n_materialized,
+        n_skipped=len(todo) - n_materialized,
+        seconds=time.perf_counter() - start,
+        nbytes=nbytes,
+    )
+    helpers.logger.info(
+        f"Warm-up ({backend_name}) - views: {report.n_views}, already cached: "
+        f"{report.n_cached}, materialized: {report.n_materialized}, skipped: "
+        f"{report.n_skipped}, time (s): {report.seconds:.1f}, "
+        f"MB: {report.nbytes / 1024 ** 2:.1f}"
+    )
+    return report
+
+
+def warm_up_in_background(
+    path: str, backend_name: str = data_dicts.COMPUTE_BACKEND
+) -> threading.Thread:
+    """Start the warm-up in a thread of the app, once per version of the
+    data (see WARM_UP_AT_APP_START in the `data_dicts`).
+    """
+    return _start_warm_up_cached(
+        path, helpers.return_dataset_version(path), backend_name
+    )
+
+
+@st.cache(allow_output_mutation=True, show_spinner=False)
+def _start_warm_up_cached(path: str, version: tuple, backend_name: str):
+    """Start the thread. The `version` is only used as part of the cache key."""
+    thread = threading.Thread(target=warm_up, args=(path, backend_name), daemon=True)
+    thread.start()
+    return thread
+
+
+def _is_within_budget(
+    start: float, max_seconds: float, nbytes: int, max_bytes: int
+) -> bool:
+    """Return True if the warm-up started at `start` is within the time
+    and the memory budget. (This is called within `warm_up`.)
+    """
+    return time.perf_counter() - start < max_seconds and nbytes < max_bytes
+
+
+def _run_view(
+    path: str, backend_name: str, actual_date: str, steps: tuple
+) -> pd.DataFrame:
+    """Compute a view in a worker process. (This is called within `warm_up`.)"""
+    key = (path, backend_name)
+    if key not in _WORKER_BACKENDS:
+        _WORKER_BACKENDS[key] = backends.BACKENDS[backend_name](path)
+    return _WORKER_BACKENDS[key]._run_query(ViewQuery(actual_date, steps))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Compute the common views of the app for the view cache."
+    )
+    arg_parser.add_argument("--path", default="./data/preprocessed_results.arrow")
+    arg_parser.add_argument("--backend", default=data_dicts.COMPUTE_BACKEND)
+    arg_parser.add_argument("--max-seconds", type=float, default=WARM_UP_MAX_SECONDS)
+    arg_parser.add_argument("--max-mb", type=float, default=WARM_UP_MAX_BYTES / 1024**2)
+    arg_parser.add_argument(
+        "--workers", type=int, default=None, help="processes (default: all cores)"
+    )
+    args = arg_parser.parse_args()
+    warm_up(
+        args.path,
+        args.backend,
+        max_seconds=args.max_seconds,
+        max_bytes=int(args.max_mb * 1024**2),
+        max_workers=args.workers,
+    )
@@ -7,6 +7,9 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
 
+from .data import mock_dataset  # noqa: E402
+import data_dicts  # noqa: E402
+
 
 # @pytest.fixture
 # def data_mock():
@@ -116,6 +119,15 @@ def data_prepared():
     return df
 
 
+@pytest.fixture(scope="module")
+def data_loaded():
+    """Fully expanded dataset (all levels, 37 months) with the column
+    types of the DATASET_SCHEMA, like it is returned by the loader.
+    """
+    df = mock_dataset.create_preprocessed_data(n_products=8)
+    return df.astype(data_dicts.DATASET_SCHEMA)
+
+
 # @pytest.fixture(scope="module")
 # def mock_dataframe_1():
 #     mock_df = pd.read_csv(
@@ -0,0 +1,305 @@
+"""Generate synthetic KPI data for tests and benchmarks.
+
+There are two flavours: a "raw extract" that looks like the output of
+`preprocess.create_df` (product level only, one row per month, kpi and
+product) and a "preprocessed" dataset that looks like the file the
+app is loading (all levels, fully expanded, with `value_avg` and the
+materialized result dim columns).
+"""
+
+import sqlite3
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+import data_dicts
+from cube import result_dim_columns
+
+# (kpi_id, kpi_name, period_id) - similar to what we load from KF_CORE
+MOCK_KPI = [
+    (1, "Umsatz Total", 2),
+    (2, "Umsatz Inland", 2),
+    (3, "Nr. TRX Total", 2),
+    (4, "Anzahl aktive Konten Total", 2),
+    (5, "Anzahl gültige Konten Total", 1),
+    (6, "NCAs: Anzahl Antraege Total", 2),
+]
+
+PROFILES = ["CC", "PP", "CCL"]
+
+
+def product_look_up(n_products: int) -> Dict[str, Dict[str, str]]:
+    """Return a look-up dict in the format of `PRODUCT_LOOK_UP` with
+    `n_products` entries. Real product names are used first, if more
+    products are needed, synthetic ones are added to the real mandants.
+    """
+    real = list(data_dicts.PRODUCT_LOOK_UP.items())
+    look_up = dict(real[:n_products])
+    for i in range(len(look_up), n_products):
+        _, dims = real[i % len(real)]
+        look_up[f"Mock Product {i:05d}"] = dict(dims)
+    return look_up
+
+
+def generate_month_ends(end_date: str, n_months: int) -> pd.DatetimeIndex:
+    """Return `n_months` month-end dates up to and including `end_date`."""
+    return pd.date_range(end=end_date, periods=n_months, freq="M")
+
+
+def create_raw_extract(
+    n_products: int = 8,
+    n_months: int = 37,
+    end_date: str = "2020-12-31",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Return a dataframe in the format returned by `preprocess.create_df`.
+    The last product is defunct (it disappears 6 months before the end)
+    and a few values are missing, so the full expansion has work to do.
+    """
+    rng = np.random.default_rng(seed)
+    look_up = product_look_up(n_products)
+    products = list(look_up.keys())
+    months = generate_month_ends(end_date, n_months)
+
+    grid = pd.MultiIndex.from_product(
+        [range(len(months)), range(len(products)), range(len(MOCK_KPI))],
+        names=["month", "product", "kpi"],
+    ).to_frame(index=False)
+    # Defunct product and some random gaps
+    grid = grid.loc[
+        ~((grid["product"] == len(products) - 1) & (grid["month"] >= n_months - 6))
+    ]
+    grid = grid.loc[rng.random(len(grid)) > 0.01].reset_index(drop=True)
+
+    kpi = np.array(MOCK_KPI, dtype=object)
+    df = pd.DataFrame(
+        {
+            "period_value": months[grid["month"]].strftime("%Y%m").astype(int),
+            "kpi_id": kpi[grid["kpi"], 0].astype(int),
+            "kpi_name": kpi[grid["kpi"], 1],
+            "period_id": kpi[grid["kpi"], 2].astype(int),
+            "product_name": np.array(products, dtype=object)[grid["product"]],
+            "value": np.round(rng.uniform(10, 10_000, len(grid)), 2),
+            "cardprofile": np.array(PROFILES, dtype=object)[
+                grid["product"] % len(PROFILES)
+            ],
+        }
+    )
+    return df
+
+
+def create_sqlite_source(path: str, raw_extract: pd.DataFrame) -> str:
+    """Write the raw extract into a `kpi_result` table of a new SQLite
+    database at `path`, a local stand-in for KF_CORE. Return the query
+    that selects the rows like the extraction query (same columns and
+    order) for `preprocess.create_df`.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    raw_extract.to_sql("kpi_result", engine, index=False)
+    engine.dispose()
+    cols = ", ".join(raw_extract.columns)
+    return f"SELECT {cols} FROM kpi_result ORDER BY period_value, product_name, kpi_id"
+
+
+def create_sqlite_partition_queries(raw_extract: pd.DataFrame) -> Tuple[str, str]:
+    """Return the periods query and the query for one partition of months
+    (with bind parameters) for the SQLite stand-in, like the sql files for
+    `preprocess.create_df_partitioned`.
+    """
+    cols = ", ".join(raw_extract.columns)
+    periods_query = (
+        "SELECT DISTINCT period_value FROM kpi_result "
+        "WHERE period_value >= :min_period_value ORDER BY period_value"
+    )
+    query = (
+        f"SELECT {cols} FROM kpi_result "
+        "WHERE period_value BETWEEN :first_period AND :last_period "
+        "ORDER BY period_value, product_name, kpi_id"
+    )
+    return periods_query, query
+
+
+def create_duckdb_level_source(
+    raw_extract: pd.DataFrame, sql_path: str
+) -> Tuple[Any, str]:
+    """Return an in-memory DuckDB database with the raw extract (with
+    decimal values, like in KF_CORE) as `product_rows` and the
+    PRODUCT_LOOK_UP as `product_look_up` table. Return it together with
+    the standard SQL part of the level query in `sql_path` (after the
+    AGGREGATION marker) that runs on these tables.
+    """
+    import duckdb
+
+    connection = duckdb.connect()
+    connection.register("raw_extract", raw_extract)
+    connection.execute(
+        "CREATE TABLE product_rows AS "
+        "SELECT * REPLACE (CAST(value AS DECIMAL(18, 2)) AS value) FROM raw_extract"
+    )
+    look_up = pd.DataFrame.from_dict(data_dicts.PRODUCT_LOOK_UP, orient="index")
+    connection.register("look_up", look_up.rename_axis("product_name").reset_index())
+    connection.execute("CREATE TABLE product_look_up AS SELECT * FROM look_up")
+    with open(sql_path, encoding="utf-8-sig") as file:
+        query = file.read()
+    return connection, "WITH " + query.split("-- AGGREGATION\n")[1]
+
+
+def create_sqlite_engine(
+    path: str, latency: float = 0.0, row_latency: float = 0.0
+) -> Any:
+    """Return an engine for the SQLite stand-in at `path` that can be used
+    from several threads. To simulate the server, every query waits
+    `latency` seconds (the round-trip) and every fetch `row_latency`
+    seconds per fetched row (the scan and transfer).
+    """
+
+    def _connect():
+        connection = sqlite3.connect(
+            path, factory=_SlowConnection, check_same_thread=False
+        )
+        connection.latency, connection.row_latency = latency, row_latency
+        return connection
+
+    return create_engine(f"sqlite:///{path}", creator=_connect)
+
+
+class _SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or _SlowCursor)
+
+
+class _SlowCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        time.sleep(self.connection.latency)
+        return super().execute(*args)
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        time.sleep(len(rows) * self.connection.row_latency)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        time.sleep(len(rows) * self.connection.row_latency)
+        return rows
+
+
+def create_preprocessed_data(
+    n_products: int = 8,
+    n_months: int = 37,
+    end_date: str = "2020-12-31",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Return a dataframe in the format of the preprocessed dataset
+    (all four levels, sorted like `preprocess.sort_and_drop_kpi_id`).
+    This is built with numpy directly so it scales to large row counts.
+    """
+    rng = np.random.default_rng(seed)
+    look_up = product_look_up(n_products)
+    months = generate_month_ends(end_date, n_months)
+
+    entities: List[Dict] = [
+        {
+            "product_name": name,
+            "cardprofile": PROFILES[i % len(PROFILES)],
+            "mandant": dims["mandant"],
+            "sector": dims["sector"],
+            "level": 3,
+        }
+        for i, (name, dims) in enumerate(look_up.items())
+    ]
+    products = pd.DataFrame(entities)
+    mandants = products[["mandant", "sector"]].drop_duplicates()
+    sectors = products[["sector"]].drop_duplicates()
+    entities += [
+        {
+            "product_name": f"{m} - Total",
+            "cardprofile": "all",
+            "mandant": m,
+            "sector": s,
+            "level": 2,
+        }
+        for m, s in mandants.itertuples(index=False)
+    ]
+    entities += [
+        {
+            "product_name": f"{s} - Total",
+            "cardprofile": "all",
+            "mandant": s,
+            "sector": s,
+            "level": 1,
+        }
+        for s in sectors["sector"]
+    ]
+    entities.append(
+        {
+            "product_name": "BCAG - Total",
+            "cardprofile": "all",
+            "mandant": "BCAG",
+            "sector": "BCAG",
+            "level": 0,
+        }
+    )
+    entities_df = pd.DataFrame(entities)
+
+    # Product values, all higher levels are sums of them
+    n_prod = len(products)
+    values = rng.uniform(10, 10_000, (len(MOCK_KPI), n_prod, n_months)).round(2)
+    values[:, -1, -6:] = np.nan  # defunct product
+
+    def _sum_for(mask: np.ndarray) -> np.ndarray:
+        return np.nansum(values[:, mask, :], axis=1)
+
+    level_values = [values[:, i, :] for i in range(n_prod)]
+    for e in entities[n_prod:]:
+        if e["level"] == 2:
+            level_values.append(_sum_for((products["mandant"] == e["mandant"]).values))
+        elif e["level"] == 1:
+            level_values.append(_sum_for((products["sector"] == e["sector"]).values))
+        else:
+            level_values.append(_sum_for(np.ones(n_prod, dtype=bool)))
+    cube = np.stack(level_values, axis=1)  # kpi x entity x month
+
+    kpi_idx, ent_idx, month_idx = np.meshgrid(
+        np.arange(len(MOCK_KPI)),
+        np.arange(len(entities_df)),
+        np.arange(n_months),
+        indexing="ij",
+    )
+    kpi = np.array(MOCK_KPI, dtype=object)
+    df = entities_df.iloc[ent_idx.ravel()].reset_index(drop=True)
+    df.insert(0, "calculation_date", months[month_idx.ravel()])
+    df.insert(1, "kpi_id", kpi[kpi_idx.ravel(), 0].astype(int))
+    df.insert(2, "kpi_name", kpi[kpi_idx.ravel(), 1])
+    df.insert(3, "period_id", kpi[kpi_idx.ravel(), 2].astype(int))
+    df["value"] = cube.ravel()
+
+    # Drop the rows after the max date of the defunct product
+    defunct = products["product_name"].iloc[-1]
+    df = df.loc[
+        ~((df["product_name"] == defunct) & (df["calculation_date"] > months[-7]))
+    ]
+
+    active = (
+        df.loc[df["kpi_name"] == "Anzahl aktive Konten Total"]
+        .set_index(["calculation_date", "product_name"])["value"]
+    )
+    keys = pd.MultiIndex.from_frame(df[["calculation_date", "product_name"]])
+    df["value_avg"] = (df["value"].values + 0.001) / active.reindex(keys).values
+    df = pd.concat([df, result_dim_columns(df)], axis=1)
+
+    df = df.sort_values(
+        [
+            "kpi_id",
+            "level",
+            "mandant",
+            "product_name",
+            "cardprofile",
+            "calculation_date",
+        ]
+    )
+    df = df.drop(columns=["kpi_id"]).reset_index(drop=True)
+    return df
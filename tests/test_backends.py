@@ -0,0 +1,155 @@
+import pandas as pd
+import pytest
+
+from src import backends  # noqa
+from src import plots  # noqa
+from src import query  # noqa
+from src import view_cache  # noqa
+
+ACTUAL_DATE = "2020-10-31"
+
+# (With 2 years the windows for the diffs are complete, this is also
+# where the materialized values of the cube are equal to the reference)
+QUERIES = {
+    "month": query.ViewQuery(ACTUAL_DATE).truncate(2).result_dim("Monat").diff(12),
+    "avg_filtered": (
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim("Monat", True)
+        .diff(12)
+        .filter_mandant("B2C")
+        .filter_kpi_group("Umsatz")
+    ),
+    "ytd": query.ViewQuery(ACTUAL_DATE).truncate(2).result_dim("Year To Date").diff(12),
+    "rolling_filtered": (
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim("3 Monate rollierend")
+        .diff(12)
+        .filter_mandant("Bonus Card")
+        .filter_kpi_group("[alle] ohne NCA")
+        .filter_entity_and_kpi(["[alle]"], ["Umsatz Total", "Nr. TRX Total"])
+    ),
+    "rolling_no_diff": query.ViewQuery(ACTUAL_DATE).result_dim("6 Monate rollierend"),
+}
+
+
+@pytest.fixture(scope="module")
+def data_files(data_loaded, tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("data")
+    data_loaded.to_parquet(data_dir / "preprocessed_results.parquet", index=False)
+    csv_dir = tmp_path_factory.mktemp("csv")
+    data_loaded.to_csv(csv_dir / "preprocessed_results.csv", index=False)
+    return {
+        "parquet": str(data_dir / "preprocessed_results.parquet"),
+        "csv": str(csv_dir / "preprocessed_results.csv"),
+    }
+
+
+@pytest.fixture(scope="module")
+def reference(data_files):
+    return backends.PandasBackend(data_files["parquet"])
+
+
+@pytest.fixture(scope="module", params=["cube", "duckdb", "duckdb_csv"])
+def backend(request, data_files):
+    if request.param == "cube":
+        return backends.CubeBackend(data_files["parquet"])
+    pytest.importorskip("duckdb")
+    if request.param == "duckdb_csv":
+        return backends.DuckDBBackend(data_files["csv"])
+    return backends.DuckDBBackend(data_files["parquet"], threads=2)
+
+
+@pytest.mark.parametrize("query_name", list(QUERIES))
+def test_execute(backend, reference, query_name):
+    view_query = QUERIES[query_name]
+    expected = reference.execute(view_query)
+    result = backend.execute(view_query)
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result.sort_index(), expected.sort_index())
+
+
+def test_option_lists(backend, reference):
+    assert backend.date_options(24) == reference.date_options(24)
+    assert backend.max_date() == reference.max_date()
+    assert backend.n_years_available(ACTUAL_DATE) == reference.n_years_available(
+        ACTUAL_DATE
+    )
+    assert backend.mandant_options(ACTUAL_DATE) == reference.mandant_options(
+        ACTUAL_DATE
+    )
+
+
+def test_history(backend, reference):
+    expected = reference.history(ACTUAL_DATE, 2)
+    pd.testing.assert_frame_equal(backend.history(ACTUAL_DATE, 2), expected)
+
+
+def test_load_compute_backend(data_files):
+    backend = backends.load_compute_backend(data_files["parquet"], "pandas")
+    assert isinstance(backend, backends.PandasBackend)
+    assert backends.load_compute_backend(data_files["parquet"], "pandas") is backend
+
+
+def test_execute_reruns_only_changed_stages(data_files, reference, tmp_path):
+    backend = backends.PandasBackend(
+        data_files["parquet"], view_cache=view_cache.DiskViewCache(tmp_path)
+    )
+    view_query = QUERIES["avg_filtered"]
+    for filter_kpi in [["[alle]"], ["Umsatz Total"]]:
+        result = backend.execute(
+            view_query.filter_entity_and_kpi(["[alle]"], filter_kpi)
+        )
+    stats = backend.stage_cache.stats()
+    for name in ["truncate", "result_dim", "avg", "diff", "filter_mandant"]:
+        assert stats[name] == {"hits": 1, "misses": 1}
+    assert stats["filter_entity_and_kpi"] == {"hits": 0, "misses": 2}
+    expected = reference.execute(
+        view_query.filter_entity_and_kpi(["[alle]"], ["Umsatz Total"])
+    )
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "backend_class", [backends.PandasBackend, backends.CubeBackend]
+)
+def test_execute_loads_views_from_disk_cache(data_files, tmp_path, backend_class):
+    view_query = QUERIES["rolling_filtered"]
+    first = backend_class(data_files["parquet"], view_cache.DiskViewCache(tmp_path))
+    expected = first.execute(view_query)
+    # (A new backend, as after a restart of the server)
+    backend = backend_class(data_files["parquet"], view_cache.DiskViewCache(tmp_path))
+    pd.testing.assert_frame_equal(backend.execute(view_query), expected)
+    assert backend.stage_cache.stats() == {"view": {"hits": 0, "misses": 1}}
+
+
+def test_new_backend_keeps_views_of_other_data_files(data_files, tmp_path):
+    view_query = QUERIES["rolling_filtered"]
+    first = backends.PandasBackend(
+        data_files["parquet"], view_cache.DiskViewCache(tmp_path)
+    )
+    expected = first.execute(view_query)
+    # (The same data in another file, e.g. while a new dataset is published)
+    backends.PandasBackend(data_files["csv"], view_cache.DiskViewCache(tmp_path))
+    backend = backends.PandasBackend(
+        data_files["parquet"], view_cache.DiskViewCache(tmp_path)
+    )
+    pd.testing.assert_frame_equal(backend.execute(view_query), expected)
+    assert backend.stage_cache.stats() == {"view": {"hits": 0, "misses": 1}}
+
+
+def test_plot_data(data_files, reference, tmp_path):
+    backend = backends.PandasBackend(
+        data_files["parquet"], view_cache.DiskViewCache(tmp_path)
+    )
+    args = (["Umsatz Total"], ["Bonus Card - Total", "VISA Bonuscard"], [2, 3])
+    expected = plots.create_df_plot(reference.history(ACTUAL_DATE, 2), *args)
+    assert len(expected) > 0
+    for _ in range(2):
+        df_plot = backend.plot_data(ACTUAL_DATE, 2, *args)
+        pd.testing.assert_frame_equal(df_plot, expected)
+        # The plots change the df_plot, this must not change the cache
+        df_plot["Monat"] = None
+    assert backend.stage_cache.stats()["df_plot"] == {"hits": 1, "misses": 1}
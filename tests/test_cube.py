@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import cube  # noqa
+from src import data_dicts  # noqa
+from src import helpers  # noqa
+
+SERIES_KEYS = cube.SERIES_KEYS
+MATERIALIZED_COLS = [
+    col
+    for col in data_dicts.DATASET_SCHEMA
+    if col.startswith(("value_", "diff_")) and col != "value_avg"
+]
+
+
+@pytest.fixture(scope="module")
+def kpi_cube(data_loaded):
+    return cube.KpiCube.from_frame(data_loaded)
+
+
+@pytest.fixture(scope="module")
+def data_not_materialized(data_loaded):
+    """Dataset without the materialized result dim columns (old format)."""
+    return data_loaded.drop(columns=MATERIALIZED_COLS)
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(SERIES_KEYS + ["calculation_date"]).reset_index(drop=True)
+
+
+def test_from_frame_shape(kpi_cube, data_loaded):
+    assert kpi_cube.shape == (
+        data_loaded["kpi_name"].nunique(),
+        data_loaded["product_name"].nunique(),
+        data_loaded["period_id"].nunique(),
+        data_loaded["calculation_date"].nunique(),
+    )
+    assert kpi_cube.present.sum() == len(data_loaded)
+
+
+def test_from_frame_raises_for_duplicates(data_loaded):
+    df = pd.concat([data_loaded, data_loaded.head(1)], ignore_index=True)
+    with pytest.raises(ValueError, match="More than one row"):
+        cube.KpiCube.from_frame(df)
+
+
+def test_to_frame_round_trip(kpi_cube, data_loaded):
+    pd.testing.assert_frame_equal(kpi_cube.to_frame(), data_loaded)
+
+
+def test_truncate(kpi_cube, data_loaded):
+    result = kpi_cube.truncate("2020-06-30", 1).to_frame()
+    df = helpers.truncate_data_to_actual_date(data_loaded, "2020-06-30")
+    expected = helpers.truncate_data_n_years_back(df, "2020-06-30", 1)
+    assert result["calculation_date"].nunique() == 13
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_with_rolling_sum(kpi_cube, data_loaded):
+    result = kpi_cube.with_rolling_sum(3).to_frame()
+    expected = data_loaded.groupby(SERIES_KEYS, observed=True)["value"].transform(
+        lambda s: s.rolling(3).sum()
+    )
+    no_sum = data_loaded["kpi_name"].isin(data_dicts.NO_SUM_KPI)
+    expected[no_sum] = data_loaded.loc[no_sum, "value"]
+    np.testing.assert_allclose(result["value"], expected)
+
+
+def test_with_diff(kpi_cube, data_loaded):
+    result = kpi_cube.with_diff(12).to_frame()
+    expected = data_loaded.groupby(SERIES_KEYS, observed=True)["value"].pct_change(12)
+    expected = expected.where(expected.abs() < 100)
+    np.testing.assert_allclose(result["diff_value"], expected)
+
+
+def test_select(kpi_cube):
+    kpi_mask = kpi_cube.kpi_names.isin(["Umsatz Total"]).to_numpy()
+    entity_mask = (kpi_cube.entities["level"] == 2).to_numpy()
+    result = kpi_cube.select(kpi_mask, entity_mask).to_frame()
+    assert list(result["kpi_name"].unique()) == ["Umsatz Total"]
+    assert list(result["level"].unique()) == [2]
+
+
+@pytest.mark.parametrize(
+    "result_dim, avg_bool",
+    [
+        ("Monat", False),
+        ("Monat", True),
+        ("Year To Date", False),
+        ("3 Monate rollierend", False),
+        ("12 Monate rollierend", False),
+    ],
+)
+@pytest.mark.parametrize("materialized", [True, False])
+def test_create_df_with_actual_period_from_cube(
+    data_loaded, data_not_materialized, result_dim, avg_bool, materialized
+):
+    actual_date = "2020-10-31"
+    df = helpers.truncate_data_to_actual_date(data_not_materialized, actual_date)
+    df = helpers.truncate_data_n_years_back(df, actual_date, 2)
+    df = helpers.prepare_values_according_to_result_dim(df, result_dim, actual_date)
+    df = helpers.replace_monthly_values_with_avg(df, result_dim, avg_bool)
+    df = helpers.calculate_diff_column(df)
+    expected = helpers.create_df_with_actual_period_only(df, actual_date)
+
+    data = data_loaded if materialized else data_not_materialized
+    result = helpers.create_df_with_actual_period_from_cube(
+        cube.KpiCube.from_frame(data), actual_date, 2, result_dim, avg_bool
+    )
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(expected))
+
+
+@pytest.mark.parametrize("n_months", [1, 3, 12, 40])
+def test_rolling_window_sum(n_months):
+    values = np.arange(74, dtype=float).reshape(2, 37)
+    values[1, 20] = np.nan
+    expected = (
+        pd.DataFrame(values.T).rolling(n_months).sum().to_numpy().T
+    )
+    np.testing.assert_allclose(cube.rolling_window_sum(values, n_months), expected)
+
+
+def test_series_month_positions(data_prepared):
+    series, month, shape = cube.series_month_positions(data_prepared)
+    assert shape == (4, 13)
+    assert list(month) == [12, 12, 0, 0, 0]
+    assert list(series) == [0, 1, 2, 1, 3]
+
+
+def test_rolling_window_sum_per_month_windows():
+    values = np.arange(24, dtype=float).reshape(1, 24)
+    month_numbers = np.arange(24) % 12 + 1
+    result = cube.rolling_window_sum(values, month_numbers)
+    expected = np.concatenate([np.cumsum(values[0, :12]), np.cumsum(values[0, 12:])])
+    np.testing.assert_allclose(result[0], expected)
+
+
+def test_result_dim_columns(data_not_materialized):
+    df = data_not_materialized
+    result = cube.result_dim_columns(df)
+    assert list(result.columns) == MATERIALIZED_COLS
+    grouped = df.groupby(SERIES_KEYS, observed=True)
+    expected = grouped["value"].transform(lambda s: s.rolling(6).sum())
+    no_sum = df["kpi_name"].isin(data_dicts.NO_SUM_KPI)
+    expected[no_sum] = df.loc[no_sum, "value"]
+    np.testing.assert_allclose(result["value_6m"], expected)
+    expected = grouped["value_avg"].pct_change(12)
+    expected = expected.where(expected.abs() < 100)
+    np.testing.assert_allclose(result["diff_value_avg"], expected)
+
+
+@pytest.mark.parametrize("n_months_dropped", [1, 5, 14])
+def test_mask_result_dim_columns(data_not_materialized, n_months_dropped):
+    df = pd.concat(
+        [data_not_materialized, cube.result_dim_columns(data_not_materialized)],
+        axis=1,
+    )
+    dates = np.sort(df["calculation_date"].unique())
+    first_date = pd.Timestamp(dates[n_months_dropped])
+    df = df.loc[df["calculation_date"] >= first_date]
+    result = cube.mask_result_dim_columns(df, first_date)
+    expected = cube.result_dim_columns(df.drop(columns=MATERIALIZED_COLS))
+    pd.testing.assert_frame_equal(result[MATERIALIZED_COLS], expected, check_exact=True)
+
+
+def test_lagged_pct_changes():
+    values = np.array([[1.0, 2.0, 4.0, 0.0, 5.0, np.nan]])
+    diffs = cube.lagged_pct_changes(values, [1, 2, 6])
+    np.testing.assert_allclose(diffs[1][0], [np.nan, 1.0, 1.0, -1.0, np.nan, np.nan])
+    np.testing.assert_allclose(diffs[2][0], [np.nan, np.nan, 3.0, -1.0, 0.25, np.nan])
+    assert np.isnan(diffs[6]).all()
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import data_dicts  # noqa
+from src import dim_index  # noqa
+from src import helpers  # noqa
+
+
+@pytest.fixture(scope="module")
+def data_actual(data_loaded):
+    return data_loaded.loc[data_loaded["calculation_date"] == "2020-12-31"]
+
+
+@pytest.fixture(scope="module")
+def index_actual(data_actual):
+    return dim_index.DimensionIndex.from_frame(data_actual)
+
+
+def test_from_frame(index_actual, data_actual):
+    assert len(index_actual) == len(data_actual)
+    for col in dim_index.INDEX_COLS:
+        positions = index_actual.positions[col]
+        assert set(positions) == set(data_actual[col].unique())
+        assert sum(len(pos) for pos in positions.values()) == len(data_actual)
+    umsatz = index_actual.kpi_groups["Umsatz"]
+    assert (np.diff(umsatz) > 0).all()
+    assert data_actual["kpi_name"].iloc[umsatz].str.startswith("Umsatz").all()
+
+
+@pytest.mark.parametrize("mandant_group", ["[alle]", "BCAG", "B2C", "Bonus Card"])
+def test_filter_for_sidebar_selections_mandant(
+    data_actual, index_actual, mandant_group
+):
+    expected = helpers.filter_for_sidebar_selections_mandant(data_actual, mandant_group)
+    result = helpers.filter_for_sidebar_selections_mandant(
+        data_actual, mandant_group, index_actual
+    )
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("kpi_group", list(data_dicts.KPI_GROUPS))
+def test_filter_for_sidebar_selections_kpi(data_actual, index_actual, kpi_group):
+    df = helpers.filter_for_sidebar_selections_mandant(data_actual, "B2C")
+    expected = helpers.filter_for_sidebar_selections_kpi(df, kpi_group)
+    result = helpers.filter_for_sidebar_selections_kpi(df, kpi_group, index_actual)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    "filter_entity, filter_kpi",
+    [
+        (["[alle]"], ["[alle]"]),
+        (["Bonus Card - Total", "B2C - Total"], ["[alle]"]),
+        (["[alle]"], ["Umsatz Total", "Nr. TRX Total"]),
+        (["Bonus Card - Total"], ["Umsatz Total", "Not a KPI"]),
+    ],
+)
+def test_filter_for_entity_and_kpi(data_actual, index_actual, filter_entity, filter_kpi):
+    df = helpers.filter_for_sidebar_selections_mandant(data_actual, "B2C")
+    expected = helpers.filter_for_entity_and_kpi(df, filter_entity, filter_kpi)
+    result = helpers.filter_for_entity_and_kpi(
+        df, filter_entity, filter_kpi, index_actual
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_take_raises_for_other_frame(data_loaded, index_actual):
+    with pytest.raises(ValueError, match="not a subset"):
+        index_actual.take(data_loaded, np.array([0]))
+
+
+def test_load_dimension_index(data_loaded, tmp_path):
+    path = str(tmp_path / "preprocessed_results.parquet")
+    data_loaded.to_parquet(path, index=False)
+    index_actual = helpers.load_dimension_index(path, "2020-12-31")
+    df = helpers.create_df_with_actual_period_from_cube(
+        helpers.load_kpi_cube(path), "2020-12-31", 3, "Monat", False
+    )
+    pd.testing.assert_index_equal(index_actual.labels, df.index)
+    result = helpers.filter_for_sidebar_selections_kpi(df, "Umsatz", index_actual)
+    assert result["kpi_name"].str.startswith("Umsatz").all()
@@ -1,14 +1,19 @@
+import gc
+import weakref
+
 import numpy as np
 import pandas as pd
 import pytest
 from pytest import approx
 
+from src import cube  # noqa
 from src import helpers  # noqa
 from src import data_dicts  # noqa
+from src import preprocess  # noqa
 
 
 def test_return_full_date_list(data_prepared):
-    date_list = helpers._return_full_date_list(data_prepared)
+    date_list = helpers.return_full_date_list(data_prepared)
     assert isinstance(date_list, list)
     assert date_list == ["2020-05-31", "2019-05-31"]
 
@@ -85,6 +90,38 @@ def test_get_filter_options_for_result_dim(n_years, expected):
     assert result == expected
 
 
+@pytest.mark.parametrize(
+    "result_dim, expected",
+    [
+        ("Monat", [1.0, 2.0, 3.0, 10.0, 20.0, 30.0, 5.0, 6.0]),
+        ("3 Monate rollierend", [np.nan, np.nan, 6.0, np.nan, np.nan, 60.0, 5.0, 6.0]),
+        ("Year To Date", [np.nan, 3.0, 5.0, np.nan, 30.0, 50.0, 5.0, 6.0]),
+    ],
+)
+def test_prepare_values_according_to_result_dim(result_dim, expected):
+    df = pd.DataFrame(
+        {
+            "calculation_date": pd.to_datetime(
+                ["2020-01-31", "2020-02-29", "2020-03-31"] * 2
+                + ["2020-01-31", "2020-02-29"]
+            ),
+            "kpi_name": ["Umsatz Total"] * 6 + ["Anzahl aktive Konten Total"] * 2,
+            "period_id": 2,
+            "level": 3,
+            "product_name": ["A"] * 3 + ["B"] * 3 + ["A"] * 2,
+            "mandant": "M",
+            "cardprofile": "CC",
+            "value": [1.0, 2.0, 3.0, 10.0, 20.0, 30.0, 5.0, 6.0],
+        }
+    )
+    # No window reaches into the previous series, row order is kept
+    result = helpers.prepare_values_according_to_result_dim(
+        df, result_dim, "2020-02-29"
+    )
+    np.testing.assert_array_equal(result["value"].to_numpy(), expected)
+    assert result.index.equals(df.index)
+
+
 # def test_replace_monthly_values_with_avg(data_prepared):
 #     result = helpers.test_replace_monthly_values_with_avg(data_prepared, "Monat", True)
 #     pass
@@ -98,6 +135,18 @@ def test_calculate_diff_column(data_prepared):
     df["diff_value"].values == approx(np.array([0.33, np.NaN, np.NaN, np.NaN, np.NaN]))
 
 
+def test_calculate_diff_column_several_lags(data_loaded):
+    df = helpers.calculate_diff_column(
+        data_loaded, {"diff_mom": 1, "diff_value": 12, "diff_2y": 24}
+    )
+    assert list(df.columns)[-2:] == ["diff_mom", "diff_2y"]
+    grouped = data_loaded.groupby(cube.SERIES_KEYS, observed=True)["value"]
+    for col, lag in [("diff_mom", 1), ("diff_value", 12), ("diff_2y", 24)]:
+        expected = grouped.pct_change(lag)
+        expected = expected.where(expected.abs() < 100)
+        np.testing.assert_allclose(df[col], expected)
+
+
 def test_create_df_with_actual_period_only(data_prepared):
     df = helpers.create_df_with_actual_period_only(data_prepared, "2020-05-31")
     assert len(df) == 2
@@ -217,3 +266,61 @@ def test_create_dict_of_df_for_each_entity(data_prepared):
     #         "mandant",
     #         "profile",
     #     ] in result.columns
+
+
+def test_load_preprocessed_data_parquet(data_loaded, tmp_path):
+    path = tmp_path / "preprocessed_results.parquet"
+    data_loaded.to_parquet(path, index=False)
+    df = helpers.load_preprocessed_data(str(path))
+    pd.testing.assert_frame_equal(df, data_loaded)
+
+
+def test_load_preprocessed_data_csv_fallback(data_loaded, tmp_path):
+    data_loaded.to_csv(tmp_path / "preprocessed_results.csv", index=False)
+    df = helpers.load_preprocessed_data(
+        str(tmp_path / "preprocessed_results.parquet")
+    )
+    assert dict(df.dtypes) == dict(data_loaded.dtypes)
+    pd.testing.assert_frame_equal(df, data_loaded, check_categorical=False)
+
+
+def test_load_shared_arrow(data_loaded, tmp_path):
+    path = tmp_path / "preprocessed_results.arrow"
+    preprocess.save_to_arrow(data_loaded, path=str(path))
+    df_1 = helpers._load_shared_arrow(path)
+    df_2 = helpers._load_shared_arrow(path)
+    assert df_1 is df_2
+    assert not df_1["value"].to_numpy().flags.writeable
+    pd.testing.assert_frame_equal(df_1, data_loaded)
+
+    # A newly published version replaces the old one
+    (tmp_path / "preprocessed_results_99999999-999999.arrow").write_bytes(
+        next(tmp_path.glob("preprocessed_results_*.arrow")).read_bytes()
+    )
+    assert helpers._load_shared_arrow(path) is not df_1
+
+
+def test_load_preprocessed_data_releases_old_version(data_loaded, tmp_path):
+    path = tmp_path / "preprocessed_results.arrow"
+    preprocess.save_to_arrow(data_loaded, path=str(path))
+    df_old = weakref.ref(helpers.load_preprocessed_data(str(path)))
+    (tmp_path / "preprocessed_results_99999999-999999.arrow").write_bytes(
+        next(tmp_path.glob("preprocessed_results_*.arrow")).read_bytes()
+    )
+    helpers.load_preprocessed_data(str(path))
+    gc.collect()
+    assert df_old() is None
+
+
+def test_load_preprocessed_data_is_frozen(data_loaded, tmp_path):
+    path = tmp_path / "preprocessed_results.parquet"
+    data_loaded.to_parquet(path, index=False)
+    df = helpers.load_preprocessed_data(str(path))
+    assert helpers.load_preprocessed_data(str(path)) is df
+    with pytest.raises(ValueError, match="read-only"):
+        df.iloc[0, df.columns.get_loc("value")] = 0.0
+
+    # The helpers chain does not write into the base data
+    df_truncated = helpers.truncate_data_to_actual_date(df, "2020-06-30")
+    helpers.replace_monthly_values_with_avg(df_truncated, "Monat", True)
+    pd.testing.assert_frame_equal(df, data_loaded)
@@ -0,0 +1,127 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from src import backends  # noqa
+from src import helpers  # noqa
+from src import manifest  # noqa
+from src import query  # noqa
+
+
+@pytest.fixture(scope="module")
+def data_paths(data_loaded, tmp_path_factory):
+    """The same data once with and once without a manifest."""
+    paths = {}
+    for name in ["with_manifest", "without_manifest"]:
+        data_dir = tmp_path_factory.mktemp(name)
+        path = data_dir / "preprocessed_results.parquet"
+        data_loaded.to_parquet(path, index=False)
+        paths[name] = str(path)
+    manifest.save_manifest(
+        manifest.create_manifest(data_loaded), paths["with_manifest"]
+    )
+    return paths
+
+
+@pytest.fixture(scope="module")
+def scanning(data_paths):
+    return backends.PandasBackend(data_paths["without_manifest"])
+
+
+@pytest.fixture(scope="module", params=["pandas", "cube"])
+def backend(request, data_paths):
+    return backends.BACKENDS[request.param](data_paths["with_manifest"])
+
+
+def test_load_manifest(data_paths):
+    assert manifest.load_manifest(data_paths["with_manifest"]) is not None
+    assert manifest.load_manifest(data_paths["without_manifest"]) is None
+
+
+def test_load_manifest_of_other_data_file(data_paths, tmp_path):
+    path = tmp_path / "preprocessed_results.parquet"
+    with open(data_paths["with_manifest"], "rb") as f:
+        path.write_bytes(f.read())
+    manifest.save_manifest({"manifest_version": 1}, str(path))
+    assert manifest.load_manifest(str(path)) is not None
+    # The same data published again
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 10**9))
+    assert manifest.load_manifest(str(path)) is not None
+    # Other data published without a manifest
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 10**9))
+    with open(path, "ab") as f:
+        f.write(b"\0")
+    assert manifest.load_manifest(str(path)) is None
+
+
+def test_publish_data_file_saves_manifest_first(data_loaded, tmp_path, monkeypatch):
+    path = tmp_path / "preprocessed_results.parquet"
+    data_loaded.head(10).to_parquet(path, index=False)
+    manifest.save_manifest({"manifest_version": 1}, str(path))
+    tmp_data_path = tmp_path / "preprocessed_results.parquet.tmp"
+    data_loaded.to_parquet(tmp_data_path, index=False)
+
+    loaded_before_replace = []
+    replace = os.replace
+
+    def replace_data_file(src, dst):
+        if Path(dst) == path:
+            loaded_before_replace.append(manifest.load_manifest(str(path)))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace_data_file)
+    content = {"manifest_version": 1}
+    manifest.publish_data_file(content, str(path), tmp_data_path, path)
+    # (The new manifest is not valid for the old data file)
+    assert loaded_before_replace == [None]
+    assert manifest.load_manifest(str(path)) is not None
+    assert content["data_files"] == [helpers.return_dataset_checksum(str(path))]
+
+
+def test_options_equal_scanned_options(backend, scanning):
+    assert backend.manifest is not None
+    assert backend.date_options(24) == scanning.date_options(24)
+    assert backend.date_options(0) == scanning.date_options(0)
+    assert backend.max_date() == scanning.max_date()
+    for actual_date in scanning.date_options(12):
+        assert backend.n_years_available(actual_date) == (
+            scanning.n_years_available(actual_date)
+        )
+        assert backend.mandant_options(actual_date) == (
+            scanning.mandant_options(actual_date)
+        )
+
+
+@pytest.mark.parametrize("result_dim", ["Monat", "Year To Date"])
+@pytest.mark.parametrize(
+    "filter_mandant, filter_kpi_groups",
+    [("[alle]", "[alle]"), ("B2C", "Umsatz"), ("Bonus Card", "[alle] ohne NCA")],
+)
+def test_entity_and_kpi_options(
+    backend, scanning, result_dim, filter_mandant, filter_kpi_groups
+):
+    actual_date = backend.max_date()
+    view_query = (
+        query.ViewQuery(actual_date)
+        .truncate(2)
+        .result_dim(result_dim)
+        .diff(12)
+        .filter_mandant(filter_mandant)
+        .filter_kpi_group(filter_kpi_groups)
+    )
+    data = scanning.execute(view_query)
+    assert backend.entity_and_kpi_options(
+        actual_date, filter_mandant, filter_kpi_groups, data
+    ) == (
+        helpers.get_filter_options_for_entities(data),
+        helpers.get_filter_options_for_kpi(data),
+    )
+
+
+def test_content_hash(data_loaded):
+    content_hash = manifest.return_content_hash(data_loaded)
+    assert content_hash == manifest.return_content_hash(data_loaded.copy())
+    df = data_loaded.copy()
+    df.loc[df.index[0], "value"] = -1
+    assert manifest.return_content_hash(df) != content_hash
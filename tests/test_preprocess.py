@@ -0,0 +1,493 @@
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, event
+
+from src import data_dicts  # noqa
+from src import preprocess  # noqa
+from .data import mock_dataset
+
+LEVEL_QUERY_PATH = (
+    Path(__file__).parent.parent / "sql_statements/get_level_results_for_kpi_sheet.sql"
+)
+
+
+@pytest.fixture(scope="module")
+def raw_extract():
+    return mock_dataset.create_raw_extract(n_products=8)
+
+
+@pytest.fixture(scope="module")
+def sqlite_source(raw_extract, tmp_path_factory):
+    path = tmp_path_factory.mktemp("db") / "kf_core.db"
+    query = mock_dataset.create_sqlite_source(str(path), raw_extract)
+    engine = create_engine(f"sqlite:///{path}")
+    connection = engine.connect()
+    yield query, connection
+    connection.close()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 999, 100_000])
+def test_create_df_streaming(sqlite_source, raw_extract, chunk_size):
+    query, connection = sqlite_source
+    expected = preprocess.create_df(query, connection)
+    df = preprocess.create_df(query, connection, chunk_size=chunk_size)
+    assert df["value"].dtype == np.float64
+    assert df["kpi_id"].dtype == df["period_id"].dtype == np.int64
+    assert len(df) == len(raw_extract)
+    pd.testing.assert_frame_equal(
+        df, expected.astype(preprocess.EXTRACT_DTYPES), check_dtype=False
+    )
+
+
+def test_create_df_streaming_shares_strings(sqlite_source):
+    query, connection = sqlite_source
+    df = preprocess.create_df(query, connection, chunk_size=500)
+    n_objects = len({id(name) for name in df["product_name"]})
+    assert n_objects == df["product_name"].nunique()
+
+
+def test_create_df_streaming_raises_without_rows(sqlite_source):
+    query, connection = sqlite_source
+    query = query.replace("ORDER BY", "WHERE kpi_id < 0 ORDER BY")
+    with pytest.raises(ValueError, match="did not return any rows"):
+        preprocess.create_df(query, connection, chunk_size=500)
+
+
+def test_create_df_fixed_point(sqlite_source, raw_extract):
+    query, connection = sqlite_source
+    df = preprocess.create_df(query, connection, chunk_size=500, value_decimals=2)
+    assert (df["value"] == df["value"].round()).all()
+    # (Also without streaming the rows in chunks)
+    pd.testing.assert_series_equal(
+        preprocess.create_df(query, connection, value_decimals=2)["value"],
+        df["value"],
+    )
+    unscaled = preprocess.unscale_value_column(df, 2)
+    np.testing.assert_allclose(
+        unscaled["value"], preprocess.create_df(query, connection)["value"]
+    )
+
+
+@pytest.mark.parametrize("months_per_partition", [1, 5, 100])
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_create_df_partitioned(
+    sqlite_source, raw_extract, months_per_partition, max_workers
+):
+    query, connection = sqlite_source
+    expected = preprocess.create_df(query, connection, chunk_size=500)
+    db_path = connection.engine.url.database
+    engine = mock_dataset.create_sqlite_engine(db_path)
+    periods_query, partition_query = mock_dataset.create_sqlite_partition_queries(
+        raw_extract
+    )
+    df = preprocess.create_df_partitioned(
+        engine,
+        periods_query,
+        partition_query,
+        params={"min_period_value": 0},
+        months_per_partition=months_per_partition,
+        max_workers=max_workers,
+        chunk_size=500,
+    )
+    engine.dispose()
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_create_df_partitioned_from_min_period(sqlite_source, raw_extract):
+    query, connection = sqlite_source
+    engine = mock_dataset.create_sqlite_engine(connection.engine.url.database)
+    df = preprocess.create_df_partitioned(
+        engine,
+        *mock_dataset.create_sqlite_partition_queries(raw_extract),
+        params={"min_period_value": 202007},
+        months_per_partition=2,
+    )
+    engine.dispose()
+    assert df["period_value"].min() == 202007
+    assert df["period_value"].is_monotonic_increasing
+    assert len(df) == (raw_extract["period_value"] >= 202007).sum()
+
+
+def test_create_df_partitioned_runs_in_parallel(sqlite_source, raw_extract):
+    """With a latency per query the partitions overlap, but never more
+    than `max_workers` of them.
+    """
+    _, connection = sqlite_source
+    latency = 0.05
+    engine = mock_dataset.create_sqlite_engine(connection.engine.url.database, latency)
+    lock, running, max_running = threading.Lock(), [0], [0]
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(*args):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(*args):
+        with lock:
+            running[0] -= 1
+
+    start = time.perf_counter()
+    df = preprocess.create_df_partitioned(
+        engine,
+        *mock_dataset.create_sqlite_partition_queries(raw_extract),
+        params={"min_period_value": 0},
+        months_per_partition=4,  # 10 partitions of the 37 months
+        max_workers=3,
+    )
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    assert len(df) == len(raw_extract)
+    assert max_running[0] == 3
+    assert elapsed < 10 * latency
+
+
+@pytest.fixture
+def data_product_level():
+    """Product level rows with float values whose sums depend on the
+    order of the additions.
+    """
+    rng = np.random.default_rng(0)
+    n_rows = 200
+    return pd.DataFrame(
+        {
+            "calculation_date": rng.integers(0, 5, n_rows),
+            "kpi_id": rng.integers(0, 3, n_rows),
+            "kpi_name": "Umsatz Total",
+            "period_id": 2,
+            "product_name": rng.choice(["Simply", "Liberty CC"], n_rows),
+            "cardprofile": "CC",
+            "mandant": rng.choice(["Simply", "Liberty", "Cumulus"], n_rows),
+            "sector": "B2C",
+            "level": 3,
+            "value": rng.uniform(0, 10_000, n_rows).round(2),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "func",
+    [
+        preprocess.create_new_mandant_level_rows,
+        preprocess.create_new_sector_level_rows,
+        preprocess.create_new_overall_level_rows,
+    ],
+)
+def test_level_rows_sum_check_with_floats(data_product_level, func):
+    df_g = func(data_product_level)
+    assert df_g["value"].sum() == pytest.approx(data_product_level["value"].sum())
+    # Rows with a missing key are lost in the groupby
+    df_missing_key = data_product_level.astype({"kpi_id": float})
+    df_missing_key.loc[0, "kpi_id"] = np.nan
+    with pytest.raises(AssertionError, match="something went wrong"):
+        func(df_missing_key)
+
+
+@pytest.fixture(scope="module")
+def data_product_rows(raw_extract):
+    """The raw extract prepared up to the full expansion."""
+    df = preprocess.create_calculation_date_column(raw_extract.copy())
+    df = preprocess.trim_strings(df)
+    df = preprocess.get_rid_of_invalid_entries(df)
+    df = preprocess.prettify_kpi_names(df)
+    return preprocess.add_mandant_sector_level_columns(df)
+
+
+def test_reduce_dataframe_to_max_date_per_entity(data_product_rows):
+    max_dates = preprocess.create_max_date_dict(data_product_rows)
+    df_expanded = preprocess.expand_dataframe_fully(data_product_rows)
+    df = preprocess.reduce_dataframe_to_max_date_per_entity(df_expanded, max_dates)
+    assert (df["calculation_date"] <= df["product_name"].map(max_dates)).all()
+    # Only the defunct product loses rows (6 months for every kpi)
+    dropped = df_expanded.loc[df_expanded.index.difference(df.index)]
+    assert dropped["product_name"].nunique() == 1
+    assert len(dropped) == 6 * dropped["kpi_name"].nunique()
+
+
+def test_expand_dataframe_fully_with_max_dates(data_product_rows):
+    max_dates = preprocess.create_max_date_dict(data_product_rows)
+    expected = preprocess.reduce_dataframe_to_max_date_per_entity(
+        preprocess.expand_dataframe_fully(data_product_rows), max_dates
+    )
+    df = preprocess.expand_dataframe_fully(data_product_rows, max_dates)
+    pd.testing.assert_frame_equal(df, expected.reset_index(drop=True))
+
+
+def test_expand_dataframe_fully(data_product_rows):
+    df = preprocess.expand_dataframe_fully(data_product_rows)
+    n_series = data_product_rows.groupby(["product_name", "kpi_name"]).ngroups
+    assert len(df) == 37 * n_series
+    assert df.groupby(["product_name", "kpi_name"]).size().eq(37).all()
+    assert df["value"].isna().sum() == len(df) - len(data_product_rows)
+    keys = ["calculation_date", "product_name", "kpi_name"]
+    loaded = df.dropna(subset=["value"]).set_index(keys)["value"].sort_index()
+    expected = data_product_rows.set_index(keys)["value"].sort_index()
+    pd.testing.assert_series_equal(loaded, expected)
+    assert list(df.columns) == list(data_product_rows.columns.drop("value")) + ["value"]
+
+
+def test_expand_dataframe_fully_missing_cardprofile(data_product_rows):
+    df = data_product_rows.copy()
+    df.loc[df["product_name"] == df["product_name"].iloc[0], "cardprofile"] = None
+    df_expanded = preprocess.expand_dataframe_fully(df)
+    assert len(df_expanded) == len(preprocess.expand_dataframe_fully(data_product_rows))
+    assert df_expanded["cardprofile"].isna().sum() % 37 == 0
+
+
+def test_expand_dataframe_fully_raises(data_product_rows):
+    with pytest.raises(AssertionError, match="did not load 25 months"):
+        preprocess.expand_dataframe_fully(data_product_rows, n_months=25)
+    df_duplicated = pd.concat([data_product_rows, data_product_rows.iloc[:1]])
+    with pytest.raises(AssertionError, match="duplicated rows"):
+        preprocess.expand_dataframe_fully(df_duplicated)
+
+
+@pytest.fixture(scope="module")
+def data_expanded(data_product_rows):
+    max_dates = preprocess.create_max_date_dict(data_product_rows)
+    return preprocess.expand_dataframe_fully(data_product_rows, max_dates)
+
+
+def test_create_level_rows(data_expanded):
+    df_levels = preprocess.create_level_rows(data_expanded)
+    assert [df_g["level"].unique().tolist() for df_g in df_levels] == [[2], [1], [0]]
+    # Summed up from the level before or from the products is the same
+    for df_g, create_from_products in zip(
+        df_levels,
+        [
+            preprocess.create_new_mandant_level_rows,
+            preprocess.create_new_sector_level_rows,
+            preprocess.create_new_overall_level_rows,
+        ],
+    ):
+        pd.testing.assert_frame_equal(df_g, create_from_products(data_expanded))
+    df_overall = df_levels[-1]
+    assert (df_overall["product_name"] == "BCAG - Total").all()
+    assert df_overall.groupby(["calculation_date", "kpi_name"]).size().eq(1).all()
+
+
+def test_create_level_rows_cardprofile_level(data_expanded):
+    hierarchy = [
+        {
+            "level": 2,
+            "group_by": ["mandant", "sector", "cardprofile"],
+            "entity": {"product_name": "{mandant} {cardprofile} - Total"},
+        }
+    ] + preprocess.data_dicts.ENTITY_HIERARCHY
+    df_levels = preprocess.create_level_rows(data_expanded, hierarchy)
+    df_profiles = df_levels[0]
+    assert df_profiles["product_name"].str.match(r".+ (CC|PP|CCL) - Total").all()
+    pd.testing.assert_frame_equal(
+        df_levels[-1], preprocess.create_level_rows(data_expanded)[-1]
+    )
+
+
+def test_create_level_rows_raises_for_invalid_hierarchy(data_expanded):
+    hierarchy = list(reversed(preprocess.data_dicts.ENTITY_HIERARCHY))
+    with pytest.raises(ValueError, match="not possible from the level before"):
+        preprocess.create_level_rows(data_expanded, hierarchy)
+
+
+def test_add_avg_value_column(data_expanded):
+    df_all = preprocess.concatenate_all_levels(
+        data_expanded, *preprocess.create_level_rows(data_expanded)
+    )
+    # One product-date without active accounts
+    no_active = (df_all["product_name"] == "BCAG - Total") & (
+        df_all["calculation_date"] == df_all["calculation_date"].max()
+    )
+    df_all = df_all.loc[
+        ~(no_active & (df_all["kpi_name"] == "Anzahl aktive Konten Total"))
+    ]
+    df = preprocess.add_avg_value_column(df_all)
+    pd.testing.assert_frame_equal(df.drop(columns="value_avg"), df_all)
+    assert df.loc[no_active, "value_avg"].isna().all()
+
+    active = df.loc[df["kpi_name"] == "Anzahl aktive Konten Total"]
+    active = active.set_index(["calculation_date", "product_name"])["value"]
+    row = df.loc[~no_active & df["value"].notna()].iloc[100]
+    n_active = active[(row["calculation_date"], row["product_name"])]
+    assert row["value_avg"] == pytest.approx((row["value"] + 0.001) / n_active)
+
+
+def test_create_calculation_date_column(raw_extract):
+    df = preprocess.create_calculation_date_column(raw_extract)
+    assert "period_value" in raw_extract.columns
+    assert df.columns[0] == "calculation_date"
+    assert df["calculation_date"].dt.is_month_end.all()
+    pd.testing.assert_series_equal(
+        df["calculation_date"].dt.strftime("%Y%m").astype(int),
+        raw_extract["period_value"],
+        check_names=False,
+    )
+
+
+def test_trim_strings():
+    df = pd.DataFrame(
+        {
+            "product_name": ["Simply ", " Liberty CC  ", "Simply"],
+            "cardprofile": ["CC ", None, "PP"],
+            "value": [1.0, np.nan, 3.0],
+        }
+    )
+    expected = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    pd.testing.assert_frame_equal(preprocess.trim_strings(df), expected)
+
+
+def test_trim_strings_non_string_object_columns():
+    df = pd.DataFrame(
+        {
+            "product_name": ["Simply ", "Liberty CC"],
+            "value": [Decimal("1.50"), None],
+            "mixed": [" CC ", 3],
+        }
+    )
+    expected = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    pd.testing.assert_frame_equal(preprocess.trim_strings(df), expected)
+    assert preprocess.trim_strings(df)["value"].iloc[0] == Decimal("1.50")
+
+
+def test_add_mandant_sector_level_columns_unknown_products(data_product_rows):
+    df = data_product_rows.drop(columns=["mandant", "sector", "level"])
+    df.loc[df.index[:3], "product_name"] = ["Unknown A", "Unknown B", "Unknown A"]
+    with pytest.raises(KeyError, match=r"\['Unknown A', 'Unknown B'\]"):
+        preprocess.add_mandant_sector_level_columns(df)
+
+
+@pytest.mark.parametrize(
+    "restatement_months, expected",
+    [(0, "2021-01-31"), (1, "2020-12-31"), (3, "2020-10-31")],
+)
+def test_return_first_new_date(restatement_months, expected):
+    df_previous = pd.DataFrame({"calculation_date": pd.to_datetime(["2020-12-31"])})
+    first_new_date = preprocess.return_first_new_date(df_previous, restatement_months)
+    assert first_new_date == pd.Timestamp(expected)
+
+
+@pytest.fixture(scope="module")
+def extract_38_months():
+    """Cleaned rows of 38 months, one more than the dataset holds."""
+    df = mock_dataset.create_raw_extract(
+        n_products=8, n_months=38, end_date="2021-01-31"
+    )
+    return preprocess.clean_extracted_rows(df)
+
+
+@pytest.mark.parametrize("restatement_months", [0, 2])
+@pytest.mark.parametrize("new_product", [False, True])
+@pytest.mark.parametrize("shuffle_previous", [False, True])
+def test_incremental_update_equals_full_rebuild(
+    extract_38_months, restatement_months, new_product, shuffle_previous, caplog
+):
+    df_db = extract_38_months
+    if new_product:
+        # A product that appears in the new month only, all months change
+        df_new_product = df_db.loc[df_db["calculation_date"] == "2021-01-31"].copy()
+        df_new_product = df_new_product.drop_duplicates("kpi_name")
+        df_new_product["product_name"] = "VISA Bonuscard Gold"
+        df_db = pd.concat([df_db, df_new_product], ignore_index=True)
+    months = np.sort(df_db["calculation_date"].unique())
+
+    # Previous run on the first 37 months
+    df_rows_previous = df_db.loc[df_db["calculation_date"] <= months[-2]]
+    df_previous = preprocess.build_dataset(df_rows_previous)
+    if shuffle_previous:
+        # (The order of the rows in the previous file does not matter)
+        df_previous = df_previous.sample(frac=1, random_state=0)
+
+    first_new_date = preprocess.return_first_new_date(df_previous, restatement_months)
+    df_rows_new = df_db.loc[df_db["calculation_date"] >= first_new_date]
+    df_rows = preprocess.update_extracted_rows(df_rows_previous, df_rows_new)
+    df = preprocess.build_dataset(df_rows, df_previous, first_new_date)
+    assert ("Product level rows have changed" in caplog.text) == new_product
+
+    expected = preprocess.build_dataset(
+        df_db.loc[df_db["calculation_date"] > months[0]]
+    )
+    assert df["calculation_date"].min() == months[1]
+    pd.testing.assert_frame_equal(
+        df.reset_index(drop=True), expected.reset_index(drop=True), check_exact=True
+    )
+
+
+@pytest.fixture(scope="module")
+def raw_extract_with_gaps(raw_extract):
+    """Missing values for one product and for all products of one kpi and
+    month (the sums of the higher levels are 0 then).
+    """
+    is_missing = (raw_extract["period_value"].between(201901, 201903)) & (
+        raw_extract["product_name"] == raw_extract["product_name"].iloc[0]
+    )
+    is_missing |= (raw_extract["period_value"] == 202002) & (raw_extract["kpi_id"] == 1)
+    return raw_extract.loc[~is_missing].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("value_decimals", [None, 2])
+def test_level_rows_aggregated_in_db(
+    raw_extract_with_gaps, value_decimals, monkeypatch
+):
+    pytest.importorskip("duckdb")
+    monkeypatch.setattr(preprocess, "VALUE_DECIMALS", value_decimals)
+    connection, query = mock_dataset.create_duckdb_level_source(
+        raw_extract_with_gaps, LEVEL_QUERY_PATH
+    )
+    df_levels = connection.execute(query).df()
+    df_rows = raw_extract_with_gaps.copy()
+    if value_decimals is not None:
+        # (Like `create_df` with `value_decimals`)
+        df_levels["value"] = np.round(df_levels["value"] * 10 ** value_decimals)
+        df_rows["value"] = np.round(df_rows["value"] * 10 ** value_decimals)
+    df = preprocess.build_dataset_from_level_rows(
+        preprocess.clean_extracted_level_rows(df_levels)
+    )
+
+    expected = preprocess.build_dataset(preprocess.clean_extracted_rows(df_rows))
+    assert (expected["value"] == 0).any()
+    # The sums of the floats in the DB are in another order (but exact for
+    # the fixed-point values)
+    pd.testing.assert_frame_equal(
+        df.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_exact=value_decimals is not None,
+        rtol=1e-12,
+    )
+
+
+def test_level_rows_aggregated_in_db_keep_null_cardprofile(raw_extract):
+    pytest.importorskip("duckdb")
+    df_raw = raw_extract.astype({"cardprofile": object})
+    df_raw.loc[df_raw.index[:3], "cardprofile"] = None
+    connection, query = mock_dataset.create_duckdb_level_source(
+        df_raw, LEVEL_QUERY_PATH
+    )
+    df_levels = connection.execute(query).df()
+    is_null = (df_levels["level"] == 3) & df_levels["cardprofile"].isna()
+    assert df_levels.loc[is_null, "value"].notna().sum() == 3
+    totals = df_levels.loc[df_levels["level"] == 0].groupby("period_value")["value"]
+    expected = df_raw.groupby("period_value")["value"].sum()
+    np.testing.assert_allclose(totals.sum().sort_index(), expected.sort_index())
+    with pytest.raises(AssertionError, match="NaN values"):
+        preprocess.clean_extracted_level_rows(df_levels)
+
+
+def test_clean_extracted_level_rows_raises(raw_extract):
+    pytest.importorskip("duckdb")
+    df_raw = raw_extract.copy()
+    df_raw.loc[df_raw.index[:3], "product_name"] = ["Unknown A", "Unknown B", "Unknown"]
+    connection, query = mock_dataset.create_duckdb_level_source(
+        df_raw, LEVEL_QUERY_PATH
+    )
+    df_levels = connection.execute(query).df()
+    with pytest.raises(KeyError, match=r"\['Unknown', 'Unknown A', 'Unknown B'\]"):
+        preprocess.clean_extracted_level_rows(df_levels)
+    hierarchy = [level for level in data_dicts.ENTITY_HIERARCHY if level["level"] != 1]
+    with pytest.raises(ValueError, match="same as in the hierarchy"):
+        preprocess.clean_extracted_level_rows(df_levels, hierarchy)
@@ -0,0 +1,112 @@
+import pandas as pd
+import pytest
+
+from src import cube  # noqa
+from src import helpers  # noqa
+from src import query  # noqa
+from .test_cube import MATERIALIZED_COLS
+
+ACTUAL_DATE = "2020-10-31"
+
+
+@pytest.fixture(scope="module", params=[True, False], ids=["materialized", "computed"])
+def kpi_cube(request, data_loaded):
+    if request.param:
+        return cube.KpiCube.from_frame(data_loaded)
+    return cube.KpiCube.from_frame(data_loaded.drop(columns=MATERIALIZED_COLS))
+
+
+def _eager_chain(
+    kpi_cube, result_dim, avg_bool, mandant_group, kpi_group, entities, kpis
+):
+    """The helpers calls like in the app before the lazy query."""
+    df = helpers.create_df_with_actual_period_from_cube(
+        kpi_cube, ACTUAL_DATE, 2, result_dim, avg_bool
+    )
+    df = helpers.filter_for_sidebar_selections_mandant(df, mandant_group)
+    df = helpers.filter_for_sidebar_selections_kpi(df, kpi_group)
+    return helpers.filter_for_entity_and_kpi(df, entities, kpis)
+
+
+@pytest.mark.parametrize(
+    "result_dim, avg_bool, mandant_group, kpi_group, entities, kpis",
+    [
+        ("Monat", False, "[alle]", "[alle]", ["[alle]"], ["[alle]"]),
+        ("Monat", True, "B2C", "Umsatz", ["[alle]"], ["[alle]"]),
+        ("Year To Date", False, "Bonus Card", "[alle] ohne NCA", ["[alle]"], ["[alle]"]),
+        (
+            "3 Monate rollierend",
+            False,
+            "BCAG",
+            "[alle]",
+            ["BCAG - Total", "B2C - Total"],
+            ["Umsatz Total", "NCAs: Anzahl Antraege Total"],
+        ),
+        ("12 Monate rollierend", False, "B2C", "Anzahl Konten", ["[alle]"], ["[alle]"]),
+    ],
+)
+def test_execute_equals_eager_chain(
+    kpi_cube, result_dim, avg_bool, mandant_group, kpi_group, entities, kpis
+):
+    expected = _eager_chain(
+        kpi_cube, result_dim, avg_bool, mandant_group, kpi_group, entities, kpis
+    )
+    view_query = (
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim(result_dim, avg_bool)
+        .diff(12)
+        .filter_mandant(mandant_group)
+        .filter_kpi_group(kpi_group)
+        .filter_entity_and_kpi(entities, kpis)
+    )
+    result = view_query.execute(kpi_cube)
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_plan(kpi_cube):
+    view_query = (
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(2)
+        .result_dim("3 Monate rollierend")
+        .diff(12)
+        .filter_mandant("B2C")
+    )
+    if "diff_value_3m" in kpi_cube.measures:
+        expected = ["lookup", "month_slice", "select"]
+    else:
+        expected = ["truncate", "select", "result_dim", "diff", "month_slice"]
+    assert view_query.plan(kpi_cube) == expected
+
+
+def test_short_truncate_is_not_looked_up(kpi_cube, data_loaded):
+    # (The 12 month lag of the diff reaches before the truncated history)
+    view_query = (
+        query.ViewQuery(ACTUAL_DATE)
+        .truncate(1)
+        .result_dim("12 Monate rollierend")
+        .diff(12)
+        .filter_mandant("B2C")
+    )
+    assert view_query.plan(kpi_cube)[0] == "truncate"
+    computed_cube = cube.KpiCube.from_frame(data_loaded.drop(columns=MATERIALIZED_COLS))
+    df = helpers.create_df_with_actual_period_from_cube(
+        computed_cube, ACTUAL_DATE, 1, "12 Monate rollierend", False
+    )
+    expected = helpers.filter_for_sidebar_selections_mandant(df, "B2C")
+    assert expected["diff_value"].isna().any()
+    pd.testing.assert_frame_equal(view_query.execute(kpi_cube), expected)
+    pd.testing.assert_frame_equal(
+        helpers.create_df_with_actual_period_from_cube(
+            kpi_cube, ACTUAL_DATE, 1, "12 Monate rollierend", False
+        ),
+        df,
+    )
+
+
+def test_query_is_immutable():
+    base = query.ViewQuery(ACTUAL_DATE).truncate(2)
+    filtered = base.filter_mandant("B2C")
+    assert len(base.steps) == 1
+    assert len(filtered.steps) == 2
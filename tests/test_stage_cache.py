@@ -0,0 +1,111 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import stage_cache  # noqa
+
+
+@pytest.fixture
+def cache():
+    return stage_cache.StageCache(max_entries=4)
+
+
+def test_run_memoizes_on_upstream_and_params(cache):
+    calls = []
+
+    def add(x, y):
+        calls.append((x, y))
+        return x + y
+
+    source = cache.run("source", lambda: 1)
+    first = cache.run("add", add, source, 2)
+    assert first.value == 3
+    assert cache.run("add", add, source, 2) == first
+    assert cache.run("add", add, source, 5).value == 6
+    assert calls == [(1, 2), (1, 5)]
+    assert cache.stats() == {
+        "add": {"hits": 1, "misses": 2},
+        "source": {"hits": 0, "misses": 1},
+    }
+
+
+def test_only_downstream_stages_are_recomputed(cache):
+    def chain(first_param, last_param):
+        a = cache.run("a", lambda p: [p], first_param)
+        b = cache.run("b", lambda x: x + ["b"], a)
+        return cache.run("c", lambda x, p: x + [p], b, last_param)
+
+    chain(1, "x")
+    assert chain(1, "y").value == [1, "b", "y"]
+    assert cache.stats()["a"] == {"hits": 1, "misses": 1}
+    assert cache.stats()["b"] == {"hits": 1, "misses": 1}
+    assert cache.stats()["c"] == {"hits": 0, "misses": 2}
+    # A change upstream is a new key for all stages after it
+    chain(2, "y")
+    assert cache.stats()["c"] == {"hits": 0, "misses": 3}
+
+
+def test_list_params_and_eviction(cache):
+    cache.run("filter", lambda values: list(values), ["a", "b"])
+    assert cache.run("filter", lambda values: None, ["a", "b"]).value == ["a", "b"]
+    for i in range(4):
+        cache.run("other", lambda i: i, i)
+    cache.run("filter", lambda values: list(values), ["a", "b"])
+    assert cache.stats()["filter"] == {"hits": 1, "misses": 2}
+    cache.clear()
+    assert cache.stats() == {}
+
+
+def test_concurrent_requests_are_calculated_once(cache):
+    calls = []
+
+    def slow_frame(x):
+        calls.append(x)
+        time.sleep(0.05)
+        return pd.DataFrame({"x": [x]})
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.run("view", slow_frame, 1))
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert all(result.value is results[0].value for result in results)
+    assert cache.stats()["view"] == {"hits": 3, "misses": 1}
+
+
+def test_failed_calculation_is_not_cached(cache):
+    def fail():
+        raise ValueError("Uups")
+
+    with pytest.raises(ValueError):
+        cache.run("view", fail)
+    assert cache.run("view", lambda: 1).value == 1
+
+
+def test_results_are_dropped_over_the_byte_budget():
+    cache = stage_cache.StageCache(max_bytes=2000)
+    source = cache.source("data", lambda version: np.zeros(1000), "v1")
+    for i in range(3):
+        cache.run("scale", lambda arr, i: arr[:100] * i, source, i)
+    summary = cache.summary()
+    # Only the last two arrays of 800 bytes fit, the base array is not held
+    assert summary["entries"] == 2
+    assert summary["evictions"] == 1
+    assert summary["bytes_held"] == 1600
+    assert summary["hit_ratio"] == 0.0
+    cache.run("scale", lambda arr, i: arr[:100] * i, source, 2)
+    assert cache.summary()["hit_ratio"] == 0.25
+    cache.run("big", lambda arr: arr.copy(), source)
+    assert cache.summary()["evictions"] == 1
+    assert cache.summary()["rejected"] == 1
+    assert cache.summary()["entries"] == 2
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from src import view_cache  # noqa
+
+
+@pytest.fixture
+def df_view():
+    return pd.DataFrame(
+        {
+            "kpi_name": pd.Categorical(["Umsatz Total", "Nr. TRX Total"]),
+            "calculation_date": pd.to_datetime(["2020-10-31", "2020-10-31"]),
+            "level": pd.Series([0, 3], dtype="int8"),
+            "value": [1.5, None],
+        },
+        index=[17, 4],
+    )
+
+
+def test_put_and_get_after_restart(tmp_path, df_view):
+    cache = view_cache.DiskViewCache(tmp_path)
+    assert cache.get("abc", "view", ("2020-10-31", 2)) is None
+    cache.put("abc", "view", ("2020-10-31", 2), df_view)
+    # (A new instance reads the index file)
+    cache = view_cache.DiskViewCache(tmp_path)
+    pd.testing.assert_frame_equal(cache.get("abc", "view", ("2020-10-31", 2)), df_view)
+    assert cache.get("abc", "view", ("2020-10-31", 3)) is None
+    assert cache.get("def", "view", ("2020-10-31", 2)) is None
+
+
+def test_load_or_run(tmp_path, df_view):
+    cache = view_cache.DiskViewCache(tmp_path)
+    calls = []
+
+    def run(df):
+        calls.append(1)
+        return df
+
+    for _ in range(2):
+        result = cache.load_or_run("abc", "view", (1,), run, df_view)
+        pd.testing.assert_frame_equal(result, df_view)
+    assert calls == [1]
+
+
+def test_prune_removes_other_datasets(tmp_path, df_view):
+    cache = view_cache.DiskViewCache(tmp_path)
+    cache.put("old", "view", (1,), df_view)
+    cache.put("new", "view", (1,), df_view)
+    cache.prune("new")
+    assert cache.get("old", "view", (1,)) is None
+    assert cache.get("new", "view", (1,)) is not None
+    assert len(list(tmp_path.glob("*.parquet"))) == 1
+    cache.clear()
+    assert list(tmp_path.glob("*.parquet")) == []
+
+
+def test_least_recently_used_are_removed_over_budget(tmp_path, df_view):
+    cache = view_cache.DiskViewCache(tmp_path)
+    cache.put("abc", "view", (1,), df_view)
+    cache.max_bytes = int(cache.nbytes * 2.5)
+    cache.put("abc", "view", (2,), df_view)
+    cache.get("abc", "view", (1,))
+    cache.put("abc", "view", (3,), df_view)
+    assert cache.get("abc", "view", (2,)) is None
+    assert cache.get("abc", "view", (1,)) is not None
+    assert cache.get("abc", "view", (3,)) is not None
+    assert len(list(tmp_path.glob("*.parquet"))) == 2
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from src import backends  # noqa
+from src import data_dicts  # noqa
+from src import warm_up  # noqa
+
+
+@pytest.fixture
+def data_path(data_loaded, tmp_path, monkeypatch):
+    # (Spawned workers need a main script for `st.cache`, pytest has none)
+    monkeypatch.setattr(warm_up, "WARM_UP_START_METHOD", "fork")
+    data_loaded.to_parquet(tmp_path / "preprocessed_results.parquet", index=False)
+    return str(tmp_path / "preprocessed_results.parquet")
+
+
+def test_enumerate_views(data_path):
+    backend = backends.CubeBackend(data_path)
+    views = warm_up.enumerate_views(backend, n_dates=2)
+    n_mandant_groups = len(backend.mandant_options(backend.max_date()))
+    n_views_per_date = (
+        len(data_dicts.RESULT_DIM_DICT) * n_mandant_groups * len(data_dicts.KPI_GROUPS)
+    )
+    assert len(views) == 2 * n_views_per_date
+    assert len({(view.actual_date, view.steps) for view in views}) == len(views)
+    # The default view of the app comes first
+    assert views[0].actual_date == backend.max_date()
+    assert views[0].steps[1:] == (
+        ("result_dim", ("Monat", False)),
+        ("diff", (12,)),
+        ("filter_mandant", ("[alle]",)),
+        ("filter_kpi_group", (list(data_dicts.KPI_GROUPS)[0],)),
+    )
+
+
+def test_warm_up_materializes_views(data_path):
+    report = warm_up.warm_up(data_path, "cube", max_workers=2, n_dates=1)
+    assert report.n_materialized == report.n_views > 0
+    assert report.n_skipped == report.n_cached == 0
+
+    # The app finds the views in the view cache on disk
+    backend = backends.CubeBackend(data_path)
+    view_query = warm_up.enumerate_views(backend, n_dates=1)[-1]
+    pd.testing.assert_frame_equal(
+        backend.execute(view_query), backend._run_query(view_query)
+    )
+    report = warm_up.warm_up(data_path, "cube", max_workers=2, n_dates=1)
+    assert report.n_cached == report.n_views
+    assert report.n_materialized == 0
+
+
+@pytest.mark.parametrize("budget", [{"max_seconds": 0}, {"max_bytes": 0}])
+def test_warm_up_stops_at_budget(data_path, budget):
+    report = warm_up.warm_up(data_path, "cube", max_workers=1, n_dates=1, **budget)
+    assert report.n_materialized == 0
+    assert report.n_skipped == report.n_views
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_warm_up_submits_no_views_after_budget(data_path, max_workers):
+    # (The first views are computed, then the memory budget is exceeded)
+    report = warm_up.warm_up(
+        data_path, "cube", max_bytes=1, max_workers=max_workers, n_dates=1
+    )
+    assert report.n_materialized == max_workers
+    assert report.n_skipped == report.n_views - max_workers